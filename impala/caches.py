@@ -0,0 +1,44 @@
+"""
+Cache settings read from environment variables.
+
+CACHE_BACKEND    locmem (default), file, redis or dummy
+CACHE_LOCATION   Directory for file, server url for redis, eg redis://localhost:6379/1
+CACHE_TIMEOUT    Seconds entries are kept for by default
+
+locmem stands in for redis during development, each process gets its own cache. A change made in one
+process can't expire what another process cached, so pages are only cached per user with file or redis.
+"""
+import os
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+    'dummy': 'django.core.cache.backends.dummy.DummyCache',
+}
+
+# Backends whose entries are seen by every process using the same location
+SHARED_BACKENDS = {BACKENDS['file'], BACKENDS['redis']}
+
+""" Check whether every process sees the same entries in a cache, given its settings"""
+def is_shared(cache):
+    return cache['BACKEND'] in SHARED_BACKENDS
+
+""" Build the settings of the default cache"""
+def cache_settings(base_dir, environ=os.environ):
+    backend = environ.get('CACHE_BACKEND', 'locmem')
+    if backend not in BACKENDS:
+        raise ValueError(f'CACHE_BACKEND must be one of {", ".join(BACKENDS)}, not {backend!r}')
+
+    default_locations = {
+        'locmem': 'impala',
+        'file': str(base_dir / 'cache'),
+        'redis': 'redis://localhost:6379/1',
+        'dummy': '',
+    }
+    return {
+        'BACKEND': BACKENDS[backend],
+        'LOCATION': environ.get('CACHE_LOCATION', default_locations[backend]),
+        'TIMEOUT': int(environ.get('CACHE_TIMEOUT', 300)),
+        'KEY_PREFIX': 'impala',
+    }
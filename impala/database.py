@@ -0,0 +1,73 @@
+"""
+Database settings read from environment variables, so production can use PostgreSQL
+with persistent connections while development keeps using SQLite without any setup.
+
+DATABASE_ENGINE               sqlite (default) or postgresql
+DATABASE_NAME                 File name for SQLite, database name for PostgreSQL
+DATABASE_USER                 PostgreSQL only
+DATABASE_PASSWORD             PostgreSQL only
+DATABASE_HOST                 PostgreSQL only
+DATABASE_PORT                 PostgreSQL only
+DATABASE_CONN_MAX_AGE         Seconds to keep a connection open between requests, 0 closes it after each request
+DATABASE_CONN_HEALTH_CHECKS   Check persistent connections still work before reusing them (on by default)
+SQLITE_BUSY_TIMEOUT           Milliseconds to wait for another connection's write lock before failing
+SQLITE_MMAP_SIZE              Bytes of the database file SQLite may memory map
+"""
+import os
+
+ENGINES = {
+    'sqlite': 'django.db.backends.sqlite3',
+    'postgresql': 'django.db.backends.postgresql',
+}
+
+""" Read a boolean environment variable"""
+def env_flag(environ, name, default):
+    value = environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+""" Build the settings of the default database"""
+def database_settings(base_dir, environ=os.environ):
+    engine = environ.get('DATABASE_ENGINE', 'sqlite')
+    if engine not in ENGINES:
+        raise ValueError(f'DATABASE_ENGINE must be one of {", ".join(ENGINES)}, not {engine!r}')
+
+    if engine == 'sqlite':
+        return {
+            'ENGINE': ENGINES[engine],
+            'NAME': environ.get('DATABASE_NAME', base_dir / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(environ.get('DATABASE_CONN_MAX_AGE', 0)),
+            'CONN_HEALTH_CHECKS': env_flag(environ, 'DATABASE_CONN_HEALTH_CHECKS', True),
+            'OPTIONS': {
+                # Seconds Python's sqlite3 module waits for a lock, kept in line with the busy timeout pragma
+                'timeout': int(environ.get('SQLITE_BUSY_TIMEOUT', 5000)) / 1000,
+            },
+        }
+
+    return {
+        'ENGINE': ENGINES[engine],
+        'NAME': environ.get('DATABASE_NAME', 'impala'),
+        'USER': environ.get('DATABASE_USER', ''),
+        'PASSWORD': environ.get('DATABASE_PASSWORD', ''),
+        'HOST': environ.get('DATABASE_HOST', ''),
+        'PORT': environ.get('DATABASE_PORT', ''),
+        # Reuse connections between requests instead of connecting for every request
+        'CONN_MAX_AGE': int(environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': env_flag(environ, 'DATABASE_CONN_HEALTH_CHECKS', True),
+    }
+
+"""
+Get the pragmas run on every new SQLite connection
+
+WAL lets pages read while a booking or payment is being written, and only syncing at checkpoints
+is still safe in WAL mode. The busy timeout makes writers wait for each other instead of
+failing straight away with "database is locked".
+"""
+def sqlite_pragmas(environ=os.environ):
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(environ.get('SQLITE_BUSY_TIMEOUT', 5000)),
+        'mmap_size': int(environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    }
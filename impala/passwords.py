@@ -0,0 +1,50 @@
+"""
+Password hashers chosen with the PASSWORD_HASHER environment variable.
+
+PASSWORD_HASHER   argon2, bcrypt, pbkdf2 or fast
+
+New passwords are hashed with the chosen hasher. The others stay in the list so existing
+passwords can still be checked, and Django rehashes them with the chosen hasher the next
+time their user logs in.
+
+pbkdf2 is used by default, it needs the least CPU per log in of the secure hashers.
+argon2 needs argon2-cffi installed and bcrypt needs bcrypt installed, both are in requirements.txt.
+fast hashes with a single round of MD5, it is only meant for tests and throwaway development data.
+"""
+import os
+from importlib.util import find_spec
+
+HASHERS = {
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'bcrypt': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'fast': 'django.contrib.auth.hashers.MD5PasswordHasher',
+}
+
+# The library each hasher needs, if any
+LIBRARIES = {
+    'argon2': 'argon2',
+    'bcrypt': 'bcrypt',
+}
+
+# Hashers existing passwords may have been made with
+LEGACY_HASHERS = [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+""" Check whether the library a hasher needs is installed"""
+def available(name):
+    return name not in LIBRARIES or find_spec(LIBRARIES[name]) is not None
+
+""" Get PASSWORD_HASHERS, starting with the chosen hasher"""
+def password_hashers(environ=os.environ, testing=False):
+    chosen = environ.get('PASSWORD_HASHER', 'fast' if testing else 'pbkdf2')
+    if chosen not in HASHERS:
+        raise ValueError(f'PASSWORD_HASHER must be one of {", ".join(HASHERS)}, not {chosen!r}')
+    if not available(chosen):
+        raise ValueError(f'PASSWORD_HASHER {chosen} needs the {LIBRARIES[chosen]} package to be installed')
+
+    # MD5 is only in the list when it is chosen, so MD5 hashes are never accepted in production
+    others = [name for name in ['argon2', 'bcrypt', 'pbkdf2'] if name != chosen and available(name)]
+    return [HASHERS[chosen]] + [HASHERS[name] for name in others] + LEGACY_HASHERS
@@ -11,6 +11,9 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 from pathlib import Path
+from impala.database import database_settings, sqlite_pragmas
+from impala.caches import cache_settings, is_shared
+from impala.passwords import password_hashers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,6 +49,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'lessons.middleware.CachedUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,14 +77,38 @@ WSGI_APPLICATION = 'impala.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
+# Configured with environment variables, see impala/database.py
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_settings(BASE_DIR),
 }
 
+# Run on every new SQLite connection by lessons.signals
+SQLITE_PRAGMAS = sqlite_pragmas()
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+# Configured with environment variables, see impala/caches.py
+
+CACHES = {
+    'default': cache_settings(BASE_DIR),
+}
+
+# Pages are only cached per user when the web processes and the worker share the cache,
+# otherwise a change made in one process would leave the others showing the old page
+VIEW_CACHE = is_shared(CACHES['default'])
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/4.1/topics/auth/passwords/
+# Configured with an environment variable, see impala/passwords.py
+
+PASSWORD_HASHERS = password_hashers()
+
+# Picks a fast hasher for the tests, see impala/test_runner.py
+TEST_RUNNER = 'impala.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
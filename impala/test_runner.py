@@ -0,0 +1,20 @@
+"""
+Runs the tests, see TEST_RUNNER in impala/settings.py.
+
+The tests log users in constantly, so they hash passwords with the fast hasher unless PASSWORD_HASHER
+chooses another one. The fixture passwords are PBKDF2 hashes, which every choice of hasher can check.
+"""
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from impala.passwords import password_hashers
+
+class TestRunner(DiscoverRunner):
+    """ The default test runner, with the password hashers chosen for tests"""
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_hashers = override_settings(PASSWORD_HASHERS=password_hashers(testing=True))
+        self.test_hashers.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_hashers.disable()
+        super().teardown_test_environment(**kwargs)
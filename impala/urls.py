@@ -39,6 +39,9 @@ urlpatterns = [
     #Pages for teachers
     path('schedule/', views.schedule , name='schedule',kwargs={'year':datetime.today().year, 'month': datetime.today().month}),
     path('schedule/<int:year>/<int:month>/', views.schedule , name='schedule_custom'),
+    path('calendar/<str:token>/lessons.ics', views.calendar_feed, name='calendar_feed'),
+    path('calendar/reset/', views.reset_calendar_feed, name='reset_calendar_feed'),
+    path('availability/', views.availability, name='availability'),
 
     # Pages for admins
     path('manage_lessons/', views.manage_lessons, name='manage_lessons'),
@@ -46,12 +49,19 @@ urlpatterns = [
     path('book_lesson/new/', views.book_lesson, name='book_lesson_new', kwargs={'id': 'new', 'type':'new'}),
     path('book_lesson/user/<int:id>/', views.book_lesson, name='book_lesson_user', kwargs={'type': 'user'}),
     path('book_lesson/edit/<int:id>/', views.book_lesson, name='book_lesson_edit', kwargs={'type': 'edit'}),
+    path('match_requests/', views.match_requests, name='match_requests'),
+    path('free_teachers/', views.free_teachers, name='free_teachers'),
+    path('rollover_term/', views.rollover_term, name='rollover_term'),
     path('billing/', views.billing, name='billing'),
+    path('billing/export/invoices.csv', views.export_billing, name='export_invoices', kwargs={'kind': 'invoices'}),
+    path('billing/export/transfers.csv', views.export_billing, name='export_transfers', kwargs={'kind': 'transfers'}),
+    path('billing/export/balances.csv', views.export_billing, name='export_balances', kwargs={'kind': 'balances'}),
     path('terms/', views.terms, name='terms'),
     path('edit_term/<int:id>', views.edit_term, name='edit_term'),
 
     # Pages for super admins
     path('permissions/', views.permissions, name='permissions'),
+    path('permissions/bulk/', views.bulk_permissions, name='bulk_permissions'),
     path('user/<int:id>/', views.user, name='user'),
     path('user/create/', views.user, name='create_user', kwargs={'id': 'create'}),
 ]
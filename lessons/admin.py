@@ -1,5 +1,5 @@
 from django.contrib import admin
-from lessons.models import User, Request, Booking, Child
+from lessons.models import User, Request, Booking, Child, Job
 
 # Register your models here.
 @admin.register(User)
@@ -12,4 +12,13 @@ class UserAdmin(admin.ModelAdmin):
 
 admin.site.register(Request)
 admin.site.register(Booking)
-admin.site.register(Child)
\ No newline at end of file
+admin.site.register(Child)
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Configuration of the admin interface for queued jobs."""
+
+    list_display = [
+        'name', 'status', 'attempts', 'run_at', 'finished_at', 'dedup_key'
+    ]
+    list_filter = ['status', 'name']
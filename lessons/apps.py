@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LessonsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'lessons'
+
+    def ready(self):
+        # Register signal handlers and checks
+        from lessons import signals, checks
@@ -0,0 +1,384 @@
+"""
+Micro-benchmarks which can be run with:
+
+$ python3 manage.py benchmark <name>
+
+Each benchmark creates the data it needs inside a transaction which is rolled back afterwards.
+"""
+import json
+from collections import namedtuple
+from contextlib import redirect_stdout
+from io import StringIO
+from math import ceil
+from time import perf_counter
+from timeit import Timer
+from datetime import date, time
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from impala.passwords import HASHERS, available
+from lessons.forms import BookingForm
+from lessons.ical import feed_token
+from lessons.management.commands.seed import Command as SeedCommand
+from lessons.models import User, Term, Booking, Request, Invoice, Transfer
+from lessons.jobs import Worker, enqueue, refund_overpayment
+from lessons.month_calendar import render_month_rows
+from lessons.matching import propose_matches, book_matches
+from lessons.rollover import roll_over
+from lessons.bookings import book, book_all
+
+""" Time BookingForm validation for terms from a few weeks to a hundred years long"""
+def booking_form(stdout, options):
+    number = options['number']
+    client = User.objects.create_user('benchmark.client@example.org', first_name='Benchmark', last_name='Client', role=User.STUDENT)
+    teacher = User.objects.create_user('benchmark.teacher@example.org', first_name='Benchmark', last_name='Teacher', role=User.TEACHER)
+
+    # Start after any real terms so the benchmark terms don't overlap them
+    start = date(3000, 1, 6)
+    stdout.write(f'{"Term length":>12} {"Lessons":>8} {"Time per validation":>20}')
+    for days in [49, 365, 3650, 36500]:
+        term = Term.objects.create(name=f'Benchmark {days}', start_date=start, end_date=date.fromordinal(start.toordinal() + days))
+        start = date.fromordinal(term.end_date.toordinal() + 1)
+        data = {
+            'teacher': teacher.id,
+            'day_of_week': '0',
+            'time': time(16),
+            'duration': '60',
+            'days_between_lessons': '7',
+            'term': term.id,
+        }
+
+        def validate():
+            form = BookingForm(user=client, data=data)
+            form.instance.client = client
+            assert form.is_valid(), form.errors
+            return form.instance.lessons
+
+        lessons = validate()
+        seconds = min(Timer(validate).repeat(repeat=3, number=number)) / number
+        stdout.write(f'{days:>7} days {lessons:>8} {seconds * 1000:>17.3f} ms')
+
+""" Time rendering a month of the schedule for a teacher with a hundred weekly bookings"""
+def schedule(stdout, options):
+    number = options['number']
+    client = User.objects.create_user('benchmark.client@example.org', first_name='Benchmark', last_name='Client', role=User.STUDENT)
+    teacher = User.objects.create_user('benchmark.teacher@example.org', first_name='Benchmark', last_name='Teacher', role=User.TEACHER)
+    Booking.objects.bulk_create([
+        Booking(client=client, teacher=teacher, date=date(3000, 1, 1 + i % 7), end_date=date(3000, 12, 31),
+            lessons=52, days_between_lessons=7, duration=30, time=time(8 + i // 7 % 12, i % 4 * 15))
+        for i in range(100)
+    ])
+
+    lessons = {}
+    for lesson_date, booking in Booking.objects.filter(teacher=teacher).occurrences(date(3000, 3, 1), date(3000, 3, 31)):
+        lessons.setdefault(lesson_date, []).append(booking)
+
+    def render():
+        return render_month_rows(3000, 3, lessons)
+
+    seconds = min(Timer(render).repeat(repeat=3, number=number)) / number
+    stdout.write(f'{sum(map(len, lessons.values()))} lessons rendered in {seconds * 1000:.3f} ms')
+
+    site = Client()
+    site.force_login(teacher)
+    url = reverse('schedule_custom', args=[3000, 3])
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        seconds = min(Timer(lambda: site.get(url)).repeat(repeat=3, number=max(number // 10, 1))) / max(number // 10, 1)
+    stdout.write(f'Schedule page served in {seconds * 1000:.3f} ms')
+
+""" Measure how many logins per second one core can handle through the log in page with each password hasher"""
+def log_in(stdout, options):
+    number = max(options['number'] // 10, 1)
+    stdout.write(f'{"Hasher":<8} {"Logins/s":>9} {"Time per login":>15}')
+    for name in HASHERS:
+        if not available(name):
+            stdout.write(f'{name:<8} {"not installed":>9}')
+            continue
+
+        with override_settings(PASSWORD_HASHERS=[HASHERS[name]], ALLOWED_HOSTS=['testserver']):
+            email = f'benchmark.{name}@example.org'
+            User.objects.create_user(email, password='Password123', first_name='Benchmark', last_name='Student', role=User.STUDENT)
+            data = {'email': email, 'password': 'Password123'}
+
+            def log_in_once():
+                site = Client()
+                response = site.post(reverse('log_in'), data)
+                assert response.status_code == 302, 'Log in failed'
+
+            seconds = min(Timer(log_in_once).repeat(repeat=3, number=number)) / number
+        stdout.write(f'{name:<8} {1 / seconds:>9.1f} {seconds * 1000:>12.3f} ms')
+
+""" Time matching thousands of open requests with teachers for a term, and booking the matches"""
+def matching(stdout, options):
+    with redirect_stdout(StringIO()):
+        seeder = SeedCommand()
+        seeder.seed_at_scale(students=0, teachers=100, terms=2, batch_size=1000)
+        # About 1 in 4 students' requests are left open
+        seeder.seed_at_scale(students=options['students'], teachers=0, terms=0, batch_size=1000)
+    term = Term.objects.order_by('start_date').first()
+    requests = Request.objects.filter(fulfilled=False).count()
+
+    started = perf_counter()
+    proposal = propose_matches(term, term.start_date)
+    seconds = perf_counter() - started
+    stdout.write(f'Matched {len(proposal.matches)} of {requests} open requests in {seconds:.2f}s ({requests / seconds:.0f} requests/s)')
+
+    started = perf_counter()
+    bookings, skipped = book_matches([match.key for match in proposal.matches])
+    seconds = perf_counter() - started
+    stdout.write(f'Booked {len(bookings)} matches in {seconds:.2f}s, {len(skipped)} skipped')
+
+""" Time rolling the bookings of a term over into the next term"""
+def rollover(stdout, options):
+    with redirect_stdout(StringIO()):
+        seeder = SeedCommand()
+        seeder.seed_at_scale(students=0, teachers=100, terms=2, batch_size=1000)
+        # About half the students' bookings are in each term
+        seeder.seed_at_scale(students=options['students'], teachers=0, terms=0, batch_size=1000)
+    from_term, to_term = Term.objects.order_by('-start_date')[:2][::-1]
+    bookings = Booking.objects.between(from_term.start_date, from_term.end_date).count()
+
+    started = perf_counter()
+    booked, problems = roll_over(from_term, to_term)
+    seconds = perf_counter() - started
+    stdout.write(f'Rolled {len(booked)} of {bookings} bookings over in {seconds:.2f}s ({bookings / seconds:.0f} bookings/s), '
+        f'{len(problems)} clashed or were booked already')
+
+""" Time queuing refunds of overpaid invoices and running them with a worker"""
+def jobs(stdout, options):
+    number = options['number']
+    client = User.objects.create_user('benchmark.client@example.org', first_name='Benchmark', last_name='Client', role=User.STUDENT)
+    teacher = User.objects.create_user('benchmark.teacher@example.org', first_name='Benchmark', last_name='Teacher', role=User.TEACHER)
+    booking = Booking.objects.create(client=client, teacher=teacher, date=date(3000, 1, 6), time=time(16), lessons=1, days_between_lessons=7, duration=60)
+    invoices = Invoice.objects.bulk_create([
+        Invoice(booking=booking, invoice_ref=f'{client.id}-{i}', date=date(3000, 1, 1), due_by_date=date(3000, 1, 6), amount=20)
+        for i in range(number)
+    ])
+    Transfer.objects.bulk_create([Transfer(invoice=invoice, date=date(3000, 1, 1), amount=30, refund=False) for invoice in invoices])
+    Invoice.objects.filter(booking=booking).update_payment_summaries()
+
+    started = perf_counter()
+    for invoice in invoices:
+        enqueue(refund_overpayment, dedup_key=f'refund_overpayment:{invoice.id}', invoice_id=invoice.id)
+    seconds = perf_counter() - started
+    stdout.write(f'Queued {number} refunds in {seconds:.2f}s ({seconds / number * 1000:.3f} ms per job)')
+
+    worker = Worker()
+    started = perf_counter()
+    worker.run(until_empty=True)
+    seconds = perf_counter() - started
+    stdout.write(f'Ran {worker.done} jobs in {seconds:.2f}s ({worker.done / seconds:.0f} jobs/s), {worker.failed} failed')
+
+""" Time making bookings for requests one at a time, as the booking page does, and in bulk"""
+def booking(stdout, options):
+    number = options['number']
+    client = User.objects.create_user('benchmark.client@example.org', first_name='Benchmark', last_name='Client', role=User.STUDENT)
+    teacher = User.objects.create_user('benchmark.teacher@example.org', first_name='Benchmark', last_name='Teacher', role=User.TEACHER)
+    requests = Request.objects.bulk_create([
+        Request(client=client, availability='Any', lessons=1, days_between_lessons=7, duration=60, info='')
+        for _ in range(number)
+    ])
+
+    # A lesson a day with the same teacher, so every booking is checked against the teacher's other bookings
+    def new_booking(day):
+        return Booking(client=client, teacher=teacher, date=date.fromordinal(date(3000, 1, 6).toordinal() + day),
+            time=time(16), lessons=1, days_between_lessons=7, duration=60)
+
+    stdout.write(f'{"How":<10} {"Bookings/s":>10} {"Time per booking":>17} {"Queries per booking":>20}')
+    with CaptureQueriesContext(connection) as queries:
+        started = perf_counter()
+        for day, request in enumerate(requests):
+            book(new_booking(day), request)
+        seconds = perf_counter() - started
+    stdout.write(f'{"book":<10} {number / seconds:>10.0f} {seconds / number * 1000:>14.3f} ms {len(queries) / number:>20.2f}')
+
+    with CaptureQueriesContext(connection) as queries:
+        started = perf_counter()
+        book_all([new_booking(number + day) for day in range(number)])
+        seconds = perf_counter() - started
+    stdout.write(f'{"book_all":<10} {number / seconds:>10.0f} {seconds / number * 1000:>14.3f} ms {len(queries) / number:>20.2f}')
+
+# The most queries each page may make, however much data there is.
+# A page also fails if it makes more queries with more data.
+# The terms are never committed, so pages using the term calendar load it on every request.
+VIEW_QUERY_BUDGETS = {
+    'home': 0,
+    'sign_up': 0,
+    'log_in': 0,
+    'log_out': 4,
+    'lessons': 3,
+    'list_lessons': 6,
+    'children': 3,
+    'payments': 6,
+    'invoice': 6,
+    'edit_request': 6,
+    'view_booking': 6,
+    'schedule': 3,
+    'schedule_custom': 3,
+    'calendar_feed': 3,
+    'reset_calendar_feed': 3,
+    'availability': 4,
+    'manage_lessons': 8,
+    'book_lesson': 11,
+    'book_lesson_new': 3,
+    'book_lesson_user': 9,
+    'book_lesson_edit': 12,
+    'match_requests': 11,
+    'free_teachers': 7,
+    'rollover_term': 14,
+    'billing': 6,
+    'export_invoices': 3,
+    'export_transfers': 3,
+    'export_balances': 4,
+    'terms': 3,
+    'edit_term': 4,
+    'permissions': 3,
+    'bulk_permissions': 5,
+    'user': 4,
+    'create_user': 2,
+}
+
+""" Add students until there are at least the given number of bookings and a request still waiting to be booked"""
+def seed_bookings(seeder, bookings):
+    with redirect_stdout(StringIO()):
+        if not Term.objects.exists():
+            seeder.seed_at_scale(students=0, teachers=20, terms=6, batch_size=1000)
+        while Booking.objects.count() < bookings or not Request.objects.filter(fulfilled=False).exists():
+            # About 3 in 4 students have two bookings
+            students = max(ceil((bookings - Booking.objects.count()) / 1.5), 1)
+            seeder.seed_at_scale(students=students, teachers=0, terms=0, batch_size=1000)
+
+# A page is requested by the user, None for nobody logged in, with the arguments of its url and any data,
+# which is sent as the query string of a get or the form of a post
+ViewRequest = namedtuple('ViewRequest', ['user', 'args', 'data', 'method'], defaults=[{}, 'get'])
+
+""" Get the ViewRequest of each page, as a tuple of its fields"""
+def view_requests():
+    booking = Booking.objects.select_related('client', 'teacher').with_invoice().filter(invoice__isnull=False).first()
+    request = Request.objects.select_related('client').filter(fulfilled=False).first()
+    admin = User.objects.filter(role=User.ADMIN).first()
+    director = User.objects.filter(role=User.DIRECTOR).first()
+    student, teacher = booking.client, booking.teacher
+    term = Term.objects.first()
+    next_term = Term.objects.filter(start_date__gt=term.start_date).order_by('start_date').first()
+    return {
+        'home': (None, []),
+        'sign_up': (None, []),
+        'log_in': (None, []),
+        'log_out': (student, []),
+        'lessons': (student, []),
+        'list_lessons': (student, []),
+        'children': (student, []),
+        'payments': (student, []),
+        'invoice': (student, [booking.get_invoice.id]),
+        'edit_request': (request.client, [request.id]),
+        'view_booking': (student, [booking.id]),
+        'schedule': (teacher, []),
+        'schedule_custom': (teacher, [booking.date.year, booking.date.month]),
+        'calendar_feed': (None, [feed_token(teacher)]),
+        # Replaces the student's feed secret, the teacher's feed is the one measured
+        'reset_calendar_feed': (student, [], {}, 'post'),
+        'availability': (teacher, []),
+        'manage_lessons': (admin, []),
+        'book_lesson': (admin, [request.id]),
+        'book_lesson_new': (admin, []),
+        'book_lesson_user': (admin, [student.id]),
+        'book_lesson_edit': (admin, [booking.id]),
+        'match_requests': (admin, [], {'term': term.id}),
+        'free_teachers': (admin, [], {'day_of_week': booking.date.weekday(), 'time': f'{booking.time:%H:%M}', 'duration': booking.duration,
+            'lessons': 10, 'days_between_lessons': 7, 'start_date': booking.date.isoformat()}),
+        'rollover_term': (admin, [], {'from_term': term.id, 'to_term': next_term.id}),
+        'billing': (admin, []),
+        'export_invoices': (admin, [], {'start_date': booking.get_invoice.date.isoformat()}),
+        'export_transfers': (admin, []),
+        'export_balances': (admin, [], {'term': term.id}),
+        'terms': (admin, []),
+        'edit_term': (admin, [term.id]),
+        'permissions': (director, []),
+        # Gives the users the roles they already have, so the pages measured after it aren't changed
+        'bulk_permissions': (director, [], {'roles': f'{student.id},{student.role}\n{teacher.id},{teacher.role}'}, 'post'),
+        'user': (director, [student.id]),
+        'create_user': (director, []),
+    }
+
+""" Request every page once, recording its queries, time spent in SQL, the rest of its time and its size"""
+def measure_views():
+    results = {}
+    for name, view_request in view_requests().items():
+        user, args, data, method = ViewRequest(*view_request)
+        client = Client()
+        if user is not None:
+            client.force_login(user)
+        url = reverse(name, args=args)
+
+        with CaptureQueriesContext(connection) as queries:
+            started = perf_counter()
+            response = getattr(client, method)(url, data)
+            # Exports are streamed, their rows are only read as the content is
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            total = perf_counter() - started
+
+        sql = sum(float(query['time']) for query in queries.captured_queries)
+        results[name] = {
+            'url': url,
+            'status': response.status_code,
+            'queries': len(queries),
+            'sql_ms': round(sql * 1000, 3),
+            'render_ms': round((total - sql) * 1000, 3),
+            'bytes': len(content),
+        }
+    return results
+
+""" Find the pages which went over their query budget or made more queries with more data"""
+def query_budget_failures(report):
+    failures = []
+    for name, budget in VIEW_QUERY_BUDGETS.items():
+        counts = [run['views'][name]['queries'] for run in report]
+        if max(counts) > budget:
+            failures.append(f'{name} made {max(counts)} queries, its budget is {budget}')
+        elif counts[-1] > counts[0]:
+            failures.append(f'{name} made {counts[0]} queries with {report[0]["bookings"]} bookings but {counts[-1]} with {report[-1]["bookings"]}')
+    return failures
+
+""" Measure every page at each number of bookings, returning the report and any query budget failures"""
+def run_view_benchmark(sizes):
+    seeder = SeedCommand()
+    User.objects.create_user('benchmark.admin@example.org', first_name='Benchmark', last_name='Admin', role=User.ADMIN)
+    User.objects.create_user('benchmark.director@example.org', first_name='Benchmark', last_name='Director', role=User.DIRECTOR)
+
+    report = []
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        for size in sorted(sizes):
+            seed_bookings(seeder, size)
+            report.append({'bookings': Booking.objects.count(), 'views': measure_views()})
+    return report, query_budget_failures(report)
+
+""" Measure the queries, SQL time, other time and response size of every page as the number of bookings grows"""
+def views(stdout, options):
+    report, failures = run_view_benchmark(options['sizes'])
+
+    stdout.write(f'{"Page":<20} {"Bookings":>8} {"Status":>6} {"Queries":>7} {"SQL ms":>9} {"Other ms":>9} {"Bytes":>10}')
+    for name in VIEW_QUERY_BUDGETS:
+        for run in report:
+            result = run['views'][name]
+            stdout.write(f'{name:<20} {run["bookings"]:>8} {result["status"]:>6} {result["queries"]:>7} '
+                f'{result["sql_ms"]:>9.1f} {result["render_ms"]:>9.1f} {result["bytes"]:>10}')
+
+    if options.get('report'):
+        with open(options['report'], 'w') as report_file:
+            json.dump({'runs': report, 'budgets': VIEW_QUERY_BUDGETS, 'failures': failures}, report_file, indent=2)
+        stdout.write(f'Report written to {options["report"]}')
+
+    return failures
+
+BENCHMARKS = {
+    'booking': booking,
+    'booking_form': booking_form,
+    'jobs': jobs,
+    'log_in': log_in,
+    'matching': matching,
+    'rollover': rollover,
+    'schedule': schedule,
+    'views': views,
+}
@@ -0,0 +1,76 @@
+"""
+Making bookings, with their invoices, and fulfilling the requests they were made for, in one transaction.
+
+A booking is never saved without its invoice, and a request is never fulfilled without its booking, and
+SQLite only syncs to disk once per booking rather than after each write. Views, the request matching and
+the term rollover all book through here.
+
+book() makes one booking in as few statements as it can: the request is fulfilled, the booking inserted,
+checked for clashes and its invoice inserted. Writing first takes SQLite's write lock before anything is read,
+so two admins booking the same teacher at once wait for each other rather than both seeing the time as free.
+book_all() makes bookings which have already been checked in bulk, in a fixed number of statements.
+"""
+from datetime import date
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from lessons.models import User, Booking, Invoice, Request
+from lessons.scheduling import find_teacher_clash
+from lessons.view_cache import changed as view_data_changed
+
+""" Get a new invoice for a booking, due by its first lesson"""
+def new_invoice(booking):
+    return Invoice(booking=booking, invoice_ref=booking.invoice_reference(), date=date.today(),
+        due_by_date=booking.date, amount=booking.calculate_price(), refund=False)
+
+"""
+Save a new booking with its invoice and fulfil the request it was made for, if there is one
+
+Raises ValidationError, saving nothing, if the request has been fulfilled or the teacher has been booked
+for one of the lessons since the booking was checked.
+"""
+def book(booking, request=None):
+    with transaction.atomic():
+        if request is not None:
+            # Fulfilled unless it has been fulfilled since, in which case this booking isn't needed
+            if not Request.objects.filter(pk=request.pk, fulfilled=False).update(fulfilled=True):
+                raise ValidationError('The request has already been fulfilled')
+        if connection.features.has_select_for_update:
+            # Other bookings for the teacher wait until this one is saved, SQLite's write lock does the same
+            list(User.objects.select_for_update().filter(pk=booking.teacher_id).values_list('pk'))
+
+        booking.save()
+        clash = find_teacher_clash(booking)
+        if clash is not None:
+            lesson_date, other = clash
+            raise ValidationError(f'The teacher already has a lesson at {other.time:%H:%M} on {lesson_date:%d/%m/%Y}')
+        new_invoice(booking).save()
+
+        # update() doesn't send the signal which expires the cached pages
+        if request is not None:
+            view_data_changed('request')
+    if request is not None:
+        request.fulfilled = True
+    return booking
+
+"""
+Save new bookings which have already been checked for clashes, with their invoices, and fulfil the requests they were made for
+
+Takes a fixed number of statements however many bookings there are. Called inside a transaction, the
+bookings are rolled back with it rather than on their own.
+"""
+def book_all(bookings, requests=()):
+    if not bookings:
+        return []
+    with transaction.atomic(savepoint=False):
+        for booking in bookings:
+            # bulk_create doesn't call save, which normally sets the end date
+            booking.end_date = booking.calculate_end_date()
+        bookings = Booking.objects.bulk_create(bookings, batch_size=1000)
+        Invoice.objects.bulk_create([new_invoice(booking) for booking in bookings], batch_size=1000)
+        if requests:
+            Request.objects.filter(pk__in=[request.pk for request in requests]).update(fulfilled=True)
+
+        # bulk_create and update don't send the signals which expire the cached pages
+        for kind in ['booking', 'invoice'] + (['request'] if requests else []):
+            view_data_changed(kind)
+    return bookings
@@ -0,0 +1,17 @@
+"""
+Checks of the settings, run at startup by every management command and the development server.
+"""
+from django.conf import settings
+from django.core.checks import Error, register
+from impala.caches import is_shared
+
+""" Pages cached per user can only be expired by every process when the cache is shared between them"""
+@register()
+def check_view_cache(app_configs, **kwargs):
+    if getattr(settings, 'VIEW_CACHE', False) and not is_shared(settings.CACHES['default']):
+        return [Error(
+            'VIEW_CACHE needs a cache shared by every process',
+            hint='Set CACHE_BACKEND to file or redis, or turn VIEW_CACHE off',
+            id='lessons.E001',
+        )]
+    return []
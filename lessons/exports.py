@@ -0,0 +1,74 @@
+"""
+CSV exports of billing information for finance staff.
+
+Rows are read from the database in chunks with a server side cursor where the database supports it
+and written out as they are read, so an export uses the same memory however many rows it has.
+"""
+import csv
+from decimal import Decimal
+from django.db.models import F
+from lessons.models import User, Invoice, Transfer
+
+CHUNK_SIZE = 2000
+
+class Echo:
+    """ A file-like object which returns what is written to it, so csv.writer can produce rows one at a time"""
+    def write(self, value):
+        return value
+
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_STARTS = ('=', '+', '-', '@', '\t', '\r')
+
+""" Format a value for a CSV cell, so text such as a name can't be run as a formula by a spreadsheet"""
+def csv_cell(value):
+    # Sums of money don't always come back from the database with two decimal places
+    if isinstance(value, Decimal):
+        return f'{value:.2f}'
+    if isinstance(value, str) and value.startswith(FORMULA_STARTS):
+        return "'" + value
+    return value
+
+""" Generate the lines of a CSV file with the given header and rows"""
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([csv_cell(value) for value in row])
+
+""" Only keep rows dated within the date range"""
+def in_range(queryset, start=None, end=None):
+    if start is not None:
+        queryset = queryset.filter(date__gte=start)
+    if end is not None:
+        queryset = queryset.filter(date__lte=end)
+    return queryset
+
+""" Invoices issued within the date range"""
+def invoice_rows(start=None, end=None):
+    invoices = (in_range(Invoice.objects, start, end)
+        .order_by('date', 'id')
+        .values_list('id', 'invoice_ref', 'booking__client__email', 'date', 'due_by_date', 'amount',
+            'paid_total', 'refunded_total', 'net_paid_total', F('amount') - F('net_paid_total'), 'refund'))
+    return ['ID', 'Invoice Ref', 'Client', 'Date', 'Due Date', 'Amount', 'Paid', 'Refunded', 'Net Paid', 'Owed', 'Refund'], \
+        invoices.iterator(chunk_size=CHUNK_SIZE)
+
+""" Transfers made within the date range"""
+def transfer_rows(start=None, end=None):
+    transfers = (in_range(Transfer.objects, start, end)
+        .order_by('date', 'id')
+        .values_list('id', 'date', 'invoice__invoice_ref', 'invoice__booking__client__email', 'amount', 'refund'))
+    return ['ID', 'Date', 'Invoice Ref', 'Client', 'Amount', 'Refund'], transfers.iterator(chunk_size=CHUNK_SIZE)
+
+""" The balance of each student from the invoices issued and transfers made within the date range"""
+def balance_rows(start=None, end=None):
+    balances = (User.objects.students().with_balances(start, end)
+        .order_by('id')
+        .values_list('id', 'email', 'first_name', 'last_name', 'invoiced', 'paid', 'refunded', 'net_paid', 'owed'))
+    return ['ID', 'Email', 'First Name', 'Last Name', 'Invoiced', 'Paid', 'Refunded', 'Net Paid', 'Owed'], \
+        balances.iterator(chunk_size=CHUNK_SIZE)
+
+EXPORTS = {
+    'invoices': invoice_rows,
+    'transfers': transfer_rows,
+    'balances': balance_rows,
+}
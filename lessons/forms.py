@@ -1,6 +1,12 @@
 from django.core.validators import RegexValidator
 from django import forms
-from .models import Transfer, User, Booking, Request, Child, Invoice, Term
+from django.core.exceptions import ValidationError
+from django.forms.models import ModelChoiceIterator
+from .models import Transfer, User, Booking, Request, Child, Invoice, Term, term_calendar, first_weekday_on_or_after, nth_lesson_date, count_lessons, Duration, Interval
+from .scheduling import find_teacher_clash
+from .roles import parse_role_changes, read_role_csv
+from .timetable import DEFAULT_WEEK, parse_windows, format_windows, day_of_week, with_day
+from io import TextIOWrapper
 from django.utils import timezone
 from datetime import datetime, date, timedelta
 from django.db.models import Q
@@ -83,6 +89,34 @@ class UserSelectForm(forms.Form):
         if (self.cleaned_data.get('client') == None):
             self.add_error('client', 'Invalid input')
 
+class TermChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for term in term_calendar.terms():
+            yield self.choice(term)
+
+    def __len__(self):
+        return len(term_calendar.terms()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(term_calendar.terms())
+
+class TermChoiceField(forms.ModelChoiceField):
+    """ A term select field which reads terms from the term calendar instead of the database"""
+    iterator = TermChoiceIterator
+
+    def __init__(self, **kwargs):
+        super().__init__(queryset=Term.objects.order_by('start_date'), **kwargs)
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        term = term_calendar.get(value.pk if isinstance(value, Term) else value)
+        if term is None:
+            raise ValidationError(self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value})
+        return term
+
 class BookingForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         parent=kwargs.pop('user')
@@ -113,10 +147,7 @@ class BookingForm(forms.ModelForm):
         }
         #lambda value: value if value >= datetime.date.today() else raise forms.ValidationError("The date cannot be in the past!")
     
-    term = forms.ModelChoiceField(
-        queryset=Term.objects.all().order_by('start_date'),
-        widget=forms.Select
-    )
+    term = TermChoiceField(widget=forms.Select)
 
     day_of_week = forms.ChoiceField(widget=forms.Select, 
         choices=((0,'Monday'),(1,'Tuesday'),(2,'Wednesday'),(3,'Thursday'),(4,'Friday'),(5,'Saturday'),(6,'Sunday'))
@@ -135,6 +166,9 @@ class BookingForm(forms.ModelForm):
     def clean(self):
         super().clean() 
         term = self.cleaned_data.get('term')
+        if term is None:
+            # The term field already has an error
+            return
         term_start = term.start_date
         term_end = term.end_date
 
@@ -168,28 +202,223 @@ class BookingForm(forms.ModelForm):
             first_lesson_date = start_date
         else:
             # Find first date in term that matches weekday selected
-            first_lesson_date = term_start
-            while str(first_lesson_date.weekday()) != weekday:
-                first_lesson_date += timedelta(1)
+            first_lesson_date = first_weekday_on_or_after(term_start, weekday)
 
         days_between_lessons = int(self.cleaned_data.get('days_between_lessons'))
 
         # Last possible date of lesson
         last_lesson_date = (end_date or term_end)
 
-        lessons = 0
-
-        # Keep iterating to see how many lessons are possible until we reach the last lesson date
-        current_lesson = first_lesson_date
-        while current_lesson <= last_lesson_date:
-            lessons+=1
-            current_lesson += timedelta(days_between_lessons)
+        # Work out how many lessons fit before the last lesson date
+        lessons = count_lessons(first_lesson_date, last_lesson_date, days_between_lessons)
 
         if lessons == 0:
             self.add_error('end_date', 'No lessons were able to be booked within these constraints')
 
+        # Make sure the teacher isn't already teaching during any of the lessons
+        teacher = self.cleaned_data.get('teacher')
+        time = self.cleaned_data.get('time')
+        duration = self.cleaned_data.get('duration')
+        if lessons and teacher and time and duration:
+            clash = find_teacher_clash(Booking(
+                pk=self.instance.pk,
+                teacher=teacher,
+                date=first_lesson_date,
+                lessons=lessons,
+                days_between_lessons=days_between_lessons,
+                time=time,
+                duration=int(duration)
+            ))
+            if clash:
+                lesson_date, booking = clash
+                self.add_error('time', f'{teacher} already has a lesson at {booking.time:%H:%M} on {lesson_date:%d/%m/%Y}')
+
         self.instance.date = first_lesson_date
         self.instance.lessons = lessons
+        if lessons:
+            self.instance.end_date = nth_lesson_date(first_lesson_date, lessons - 1, days_between_lessons)
+
+class LessonFilterForm(forms.Form):
+    """ Filters for the lists of bookings and requests admins manage"""
+    DEFAULT_PAGE_SIZE = 25
+
+    teacher = forms.ModelChoiceField(queryset=User.objects.filter(role=User.TEACHER), required=False)
+    term = TermChoiceField(required=False)
+    client = forms.EmailField(required=False, help_text="Client email")
+    page_size = forms.IntegerField(required=False, min_value=1, max_value=100)
+
+    """ Filter bookings by teacher, term and client"""
+    def filter_bookings(self, bookings):
+        teacher = self.cleaned_data.get('teacher')
+        term = self.cleaned_data.get('term')
+        client = self.cleaned_data.get('client')
+        if teacher:
+            bookings = bookings.filter(teacher=teacher)
+        if term:
+            bookings = bookings.between(term.start_date, term.end_date)
+        if client:
+            bookings = bookings.filter(client__email=client)
+        return bookings
+
+    """ Filter requests by client"""
+    def filter_requests(self, requests):
+        client = self.cleaned_data.get('client')
+        if client:
+            requests = requests.filter(client__email=client)
+        return requests
+
+    def get_page_size(self):
+        return self.cleaned_data.get('page_size') or self.DEFAULT_PAGE_SIZE
+
+class ExportFilterForm(forms.Form):
+    """ Limits billing exports to a date range and/or a term"""
+    start_date = forms.DateField(required=False, widget=forms.widgets.DateInput(attrs={'type': 'date'}))
+    end_date = forms.DateField(required=False, widget=forms.widgets.DateInput(attrs={'type': 'date'}))
+    term = TermChoiceField(required=False)
+
+    def clean(self):
+        super().clean()
+        start_date, end_date = self.get_date_range()
+        if start_date and end_date and end_date < start_date:
+            self.add_error('end_date', 'End date needs to be after start date')
+
+    """ Get the first and last dates to export, either of which can be None, narrowed to the term if one is selected"""
+    def get_date_range(self):
+        start_date = self.cleaned_data.get('start_date')
+        end_date = self.cleaned_data.get('end_date')
+        term = self.cleaned_data.get('term')
+        if term:
+            start_date = max(start_date, term.start_date) if start_date else term.start_date
+            end_date = min(end_date, term.end_date) if end_date else term.end_date
+        return start_date, end_date
+
+class MatchRequestsForm(forms.Form):
+    """ Chooses the term to match the open lesson requests with teachers for"""
+    term = TermChoiceField()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Match for the current term, or the next one if it isn't term time
+        self.initial.setdefault('term', Term.current_term() or Term.next_term())
+
+class RolloverForm(forms.Form):
+    """ Chooses the term to roll bookings over from and the later term to roll them into"""
+    from_term = TermChoiceField(label='From')
+    to_term = TermChoiceField(label='Into')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Roll the current term, or the last one, over into the next term
+        to_term = Term.next_term()
+        from_term = Term.current_term()
+        if from_term is None:
+            earlier = [term for term in term_calendar.terms() if to_term is None or term.end_date < to_term.start_date]
+            from_term = earlier[-1] if earlier else None
+        self.initial.setdefault('from_term', from_term)
+        self.initial.setdefault('to_term', to_term)
+
+    def clean(self):
+        super().clean()
+        from_term = self.cleaned_data.get('from_term')
+        to_term = self.cleaned_data.get('to_term')
+        if from_term and to_term and to_term.start_date <= from_term.end_date:
+            self.add_error('to_term', 'The term needs to start after the term bookings are rolled over from')
+
+WEEKDAY_CHOICES = ((0,'Monday'),(1,'Tuesday'),(2,'Wednesday'),(3,'Thursday'),(4,'Friday'),(5,'Saturday'),(6,'Sunday'))
+
+class TimeWindowsField(forms.CharField):
+    """ Times of day like '09:00-12:00, 14:00-18:00', cleaned to a bitset of 15 minute slots"""
+    def __init__(self, **kwargs):
+        kwargs.setdefault('required', False)
+        kwargs.setdefault('help_text', 'eg 09:00-12:00, 14:00-18:00')
+        super().__init__(**kwargs)
+
+    def clean(self, value):
+        try:
+            return parse_windows(super().clean(value))
+        except ValueError as error:
+            raise ValidationError(str(error))
+
+class WeeklyAvailabilityForm(forms.Form):
+    """ The times a teacher can teach on each day of a usual week"""
+    def __init__(self, *args, week=DEFAULT_WEEK, **kwargs):
+        super().__init__(*args, **kwargs)
+        for weekday, name in WEEKDAY_CHOICES:
+            self.fields[f'day_{weekday}'] = TimeWindowsField(label=name)
+            self.initial.setdefault(f'day_{weekday}', format_windows(day_of_week(week, weekday)))
+
+    """ Get the week of slots the teacher gave"""
+    def get_week(self):
+        week = 0
+        for weekday, _ in WEEKDAY_CHOICES:
+            week = with_day(week, weekday, self.cleaned_data[f'day_{weekday}'])
+        return week
+
+class AvailabilityExceptionForm(forms.Form):
+    """ The times a teacher can teach on one date instead of their usual times"""
+    date = forms.DateField(widget=forms.widgets.DateInput(attrs={'type': 'date'}))
+    times = TimeWindowsField(help_text='eg 09:00-12:00, leave empty if you are away all day')
+
+    def clean_date(self):
+        exception_date = self.cleaned_data['date']
+        if exception_date < date.today():
+            raise ValidationError('The date cannot be in the past')
+        return exception_date
+
+class FreeTeachersForm(forms.Form):
+    """ Lessons to find the teachers who are free for"""
+    day_of_week = forms.TypedChoiceField(choices=WEEKDAY_CHOICES, coerce=int)
+    time = forms.TimeField(widget=forms.widgets.TimeInput(attrs={'type': 'time'}))
+    duration = forms.TypedChoiceField(choices=Duration.choices, coerce=int, initial=Duration.MIN60)
+    lessons = forms.IntegerField(min_value=1, max_value=52, initial=1)
+    days_between_lessons = forms.TypedChoiceField(choices=Interval.choices, coerce=int, initial=Interval.WEEK1)
+    start_date = forms.DateField(widget=forms.widgets.DateInput(attrs={'type': 'date'}), help_text='The first lesson is on the day of the week on or after this date')
+
+class UserFilterForm(forms.Form):
+    """ Search and filter for the list of users on the permissions page"""
+    DEFAULT_PAGE_SIZE = 50
+
+    search = forms.CharField(required=False, help_text="Name or email")
+    role = forms.ChoiceField(required=False, choices=[('', 'Any role')] + User.ROLE_CHOICES)
+    page_size = forms.IntegerField(required=False, min_value=1, max_value=500)
+
+    """ Filter users by role and by a search of their names and email"""
+    def filter_users(self, users):
+        search = self.cleaned_data.get('search', '').strip()
+        role = self.cleaned_data.get('role')
+        if role:
+            users = users.filter(role=role)
+        for word in search.split():
+            users = users.filter(Q(first_name__icontains=word) | Q(last_name__icontains=word) | Q(email__icontains=word))
+        return users
+
+    def get_page_size(self):
+        return self.cleaned_data.get('page_size') or self.DEFAULT_PAGE_SIZE
+
+class BulkRoleForm(forms.Form):
+    """ Roles for many users at once, as lines of "id,role" and/or a CSV file of them"""
+    roles = forms.CharField(required=False, widget=forms.Textarea(attrs={'rows': 4, 'placeholder': '12,TEACHER'}),
+        help_text="One user per line: id,role")
+    csv_file = forms.FileField(required=False, label="CSV file", help_text="Columns: id,role")
+
+    def clean(self):
+        super().clean()
+        rows = read_role_csv((self.cleaned_data.get('roles') or '').splitlines())
+        csv_file = self.cleaned_data.get('csv_file')
+        if csv_file:
+            try:
+                rows += read_role_csv(TextIOWrapper(csv_file.file, encoding='utf-8-sig'))
+            except UnicodeDecodeError:
+                self.add_error('csv_file', 'The file must be a UTF-8 CSV file')
+                return
+
+        if not rows:
+            raise ValidationError('Give at least one user and role')
+
+        roles, errors = parse_role_changes(rows)
+        if errors:
+            raise ValidationError(errors)
+        self.cleaned_data['role_changes'] = roles
 
 class CreateLessonRequestForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
@@ -0,0 +1,120 @@
+"""
+Calendar feeds of a user's lessons in the iCalendar format (RFC 5545).
+
+Each booking is a single event which repeats with an RRULE, so the size of a feed
+depends on the number of bookings rather than the number of lessons.
+"""
+from datetime import datetime, timezone
+from django.core import signing
+from django.db.models import Count, Max, Q
+from lessons.models import User, Booking, new_feed_secret
+
+FEED_SALT = 'lessons.calendar_feed'
+
+"""
+Get the token used in the url of a user's calendar feed
+
+It contains the user's feed secret, so the url stops working when the secret is reset.
+"""
+def feed_token(user):
+    return signing.Signer(salt=FEED_SALT).sign(f'{user.pk}.{user.feed_secret}')
+
+""" Get the id of the user a feed token belongs to, or None if it has been tampered with or their feed secret has been reset"""
+def feed_user_id(token):
+    try:
+        user_id, secret = signing.Signer(salt=FEED_SALT).unsign(token).split('.', 1)
+        user_id = int(user_id)
+    except (signing.BadSignature, ValueError):
+        return None
+    if not User.objects.filter(pk=user_id, feed_secret=secret).exists():
+        return None
+    return user_id
+
+""" Give a user a new feed secret, so the old url of their feed stops working"""
+def reset_feed_secret(user):
+    user.feed_secret = new_feed_secret()
+    user.save(update_fields=['feed_secret'])
+
+""" Get the bookings a user teaches or is a client of"""
+def user_bookings(user_id):
+    return Booking.objects.filter(Q(client_id=user_id) | Q(teacher_id=user_id))
+
+"""
+Get the number of bookings in a user's feed, the largest booking id and when a booking was last changed
+
+Together these change whenever a booking is added, edited or deleted, so they can be used as an ETag.
+The time a booking was last changed on its own doesn't change when a booking is deleted.
+"""
+def feed_state(user_id):
+    return user_bookings(user_id).aggregate(count=Count('id'), last_id=Max('id'), last_modified=Max('updated_at'))
+
+""" Escape text for use in a property value"""
+def escape_text(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+""" Split a content line into lines of at most 75 octets, each continuation starting with a space"""
+def fold(line):
+    if len(line.encode()) <= 75:
+        return line
+    parts = []
+    part = ''
+    for character in line:
+        if len((part + character).encode()) > (75 if not parts else 74):
+            parts.append(part)
+            part = ''
+        part += character
+    parts.append(part)
+    return '\r\n '.join(parts)
+
+""" Format a datetime as a UTC date-time"""
+def utc_timestamp(moment):
+    return moment.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+""" Get the recurrence rule which repeats a booking's first lesson for the rest of its lessons"""
+def recurrence_rule(booking):
+    if booking.days_between_lessons % 7 == 0:
+        return f'FREQ=WEEKLY;INTERVAL={booking.days_between_lessons // 7};COUNT={booking.lessons}'
+    return f'FREQ=DAILY;INTERVAL={booking.days_between_lessons};COUNT={booking.lessons}'
+
+""" Get the content lines of the event for a booking, as seen by the given user"""
+def booking_event(booking, user_id, host, booking_url):
+    if booking.teacher_id == user_id:
+        student = booking.child or booking.client
+        summary = f'Lesson with {student.first_name} {student.last_name}'
+    else:
+        summary = f'Lesson with {booking.teacher.first_name} {booking.teacher.last_name}'
+        if booking.child:
+            summary += f' for {booking.child.first_name}'
+
+    # Lessons are at the same local time every week so they are given as floating times
+    return [
+        'BEGIN:VEVENT',
+        f'UID:booking-{booking.id}@{host}',
+        f'DTSTAMP:{utc_timestamp(booking.updated_at)}',
+        f'LAST-MODIFIED:{utc_timestamp(booking.updated_at)}',
+        f'DTSTART:{datetime.combine(booking.date, booking.time):%Y%m%dT%H%M%S}',
+        f'DURATION:PT{booking.duration}M',
+        f'RRULE:{recurrence_rule(booking)}',
+        f'SUMMARY:{escape_text(summary)}',
+        f'URL:{booking_url(booking)}',
+        'END:VEVENT',
+    ]
+
+"""
+Render the calendar feed of a user's bookings
+
+booking_url is called with each booking to get the absolute url of its page
+"""
+def render_feed(user_id, host, booking_url):
+    bookings = user_bookings(user_id).select_related('client', 'teacher', 'child').order_by('date', 'time', 'id')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Impala//Lessons//EN',
+        'CALSCALE:GREGORIAN',
+        'X-WR-CALNAME:Lessons',
+    ]
+    for booking in bookings:
+        lines += booking_event(booking, user_id, host, booking_url)
+    lines.append('END:VCALENDAR')
+    return ''.join(fold(line) + '\r\n' for line in lines)
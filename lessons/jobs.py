@@ -0,0 +1,242 @@
+"""
+A job queue kept in the database, for slow work which doesn't need to be done before a page is shown.
+
+Jobs are queued with enqueue() and run by the run_worker command:
+
+$ python3 manage.py run_worker --threads 4
+
+Queuing a job is one insert, made in the same transaction as the change it follows, so a job is only
+run for changes which were saved. A worker claims a job by updating it, which only one worker can do,
+so any number of workers can run side by side without a broker. A claimed job is locked for its
+timeout, after which another worker runs it again, in case the worker running it died.
+
+Workers run in their own processes, so the pages their changes affect are only expired for the web
+processes through a shared cache. Pages are only cached per user with one, see VIEW_CACHE in
+impala/settings.py, and run_worker won't start if they are cached any other way.
+
+A job may run more than once, so jobs need to be safe to repeat. A job which raises is retried after
+a delay which doubles with each attempt, until it has been tried max_attempts times.
+"""
+import logging
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from datetime import date, timedelta
+from traceback import format_exc
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from lessons.models import Job, Invoice, Transfer
+
+logger = logging.getLogger(__name__)
+
+# Retries wait 10s, 20s, 40s... up to an hour
+RETRY_DELAY = timedelta(seconds=10)
+MAX_RETRY_DELAY = timedelta(hours=1)
+
+# Finished jobs are kept for a week so failures can be looked into
+KEEP_FINISHED = timedelta(days=7)
+
+@dataclass(frozen=True)
+class JobType:
+    function: object
+    timeout: timedelta
+    max_attempts: int
+
+# The functions which can be queued, by name
+JOBS = {}
+
+""" Register a function which can be queued with enqueue()"""
+def job(timeout=timedelta(minutes=5), max_attempts=5):
+    def register(function):
+        JOBS[function.__name__] = JobType(function, timeout, max_attempts)
+        return function
+    return register
+
+"""
+Queue a job to run a registered function with keyword arguments which can be stored as JSON
+
+If a job with the same dedup_key is already waiting to run, nothing is queued and that job is returned.
+"""
+def enqueue(function, dedup_key=None, delay=timedelta(), **arguments):
+    name = function if isinstance(function, str) else function.__name__
+    if name not in JOBS:
+        raise ValueError(f'{name} is not a job')
+
+    queued = Job(name=name, arguments=arguments, dedup_key=dedup_key, max_attempts=JOBS[name].max_attempts,
+        run_at=timezone.now() + delay)
+    if dedup_key is None:
+        queued.save()
+        return queued
+
+    waiting = Job.objects.filter(dedup_key=dedup_key, status=Job.QUEUED).first()
+    if waiting is not None:
+        return waiting
+    try:
+        with transaction.atomic():
+            queued.save()
+    except IntegrityError:
+        # Another request queued it first
+        return Job.objects.get(dedup_key=dedup_key, status=Job.QUEUED)
+    return queued
+
+""" Get how long to wait before trying a job again after a number of failed attempts"""
+def retry_delay(attempts):
+    return min(RETRY_DELAY * 2 ** min(attempts - 1, 20), MAX_RETRY_DELAY)
+
+""" Get the jobs which are due, or have been running for longer than their timeout"""
+def due_jobs(now):
+    return Job.objects.filter(Q(status=Job.QUEUED, run_at__lte=now) | Q(status=Job.RUNNING, locked_until__lt=now))
+
+""" Claim up to a number of the jobs which are due for a worker, oldest first"""
+def claim_jobs(worker, limit):
+    now = timezone.now()
+    claimed = []
+    fields = ['id', 'name', 'status', 'attempts', 'max_attempts']
+    # Looked for separately so the queued jobs are read in the order of job_due_idx, rather than all sorted
+    timed_out = list(Job.objects.filter(status=Job.RUNNING, locked_until__lt=now).only(*fields)[:limit])
+    queued = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('run_at').only(*fields)[:limit - len(timed_out)]
+    for candidate in timed_out + list(queued):
+        if candidate.status == Job.RUNNING and candidate.attempts >= candidate.max_attempts:
+            # The worker running it stopped before it finished, for the last time
+            due_jobs(now).filter(pk=candidate.pk).update(status=Job.FAILED, finished_at=now, locked_until=None,
+                last_error=f'Timed out after {candidate.attempts} attempts')
+            continue
+
+        job_type = JOBS.get(candidate.name)
+        timeout = job_type.timeout if job_type else timedelta(minutes=5)
+        # Only one worker can make this update, the others find the job is no longer due
+        if due_jobs(now).filter(pk=candidate.pk).update(status=Job.RUNNING, locked_by=worker,
+                locked_until=now + timeout, attempts=F('attempts') + 1):
+            claimed.append(candidate.pk)
+    return list(Job.objects.filter(pk__in=claimed, locked_by=worker).order_by('run_at'))
+
+""" Run a claimed job and record whether it was done or needs to be tried again, returning None if another worker has it"""
+def run_job(claimed, worker):
+    job_type = JOBS.get(claimed.name)
+    try:
+        if job_type is None:
+            raise LookupError(f'{claimed.name} is not a job')
+        # The job is marked done in the same transaction as its changes, so if it fails both are undone.
+        # Writing first also takes the lock the job's own writes will need, which SQLite
+        # would otherwise fail to upgrade to after the job has read, rather than wait for.
+        with transaction.atomic():
+            # A job which ran past its timeout may have been claimed by another worker, which now owns it
+            if not Job.objects.filter(pk=claimed.pk, status=Job.RUNNING, locked_by=worker).update(
+                    status=Job.DONE, finished_at=timezone.now(), locked_until=None, last_error=''):
+                return None
+            job_type.function(**claimed.arguments)
+    except Exception:
+        error = format_exc()
+        logger.warning('Job %s failed on attempt %s of %s', claimed, claimed.attempts, claimed.max_attempts, exc_info=True)
+        fail_job(claimed, worker, error)
+        return False
+    return True
+
+def fail_job(claimed, worker, error):
+    now = timezone.now()
+    mine = Job.objects.filter(pk=claimed.pk, status=Job.RUNNING, locked_by=worker)
+    if claimed.attempts >= claimed.max_attempts:
+        mine.update(status=Job.FAILED, finished_at=now, locked_until=None, last_error=error)
+        return
+
+    retried = claimed.dedup_key is not None and Job.objects.filter(dedup_key=claimed.dedup_key, status=Job.QUEUED).exists()
+    if retried:
+        # The job was queued again while it ran, so that job will do its work
+        mine.update(status=Job.FAILED, finished_at=now, locked_until=None, last_error=error + '\nRetried by the job queued after it')
+        return
+    try:
+        with transaction.atomic():
+            mine.update(status=Job.QUEUED, run_at=now + retry_delay(claimed.attempts), locked_until=None, last_error=error)
+    except IntegrityError:
+        mine.update(status=Job.FAILED, finished_at=now, locked_until=None, last_error=error + '\nRetried by the job queued after it')
+
+""" Delete the jobs which finished longer ago than they are kept for"""
+def purge_finished_jobs(now=None):
+    now = now or timezone.now()
+    deleted, _ = Job.objects.filter(status__in=[Job.DONE, Job.FAILED], finished_at__lt=now - KEEP_FINISHED).delete()
+    return deleted
+
+class Worker:
+    """
+    Runs queued jobs on a pool of threads, claiming more as threads become free
+
+    With one thread the jobs are run in the calling thread, which tests rely on to see the jobs' changes.
+    """
+
+    def __init__(self, threads=1, poll_interval=1.0, name=None):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{id(self):x}'
+        self.stopping = threading.Event()
+        self.done = 0
+        self.failed = 0
+
+    """ Finish the running jobs and stop claiming new ones"""
+    def stop(self):
+        self.stopping.set()
+
+    def record(self, succeeded):
+        if succeeded is None:
+            return
+        if succeeded:
+            self.done += 1
+        else:
+            self.failed += 1
+
+    """ Run jobs until stopped, or until none are due if until_empty is set"""
+    def run(self, until_empty=False):
+        purge_finished_jobs()
+        if self.threads == 1:
+            while not self.stopping.is_set():
+                claimed = claim_jobs(self.name, 1)
+                for each in claimed:
+                    self.record(run_job(each, self.name))
+                if not claimed:
+                    if until_empty:
+                        break
+                    self.stopping.wait(self.poll_interval)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix='job') as pool:
+            running = set()
+            while not self.stopping.is_set():
+                free = self.threads - len(running)
+                claimed = claim_jobs(self.name, free) if free else []
+                running |= {pool.submit(self.run_in_thread, each) for each in claimed}
+                if not running:
+                    if until_empty:
+                        break
+                    self.stopping.wait(self.poll_interval)
+                    continue
+                finished, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self.record(future.result())
+            for future in wait(running).done:
+                self.record(future.result())
+
+    def run_in_thread(self, claimed):
+        # Each thread has its own connection, which is closed if it has gone stale
+        close_old_connections()
+        try:
+            return run_job(claimed, self.name)
+        finally:
+            close_old_connections()
+
+""" Run every job which is due in this thread, returning how many were done and how many failed"""
+def run_queued_jobs():
+    worker = Worker()
+    worker.run(until_empty=True)
+    return worker.done, worker.failed
+
+# ---- Jobs
+
+""" Refund whatever has been paid of an invoice over its amount"""
+@job()
+def refund_overpayment(invoice_id):
+    invoice = Invoice.objects.select_for_update().get(pk=invoice_id)
+    overpaid = invoice.net_paid() - invoice.amount
+    if overpaid > 0:
+        Transfer.objects.create(invoice=invoice, amount=overpaid, date=date.today(), refund=True)
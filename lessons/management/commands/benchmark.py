@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from lessons.benchmarks import BENCHMARKS
+
+class Command(BaseCommand):
+    help = 'Run micro-benchmarks against a throwaway copy of the data'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help=f'Benchmarks to run ({", ".join(BENCHMARKS)}), all of them by default')
+        parser.add_argument('--number', type=int, default=100, help='Number of times to run each measurement')
+        parser.add_argument('--sizes', type=lambda sizes: [int(size) for size in sizes.split(',')], default=[10, 1000],
+            help='Comma separated numbers of bookings to measure the views with, eg 10,1000,100000')
+        parser.add_argument('--students', type=int, default=6000, help='Number of students to seed for the matching and rollover benchmarks')
+        parser.add_argument('--report', help='File to write a JSON report of the view measurements to')
+
+    def handle(self, *args, **options):
+        names = options['names'] or list(BENCHMARKS)
+        unknown = [name for name in names if name not in BENCHMARKS]
+        if unknown:
+            raise CommandError(f'Unknown benchmark: {", ".join(unknown)}')
+
+        failures = []
+        for name in names:
+            self.stdout.write(f'Benchmark: {name}')
+
+            # Roll back anything the benchmark creates
+            with transaction.atomic():
+                failures += BENCHMARKS[name](self.stdout, options) or []
+                transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError('\n'.join(failures))
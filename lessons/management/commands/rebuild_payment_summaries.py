@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from lessons.models import Invoice
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored payment summary of every invoice from its transfers and report any drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drift, do not rebuild')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = list(Invoice.objects.with_payment_summary_drift().order_by('id'))
+
+            for invoice in drifted:
+                self.stdout.write(
+                    f'Invoice {invoice.invoice_ref}: stored net paid £{invoice.net_paid_total:.2f}, '
+                    f'actual £{invoice.actual_paid - invoice.actual_refunded:.2f}'
+                )
+            self.stdout.write(f'{len(drifted)} of {Invoice.objects.count()} invoices have drifted')
+
+            if not options['dry_run']:
+                Invoice.objects.all().update_payment_summaries()
+                self.stdout.write('Rebuilt payment summaries')
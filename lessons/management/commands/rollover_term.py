@@ -0,0 +1,36 @@
+from collections import Counter
+from time import perf_counter
+from django.core.management.base import BaseCommand, CommandError
+from lessons.models import Term
+from lessons.rollover import propose_rollover, roll_over
+
+class Command(BaseCommand):
+    help = 'Book the bookings with lessons in a term again for a later term, with the same teacher, day, time, duration and interval'
+
+    def add_arguments(self, parser):
+        parser.add_argument('from_term', type=int, help='Id of the term to roll bookings over from')
+        parser.add_argument('to_term', type=int, help='Id of the later term to book them into')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be booked, do not book it')
+
+    def handle(self, *args, **options):
+        try:
+            from_term = Term.objects.get(pk=options['from_term'])
+            to_term = Term.objects.get(pk=options['to_term'])
+        except Term.DoesNotExist as error:
+            raise CommandError(error)
+
+        started = perf_counter()
+        try:
+            if options['dry_run']:
+                proposal = propose_rollover(from_term, to_term)
+                booked, problems = proposal.bookable, proposal.problems
+            else:
+                booked, problems = roll_over(from_term, to_term)
+        except ValueError as error:
+            raise CommandError(error)
+        seconds = perf_counter() - started
+
+        verb = 'Would book' if options['dry_run'] else 'Booked'
+        self.stdout.write(f'{verb} {len(booked)} bookings from {from_term.name} into {to_term.name} in {seconds:.2f}s')
+        for problem, count in Counter(rollover.problem for rollover in problems).most_common():
+            self.stdout.write(f'{count} not rolled over: {problem}')
@@ -0,0 +1,31 @@
+import signal
+from django.core.management.base import BaseCommand, CommandError
+from lessons.checks import check_view_cache
+from lessons.jobs import Worker
+
+class Command(BaseCommand):
+    help = 'Run the jobs queued in the database, see lessons/jobs.py. More than one worker can be run at once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4, help='Number of jobs to run at once')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait before looking for new jobs when there are none')
+        parser.add_argument('--until-empty', action='store_true', help='Stop once there are no jobs due, rather than waiting for more')
+
+    def handle(self, *args, **options):
+        # The jobs' changes only expire the pages cached by the web processes through a cache they share,
+        # checked here as well as at startup as the checks can be skipped
+        for error in check_view_cache(None):
+            raise CommandError(f'{error.msg}. {error.hint}')
+
+        worker = Worker(threads=max(options['threads'], 1), poll_interval=options['poll_interval'])
+
+        # Let the running jobs finish when asked to stop
+        def stop(signum, frame):
+            self.stdout.write('Stopping once the running jobs finish')
+            worker.stop()
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f'Worker {worker.name} running jobs on {worker.threads} threads')
+        worker.run(until_empty=options['until_empty'])
+        self.stdout.write(f'{worker.done} jobs done, {worker.failed} failed')
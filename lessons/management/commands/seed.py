@@ -1,30 +1,47 @@
 from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from time import perf_counter
 from django.db.utils import IntegrityError
 from lessons.models import *
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from faker import Faker
 from django.db.utils import IntegrityError
 from django.utils import timezone
 import random
 from decimal import Decimal
 
-# A few lines in this file were 
-
 class Command(BaseCommand):
-    def __init__(self):
+    help = 'Seed the database with example data, or with --students/--teachers/--terms generate bulk data for load testing'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
         self.faker = Faker('en_GB')
+        # Every seeded user has the same password, so it only needs hashing once
+        self.password = make_password('Password123')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, help='Number of students to generate for load testing')
+        parser.add_argument('--teachers', type=int, help='Number of teachers to generate for load testing')
+        parser.add_argument('--terms', type=int, help='Number of terms to generate for load testing')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Number of students saved in each transaction')
+
+    """ Create a user with the shared password hash, hashing the same password again for every user would take most of the seeding time"""
+    def create_user(self, email, **fields):
+        return User.objects.create(email=email, password=self.password, **fields)
 
     def seed_required_data(self):
         print("Seeding Required Data")
         # ---- EPIC 1
-        john = User.objects.create_user('john.doe@example.org',first_name='John',last_name='Doe',password='Password123',role=User.STUDENT)
-        User.objects.create_user('petra.pickles@example.org',first_name='Petra',last_name='Pickles',password='Password123',role=User.ADMIN)
-        User.objects.create_user('marty.major@example.org',first_name='Marty',last_name='Major',password='Password123',role=User.DIRECTOR)
+        john = self.create_user('john.doe@example.org',first_name='John',last_name='Doe',role=User.STUDENT)
+        self.create_user('petra.pickles@example.org',first_name='Petra',last_name='Pickles',role=User.ADMIN)
+        self.create_user('marty.major@example.org',first_name='Marty',last_name='Major',role=User.DIRECTOR)
 
-        User.objects.create_user('ryan.fuller@example.org',first_name='Ryan',last_name='Fuller',password='Password123',role=User.STUDENT)
+        self.create_user('ryan.fuller@example.org',first_name='Ryan',last_name='Fuller',role=User.STUDENT)
 
         # There should be a second administrator account.
-        User.objects.create_user('peter.smith@example.org',first_name='Peter',last_name='Smith',password='Password123',role=User.ADMIN)
+        self.create_user('peter.smith@example.org',first_name='Peter',last_name='Smith',role=User.ADMIN)
 
         # ---- EPIC 2.1: Children
 
@@ -44,8 +61,8 @@ class Command(BaseCommand):
         # ---- Epic 3.2
 
         # Seed Teachers
-        teacher = User.objects.create_user('norma.noe@example.org',first_name='Norma',last_name='Noe',password='Password123',role=User.TEACHER)
-        johns_teacher = User.objects.create_user('jane.doe@example.org',first_name='Jane',last_name='Doe',password='Password123',role=User.TEACHER)
+        teacher = self.create_user('norma.noe@example.org',first_name='Norma',last_name='Noe',role=User.TEACHER)
+        johns_teacher = self.create_user('jane.doe@example.org',first_name='Jane',last_name='Doe',role=User.TEACHER)
 
         johns_lesson_request = Request(client=john, availability="any day", lessons=2, days_between_lessons=7, duration=45, info="info", fulfilled=True)
         johns_booking = Booking.objects.create(client =  john,
@@ -130,7 +147,7 @@ class Command(BaseCommand):
         if s:
             student = s
         else:
-            student = User.objects.create_user(f'{first_name}.{last_name}@example.org'.lower(),first_name=f'{first_name}',last_name=f'{last_name}',password='Password123',role=User.STUDENT)
+            student = self.create_user(f'{first_name}.{last_name}@example.org'.lower(),first_name=f'{first_name}',last_name=f'{last_name}',role=User.STUDENT)
 
         day_choices = [i[0] for i in Interval.choices]
         duration_choices=[i[0] for i in Duration.choices]
@@ -138,7 +155,7 @@ class Command(BaseCommand):
         # Create request, bookings and children for user
 
         # Each student is allocated a teacher and all their lessons are given by that teacher.
-        teacher = random.choice(User.objects.filter(role="TEACHER"))
+        teacher = random.choice(self.teachers)
         if random.randrange(100) <= 75:
             # Most clients/children have fulfilled lesson requests
             for i in range(1,3):
@@ -162,7 +179,7 @@ class Command(BaseCommand):
                     fulfilled=True,
                     child=child)
 
-                term = random.choice(Term.objects.all())
+                term = random.choice(self.terms)
 
                 # Create bookings
                 booking = Booking.objects.create(client =  student,
@@ -224,6 +241,14 @@ class Command(BaseCommand):
                     child=child)
 
     def handle(self, *args, **options):
+        if any(options[count] is not None for count in ['students', 'teachers', 'terms']):
+            self.seed_at_scale(
+                students=options['students'] or 0,
+                teachers=options['teachers'] or 0,
+                terms=options['terms'] or 0,
+                batch_size=options['batch_size']
+            )
+            return
 
         # Seed required data
         try:
@@ -238,7 +263,7 @@ class Command(BaseCommand):
             try:
                 first_name = self.faker.first_name()
                 last_name = self.faker.last_name()
-                User.objects.create_user(f'{first_name}.{last_name}@example.org'.lower(),first_name=f'{first_name}',last_name=f'{last_name}',password='Password123',role=User.TEACHER)
+                self.create_user(f'{first_name}.{last_name}@example.org'.lower(),first_name=f'{first_name}',last_name=f'{last_name}',role=User.TEACHER)
                 teacher += 1
             except IntegrityError as e:
                 print(e)
@@ -246,6 +271,10 @@ class Command(BaseCommand):
 
         print()
 
+        # Teachers and terms don't change while students are seeded
+        self.teachers = list(User.objects.filter(role=User.TEACHER))
+        self.terms = list(Term.objects.all())
+
         # Seed 100 students
         user_count = 0
         while user_count <= 100:
@@ -259,3 +288,150 @@ class Command(BaseCommand):
         
         print()
         print('Finished Seeding')
+
+
+    # ---- Bulk data for load testing
+
+    def seed_at_scale(self, students, teachers, terms, batch_size):
+        started = perf_counter()
+        self.rows = 0
+
+        # Emails are made unique with a number, starting after the existing users
+        self.next_user_number = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+        with transaction.atomic():
+            self.seed_teachers_in_bulk(teachers)
+            self.seed_terms_in_bulk(terms)
+
+        self.teachers = list(User.objects.filter(role=User.TEACHER).values_list('id', flat=True))
+        self.terms = list(Term.objects.order_by('start_date'))
+        if students and not (self.teachers and self.terms):
+            raise CommandError('Students need at least one teacher and one term')
+
+        for seeded in range(0, students, batch_size):
+            with transaction.atomic():
+                self.seed_students_in_bulk(min(batch_size, students - seeded))
+            elapsed = perf_counter() - started
+            print(f'Seeded {seeded + min(batch_size, students - seeded)} students, {self.rows} rows, {self.rows / elapsed:.0f} rows/s', end='\r')
+
+        elapsed = perf_counter() - started
+        print()
+        print(f'Finished Seeding {self.rows} rows in {elapsed:.1f}s ({self.rows / elapsed:.0f} rows/s)')
+
+    def new_user(self, role):
+        first_name = self.faker.first_name()
+        last_name = self.faker.last_name()
+        email = f'{first_name}.{last_name}.{self.next_user_number}@example.org'.lower()
+        self.next_user_number += 1
+        return User(email=email, first_name=first_name, last_name=last_name, password=self.password, role=role)
+
+    def seed_teachers_in_bulk(self, count):
+        self.rows += len(User.objects.bulk_create([self.new_user(User.TEACHER) for i in range(count)], batch_size=1000))
+
+    def seed_terms_in_bulk(self, count):
+        # Terms are 7 weeks long with a week off between them, starting after the last existing term
+        last_term_end = Term.objects.aggregate(Max('end_date'))['end_date__max']
+        start = first_weekday_on_or_after(last_term_end + timedelta(7) if last_term_end else date.today(), 0)
+        new_terms = []
+        for i in range(count):
+            end = start + timedelta(46)
+            new_terms.append(Term(name=f'Term {start:%b %Y}', start_date=start, end_date=end))
+            start = end + timedelta(10)
+        self.rows += len(Term.objects.bulk_create(new_terms))
+        # bulk_create doesn't send the signals which keep the term calendar up to date
+        term_calendar.changed()
+
+    def seed_students_in_bulk(self, count):
+        day_choices = [i[0] for i in Interval.choices]
+        duration_choices = [i[0] for i in Duration.choices]
+
+        students = User.objects.bulk_create([self.new_user(User.STUDENT) for i in range(count)])
+
+        # Most clients/children have fulfilled lesson requests, the rest only have unfulfilled requests
+        fulfilled = {student.id: random.randrange(100) <= 75 for student in students}
+
+        # Each student makes two requests, most of them for a child
+        slots = []
+        children = []
+        for student in students:
+            names = set()
+            for i in range(2):
+                child = None
+                if random.randint(0,100) <= 75:
+                    first_name = self.faker.first_name()
+                    # Children of the same parent need different names
+                    if first_name not in names:
+                        names.add(first_name)
+                        child = Child(first_name=first_name, last_name=student.last_name, parent=student)
+                        children.append(child)
+                slots.append((student, child))
+        Child.objects.bulk_create(children)
+
+        requests = []
+        for student, child in slots:
+            interval = random.choice(day_choices)
+            requests.append(Request(
+                client=student,
+                availability="any",
+                lessons=random.randint(1, 5 if interval == 7 else 3),
+                days_between_lessons=interval,
+                duration=random.choice(duration_choices),
+                info="none",
+                fulfilled=fulfilled[student.id],
+                child=child))
+        Request.objects.bulk_create(requests)
+
+        # Each student is allocated a teacher and all their lessons are given by that teacher
+        teacher_of = {student.id: random.choice(self.teachers) for student in students}
+        bookings = []
+        for request in requests:
+            if not request.fulfilled:
+                continue
+            term = random.choice(self.terms)
+            booking = Booking(
+                client_id=request.client_id,
+                lessons=request.lessons,
+                days_between_lessons=request.days_between_lessons,
+                duration=request.duration,
+                teacher_id=teacher_of[request.client_id],
+                date=first_weekday_on_or_after(term.start_date, random.randint(0,4)),
+                time=time(random.randint(9,19), random.choice([0,15,30,45])),
+                child=request.child)
+            # bulk_create doesn't call save, which normally sets the end date
+            booking.end_date = booking.calculate_end_date()
+            bookings.append(booking)
+        Booking.objects.bulk_create(bookings)
+
+        # Some invoices have been paid, some have been partially paid, a few have been overpaid and refunded, and some are unpaid
+        invoices = []
+        payments = []
+        for booking in bookings:
+            amount = booking.calculate_price().quantize(Decimal('0.01'))
+            paid = 0
+            if random.randint(1,4) != 1:
+                paid = random.choice([amount, amount * Decimal('1.5'), amount * Decimal('0.5')]).quantize(Decimal('0.01'))
+            refunded = max(paid - amount, 0)
+            payments.append((paid, refunded))
+
+            # bulk_create doesn't send the signals which normally keep the payment summary up to date
+            invoices.append(Invoice(
+                booking=booking,
+                invoice_ref=f'{booking.client_id}-{booking.id}',
+                date=date.today(),
+                due_by_date=booking.date,
+                amount=amount,
+                refund=False,
+                paid_total=paid,
+                refunded_total=refunded,
+                net_paid_total=paid - refunded))
+        Invoice.objects.bulk_create(invoices)
+
+        transfers = []
+        for invoice, (paid, refunded) in zip(invoices, payments):
+            if paid:
+                transfers.append(Transfer(invoice=invoice, amount=paid, date=date.today(), refund=False))
+            if refunded:
+                transfers.append(Transfer(invoice=invoice, amount=refunded, date=date.today(), refund=True))
+        Transfer.objects.bulk_create(transfers)
+
+        self.rows += len(students) + len(children) + len(requests) + len(bookings) + len(invoices) + len(transfers)
@@ -0,0 +1,442 @@
+"""
+Matching the unfulfilled lesson requests with teachers and lesson times in one run.
+
+The lessons of every teacher and client in the term are held in memory as a bitmask of 15 minute
+slots for each date, so checking whether someone is free for every lesson of a request is a few
+bitwise operations rather than a query.
+
+Requests with the fewest possible times are placed first, each with the least busy teacher who is
+free, preferring a teacher who already teaches the client. When a request can't be placed, a
+request placed earlier in the run which is in the way is moved to another time or teacher,
+like following an augmenting path when building a matching.
+
+The matches are only a proposal, nothing is booked until book_matches() is called with the ones
+which were accepted.
+"""
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from django.db import transaction
+from lessons.models import User, Booking, Request, first_weekday_on_or_after, nth_lesson_date, count_lessons
+from lessons.timetable import (SLOT_MINUTES, DAY_SLOTS, TEACHING_SLOTS, TeachingHours, slot_of, time_of_slot, slots_mask, lesson_mask,
+    time_mask, lesson_starts, count_slots, set_bits)
+from lessons.bookings import book_all
+from lessons.scheduling import LessonTimeline, find_clash
+
+# The most lesson times looked at when trying to move other requests out of the way of one request
+MAX_MOVES = 10
+
+# ---- Availability
+
+DAY_PATTERN = re.compile(r'\b(mon(?:day)?|tues?(?:day)?|wed(?:nesday)?|thu(?:rs?)?(?:day)?|fri(?:day)?|sat(?:urday)?|sun(?:day)?)s?\b')
+DAY_NUMBERS = {'mon': 0, 'tue': 1, 'wed': 2, 'thu': 3, 'fri': 4, 'sat': 5, 'sun': 6}
+DAY_GROUPS = {
+    re.compile(r'\bweekdays?\b'): [0, 1, 2, 3, 4],
+    re.compile(r'\bweekends?\b'): [5, 6],
+}
+PARTS_OF_DAY = {
+    re.compile(r'\bmornings?\b'): (time(9), time(12)),
+    re.compile(r'\bafternoons?\b'): (time(12), time(17)),
+    re.compile(r'\bevenings?\b'): (time(17), time(20)),
+}
+
+CLOCK = r'(\d{1,2})(?:[:.](\d{2}))?\s*(am|pm)?'
+TIME_RANGE = re.compile(rf'\b{CLOCK}\s*(?:-|to|until|till)\s*{CLOCK}')
+AFTER_TIME = re.compile(rf'\b(?:after|from)\s+{CLOCK}')
+BEFORE_TIME = re.compile(rf'\b(?:before|until|till)\s+{CLOCK}')
+ANY_TIME = re.compile(r'\b(any|anytime|flexible)\b')
+
+""" Read a clock time, where hours without am or pm before 8 are taken to be in the afternoon"""
+def clock_slot(hour, minute, meridiem):
+    hour = int(hour)
+    if meridiem == 'pm' and hour < 12 or meridiem is None and 1 <= hour < 8:
+        hour += 12
+    elif meridiem == 'am' and hour == 12:
+        hour = 0
+    return min(hour * 60 + int(minute or 0), 24 * 60) // SLOT_MINUTES
+
+@dataclass(frozen=True)
+class Availability:
+    """ The slots a client can have lessons in on each day of the week, Monday first"""
+    masks: tuple
+    # False if nothing in the text could be read, in which case any time in the teaching day is assumed
+    understood: bool
+
+"""
+Read when a client is available from the free text of a request, eg 'Mondays and Wednesdays after 4pm'
+
+Days and times are both optional, and every time given applies to every day given.
+"""
+def parse_availability(text):
+    text = text.lower()
+
+    windows = []
+    for match in TIME_RANGE.finditer(text):
+        start_hour, start_minute, start_meridiem, end_hour, end_minute, end_meridiem = match.groups()
+        # In '4-6pm' the pm applies to both times
+        windows.append((clock_slot(start_hour, start_minute, start_meridiem or end_meridiem), clock_slot(end_hour, end_minute, end_meridiem)))
+    text = TIME_RANGE.sub(' ', text)
+    for match in AFTER_TIME.finditer(text):
+        windows.append((clock_slot(*match.groups()), 24 * 60 // SLOT_MINUTES))
+    for match in BEFORE_TIME.finditer(text):
+        windows.append((0, clock_slot(*match.groups())))
+    for pattern, (start, end) in PARTS_OF_DAY.items():
+        if pattern.search(text):
+            windows.append((slot_of(start), slot_of(end)))
+
+    days = {DAY_NUMBERS[match.group(1)[:3]] for match in DAY_PATTERN.finditer(text)}
+    for pattern, group in DAY_GROUPS.items():
+        if pattern.search(text):
+            days.update(group)
+
+    understood = bool(windows or days or ANY_TIME.search(text))
+    slots = 0
+    for start, end in windows:
+        slots |= slots_mask(start, end)
+    slots = (slots or TEACHING_SLOTS) & TEACHING_SLOTS
+    return Availability(tuple(slots if not days or day in days else 0 for day in range(7)), understood)
+
+# ---- Diaries of lessons
+
+class Diary:
+    """
+    The slots a teacher or client is busy in on each date.
+
+    Lessons which are already booked are fixed, the lessons of matches can be removed again.
+    """
+    def __init__(self):
+        self.fixed = defaultdict(int)
+        self.busy = defaultdict(int)
+        self.matches = defaultdict(list)
+        self.lessons = 0
+        # The busy slots of each tuple of dates looked up since the diary last changed,
+        # requests with the same interval and number of lessons on the same weekday share their dates
+        self.busy_cache = {}
+
+    def add_booking(self, dates, mask):
+        for lesson_date in dates:
+            self.fixed[lesson_date] |= mask
+            self.busy[lesson_date] |= mask
+        self.lessons += len(dates)
+        self.busy_cache.clear()
+
+    """ Mark slots the teacher can't teach in as busy"""
+    def block(self, day, mask):
+        self.fixed[day] |= mask
+        self.busy[day] |= mask
+        self.busy_cache.clear()
+
+    def add_match(self, match):
+        mask = match.mask
+        for lesson_date in match.dates:
+            self.busy[lesson_date] |= mask
+            self.matches[lesson_date].append(match)
+        self.lessons += len(match.dates)
+        self.busy_cache.clear()
+
+    def remove_match(self, match):
+        mask = match.mask
+        for lesson_date in match.dates:
+            self.busy[lesson_date] &= ~mask
+            self.matches[lesson_date].remove(match)
+        self.lessons -= len(match.dates)
+        self.busy_cache.clear()
+
+    """ Get the slots which are busy on any of a tuple of dates"""
+    def busy_on(self, dates):
+        busy = self.busy_cache.get(dates)
+        if busy is None:
+            busy = 0
+            for lesson_date in dates:
+                busy |= self.busy.get(lesson_date, 0)
+            self.busy_cache[dates] = busy
+        return busy
+
+    """ Get the slots taken by booked lessons on any of the dates"""
+    def fixed_on(self, dates):
+        fixed = 0
+        for lesson_date in dates:
+            fixed |= self.fixed.get(lesson_date, 0)
+        return fixed
+
+    """ Get the matches with lessons in the slots of the mask on any of the dates"""
+    def matches_in(self, dates, mask):
+        return {match for lesson_date in dates for match in self.matches.get(lesson_date, []) if match.mask & mask}
+
+@dataclass(eq=False)
+class Match:
+    """ A teacher and lesson time proposed for a request"""
+    request: Request
+    teacher_id: int
+    date: date
+    time: time
+    lessons: int
+    # False if the request's availability couldn't be read and any time was assumed
+    availability_understood: bool = True
+    # The teacher, for showing the match
+    teacher: User = None
+
+    @property
+    def dates(self):
+        return tuple(nth_lesson_date(self.date, n, self.request.days_between_lessons) for n in range(self.lessons))
+
+    @property
+    def mask(self):
+        return time_mask(self.time, self.request.duration)
+
+    """ A string identifying the match, used to accept it from a form"""
+    @property
+    def key(self):
+        return f'{self.request.id}/{self.teacher_id}/{self.date.isoformat()}/{self.time:%H:%M}/{self.lessons}'
+
+""" Read the request id, teacher id, first lesson date, time and number of lessons from the key of a match"""
+def parse_match_key(key):
+    request_id, teacher_id, first_date, lesson_time, lessons = key.split('/')
+    return int(request_id), int(teacher_id), date.fromisoformat(first_date), datetime.strptime(lesson_time, '%H:%M').time(), int(lessons)
+
+@dataclass
+class Proposal:
+    """ The matches proposed for the open requests of a term, and the requests which couldn't be matched with the reason why"""
+    term: object
+    matches: list
+    unmatched: list
+
+class Matcher:
+    """
+    Places requests with teachers, keeping a diary for every teacher and client
+
+    The times teachers can't teach, from their teaching hours, are busy in their diaries.
+    """
+
+    def __init__(self, teachers, bookings, start, end, hours=None):
+        self.start = start
+        self.end = end
+        self.teachers = list(teachers)
+        self.teacher_diaries = {teacher.id: Diary() for teacher in self.teachers}
+        self.client_diaries = defaultdict(Diary)
+        # The clients each teacher teaches, who are matched with them again if possible
+        self.taught = defaultdict(set)
+        # Increased whenever a request is matched, so requests which couldn't be matched since are known to still not fit
+        self.version = 0
+        self.failed = {}
+        if hours is not None:
+            for teacher in self.teachers:
+                if hours.customised(teacher.id):
+                    for day in range((end - start).days + 1):
+                        day = start + timedelta(day)
+                        self.teacher_diaries[teacher.id].block(day, DAY_SLOTS & ~hours.on(teacher.id, day))
+        for booking in bookings:
+            dates = booking.dates_between(start, end)
+            mask = time_mask(booking.time, booking.duration)
+            if booking.teacher_id in self.teacher_diaries:
+                self.teacher_diaries[booking.teacher_id].add_booking(dates, mask)
+            self.client_diaries[booking.client_id].add_booking(dates, mask)
+            self.taught[booking.teacher_id].add(booking.client_id)
+
+    """ Get the dates of a request's lessons if they start on a day of the week, or () if none fit in the term"""
+    def lesson_dates(self, request, weekday):
+        first = first_weekday_on_or_after(self.start, weekday)
+        lessons = min(request.lessons, count_lessons(first, self.end, request.days_between_lessons))
+        return tuple(nth_lesson_date(first, n, request.days_between_lessons) for n in range(lessons))
+
+    """ Get the teachers in the order they are tried for a request, least busy first"""
+    def teacher_order(self, request):
+        return sorted(self.teachers, key=lambda teacher: (
+            request.client_id not in self.taught[teacher.id],
+            self.teacher_diaries[teacher.id].lessons,
+            teacher.id))
+
+    """ Find the least busy teacher who is free at a time the client is, and the earliest such time, without moving anything"""
+    def find(self, request, availability):
+        client = self.client_diaries[request.client_id]
+        weeks = []
+        for weekday, allowed in enumerate(availability.masks):
+            dates = self.lesson_dates(request, weekday) if allowed else ()
+            if dates:
+                weeks.append((dates, allowed & ~client.busy_on(dates)))
+
+        for teacher in self.teacher_order(request):
+            diary = self.teacher_diaries[teacher.id]
+            for dates, free in weeks:
+                starts = lesson_starts(free & ~diary.busy_on(dates), request.duration)
+                if starts:
+                    start = next(set_bits(starts))
+                    return Match(request, teacher.id, dates[0], time_of_slot(start), len(dates), availability.understood)
+        return None
+
+    def place(self, match):
+        self.teacher_diaries[match.teacher_id].add_match(match)
+        self.client_diaries[match.request.client_id].add_match(match)
+        self.taught[match.teacher_id].add(match.request.client_id)
+
+    def unplace(self, match):
+        self.teacher_diaries[match.teacher_id].remove_match(match)
+        self.client_diaries[match.request.client_id].remove_match(match)
+
+    """
+    Find a time for a request by moving one match which is in the way to another free time or teacher
+
+    Returns a tuple of the new match for the request, the match which was moved and the match which replaces it,
+    all of which have been placed, or None if nothing could be moved.
+    """
+    def find_by_moving(self, request, availability, availabilities):
+        tries = 0
+        client = self.client_diaries[request.client_id]
+        for teacher in self.teacher_order(request):
+            diary = self.teacher_diaries[teacher.id]
+            for weekday in range(7):
+                allowed = availability.masks[weekday]
+                dates = self.lesson_dates(request, weekday) if allowed else ()
+                if not dates:
+                    continue
+                # Only matches with the teacher can be moved, not booked lessons or the client's lessons
+                free = allowed & ~diary.fixed_on(dates) & ~client.busy_on(dates)
+                for start in set_bits(lesson_starts(free, request.duration)):
+                    tries += 1
+                    if tries > MAX_MOVES:
+                        return None
+                    blocking = diary.matches_in(dates, lesson_mask(start, request.duration))
+                    if len(blocking) != 1:
+                        continue
+
+                    moved = blocking.pop()
+                    self.unplace(moved)
+                    match = Match(request, teacher.id, dates[0], time_of_slot(start), len(dates), availability.understood)
+                    self.place(match)
+                    replacement = self.find(moved.request, availabilities[moved.request.id])
+                    if replacement is not None:
+                        self.place(replacement)
+                        return match, moved, replacement
+                    self.unplace(match)
+                    self.place(moved)
+        return None
+
+    """ Match as many requests as possible, returning the matches and the requests which couldn't be matched with the reason why"""
+    def match(self, requests):
+        availabilities = {request.id: parse_availability(request.availability) for request in requests}
+        # The requests which can have lessons at the fewest times are the hardest to place, so go first
+        flexibility = {request.id: sum(count_slots(lesson_starts(mask, request.duration)) for mask in availabilities[request.id].masks)
+            for request in requests}
+        ordered = sorted(requests, key=lambda request: (flexibility[request.id], request.id))
+
+        matches = {}
+        unmatched = []
+        for request in ordered:
+            availability = availabilities[request.id]
+            if not any(self.lesson_dates(request, weekday) for weekday in range(7) if availability.masks[weekday]):
+                unmatched.append((request, 'No lessons fit in the rest of the term at the times given'))
+                continue
+
+            # A request like one which couldn't be matched won't fit either, unless something was matched
+            # since or the client's own lessons made the difference
+            shape = (availability.masks, request.duration, request.days_between_lessons, request.lessons)
+            independent = self.client_diaries[request.client_id].lessons == 0
+            if independent and self.failed.get(shape) == self.version:
+                unmatched.append((request, 'No teacher is free at the times given'))
+                continue
+
+            match = self.find(request, availability)
+            if match is not None:
+                self.place(match)
+                matches[request.id] = match
+                self.version += 1
+                continue
+
+            moved = self.find_by_moving(request, availability, availabilities)
+            if moved is not None:
+                match, old, replacement = moved
+                matches[request.id] = match
+                matches[old.request.id] = replacement
+                self.version += 1
+            else:
+                unmatched.append((request, 'No teacher is free at the times given'))
+                if independent:
+                    self.failed[shape] = self.version
+
+        return sorted(matches.values(), key=lambda match: match.request.id), unmatched
+
+"""
+Propose a teacher and lesson time for every open request, for lessons in a term
+
+Lessons start on or after the start date, which is today by default, or the start of the term if that is later.
+"""
+def propose_matches(term, start=None):
+    start = max(term.start_date, start or date.today())
+    requests = list(Request.objects.filter(fulfilled=False).select_related('client', 'child').order_by('id'))
+    teachers = User.objects.filter(role=User.TEACHER).order_by('id').only('id', 'first_name', 'last_name', 'email', 'role')
+    bookings = (Booking.objects.between(start, term.end_date)
+        .only('client_id', 'teacher_id', 'date', 'lessons', 'days_between_lessons', 'time', 'duration'))
+
+    teachers = list(teachers)
+    hours = TeachingHours.load([teacher.id for teacher in teachers], start, term.end_date)
+    matcher = Matcher(teachers, bookings, start, term.end_date, hours)
+    matches, unmatched = matcher.match(requests)
+    teachers_by_id = {teacher.id: teacher for teacher in matcher.teachers}
+    for match in matches:
+        match.teacher = teachers_by_id[match.teacher_id]
+    return Proposal(term, matches, unmatched)
+
+"""
+Book the accepted matches, creating their bookings and invoices and fulfilling their requests in one transaction
+
+Matches whose request has been fulfilled since, or which now clash with other lessons or the teacher's hours, are skipped.
+Returns the bookings made and the ids of the requests whose matches were skipped.
+"""
+def book_matches(keys):
+    matches = []
+    for key in keys:
+        try:
+            matches.append(parse_match_key(key))
+        except ValueError:
+            continue
+    if not matches:
+        return [], []
+
+    with transaction.atomic():
+        requests = Request.objects.select_for_update().filter(pk__in=[match[0] for match in matches], fulfilled=False).in_bulk()
+        teachers = User.objects.filter(role=User.TEACHER, pk__in=[match[1] for match in matches]).only('id')
+
+        # Load the lessons which the new bookings could clash with
+        start = min(first_date for _, _, first_date, _, _ in matches)
+        end = max((nth_lesson_date(first_date, lessons - 1, requests[request_id].days_between_lessons)
+            for request_id, _, first_date, _, lessons in matches if request_id in requests and lessons > 0), default=start)
+        bookings = list(Booking.objects.between(start, end)
+            .only('client_id', 'teacher_id', 'date', 'lessons', 'days_between_lessons', 'time', 'duration'))
+        teachers = list(teachers)
+        hours = TeachingHours.load([teacher.id for teacher in teachers], start, end)
+        matcher = Matcher(teachers, bookings, start, end, hours)
+        teacher_bookings, client_bookings = defaultdict(list), defaultdict(list)
+        for booking in bookings:
+            teacher_bookings[booking.teacher_id].append(booking)
+            client_bookings[booking.client_id].append(booking)
+
+        booked = []
+        skipped = []
+        for request_id, teacher_id, first_date, lesson_time, lessons in matches:
+            request = requests.pop(request_id, None)
+            if request is None or teacher_id not in matcher.teacher_diaries or lessons < 1:
+                skipped.append(request_id)
+                continue
+            match = Match(request, teacher_id, first_date, lesson_time, lessons)
+            busy = matcher.teacher_diaries[teacher_id].busy_on(match.dates) | matcher.client_diaries[request.client_id].busy_on(match.dates)
+            if busy & match.mask:
+                skipped.append(request_id)
+                continue
+            booking = Booking(client_id=request.client_id, teacher_id=teacher_id, child_id=request.child_id,
+                date=first_date, time=lesson_time, lessons=lessons,
+                days_between_lessons=request.days_between_lessons, duration=request.duration)
+            # book_all() doesn't check for clashes, so check the lessons' exact times as book() does
+            last_date = booking.calculate_end_date()
+            if (find_clash(booking, LessonTimeline(teacher_bookings[teacher_id], first_date, last_date)) is not None
+                    or find_clash(booking, LessonTimeline(client_bookings[request.client_id], first_date, last_date)) is not None):
+                skipped.append(request_id)
+                continue
+            matcher.place(match)
+            teacher_bookings[teacher_id].append(booking)
+            client_bookings[request.client_id].append(booking)
+            booked.append((request, booking))
+
+        book_all([booking for _, booking in booked], [request for request, _ in booked])
+
+    return [booking for _, booking in booked], skipped
@@ -0,0 +1,118 @@
+"""
+Keeps a compact copy of each logged in user in the cache, so pages which only need to know
+who the user is and what role they have don't have to load the user from the database.
+
+The copy is deleted by a signal whenever the user is saved or deleted. That only reaches other processes
+when the cache is shared, otherwise they keep using their copy until it expires after PRINCIPAL_TIMEOUT.
+Staff roles are always checked against the database, see current_role.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user, get_user_model, SESSION_KEY, HASH_SESSION_KEY
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import connection
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import LazyObject, empty
+from impala.caches import is_shared
+
+PRINCIPAL_KEY = 'user_principal:{}'
+
+# Seconds a process keeps its own copy of a user for, when a change made by another process can't delete it
+PRINCIPAL_TIMEOUT = 30
+
+""" Get how long a user's principal is cached for"""
+def principal_timeout():
+    return DEFAULT_TIMEOUT if is_shared(settings.CACHES['default']) else PRINCIPAL_TIMEOUT
+
+""" Get the key a user's principal is cached under"""
+def principal_key(user_id):
+    return PRINCIPAL_KEY.format(user_id)
+
+""" Get the compact copy of a user which is cached"""
+def principal_of(user):
+    return {
+        'id': user.id,
+        'pk': user.pk,
+        'role': user.role,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'email': user.email,
+        'role_name': user.role_name,
+        # Changes when the password changes, which logs out the user's other sessions
+        'session_hash': user.get_session_auth_hash(),
+    }
+
+""" Stop using the cached copy of a user after they have changed"""
+def forget_principal(user_id):
+    cache.delete(principal_key(user_id))
+
+""" Stop using the cached copies of several users after they have changed"""
+def forget_principals(user_ids):
+    cache.delete_many([principal_key(user_id) for user_id in user_ids])
+
+"""
+Get a user's role from the database, or None if they have been deactivated or deleted
+
+A cached copy of the user can be out of date for a while, which mustn't let a user who has lost a
+staff role keep using it.
+"""
+def current_role(user):
+    if not isinstance(user, CachedUser) or user._wrapped is not empty:
+        # Loaded from the database for this request
+        return user.role if user.is_active else None
+    found = get_user_model().objects.filter(pk=user.pk).values_list('role', 'is_active').first()
+    if found is None or not found[1]:
+        return None
+    return found[0]
+
+class CachedUser(LazyObject):
+    """
+    A logged in user which answers questions about their id, role, name and email from the cache,
+    only loading the user from the database when anything else about them is needed
+    """
+    is_authenticated = True
+    is_anonymous = False
+    # Only active users are cached, and the copy expires after a user is deactivated
+    is_active = True
+
+    def __init__(self, principal, request):
+        super().__init__()
+        self.__dict__['_principal'] = principal
+        self.__dict__['_request'] = request
+
+    def _setup(self):
+        self._wrapped = get_user(self._request)
+
+    def __getattr__(self, name):
+        principal = self.__dict__['_principal']
+        if self._wrapped is empty and name in principal and name != 'session_hash':
+            return principal[name]
+        return super().__getattr__(name)
+
+    # isinstance() checks, eg by templates and queries, don't need the user to be loaded
+    @property
+    def __class__(self):
+        return get_user_model()
+
+    # Templates try looking attributes up as keys first, users can't be subscripted
+    # so there is no need to load the user to find that out
+    def __getitem__(self, key):
+        raise TypeError("'User' object is not subscriptable")
+
+class CachedUserMiddleware:
+    """ Replaces request.user with a CachedUser when the logged in user is in the cache, must come after AuthenticationMiddleware"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        user_id = request.session.get(SESSION_KEY)
+        if user_id is not None:
+            principal = cache.get(principal_key(user_id))
+            session_hash = request.session.get(HASH_SESSION_KEY) or ''
+            if principal is not None and constant_time_compare(principal['session_hash'], session_hash):
+                request.user = CachedUser(principal, request)
+            elif request.user.is_authenticated and not connection.in_atomic_block:
+                # Only cache users which have been committed, otherwise a change which is
+                # rolled back could stay in the cache
+                cache.set(principal_key(request.user.pk), principal_of(request.user), principal_timeout())
+        return self.get_response(request)
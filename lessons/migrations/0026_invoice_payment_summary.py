@@ -0,0 +1,52 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:30
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_payment_summaries(apps, schema_editor):
+    Invoice = apps.get_model('lessons', 'Invoice')
+    Transfer = apps.get_model('lessons', 'Transfer')
+    money = models.DecimalField(max_digits=19, decimal_places=2)
+
+    def transfer_total(refund):
+        total = (Transfer.objects.filter(invoice=OuterRef('pk'), refund=refund)
+            .order_by()
+            .values('invoice')
+            .annotate(total=Sum('amount'))
+            .values('total'))
+        return Coalesce(Subquery(total, output_field=money), Value(Decimal(0)), output_field=money)
+
+    Invoice.objects.update(
+        paid_total=transfer_total(False),
+        refunded_total=transfer_total(True),
+        net_paid_total=transfer_total(False) - transfer_total(True),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0025_alter_child_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='net_paid_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=19),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='paid_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=19),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='refunded_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=19),
+        ),
+        migrations.RunPython(backfill_payment_summaries, migrations.RunPython.noop),
+    ]
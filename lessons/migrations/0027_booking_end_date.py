@@ -0,0 +1,40 @@
+# Generated by Django 4.1.13 on 2026-10-18 16:36
+
+from datetime import timedelta
+from django.db import migrations, models
+from django.db.models import DateField, DurationField, ExpressionWrapper, F, Value
+
+
+def backfill_end_dates(apps, schema_editor):
+    Booking = apps.get_model('lessons', 'Booking')
+    span = ExpressionWrapper((F('lessons') - 1) * F('days_between_lessons') * Value(timedelta(1)), output_field=DurationField())
+    Booking.objects.update(end_date=ExpressionWrapper(F('date') + span, output_field=DateField()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0026_invoice_payment_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='end_date',
+            field=models.DateField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_end_dates, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='booking',
+            name='end_date',
+            field=models.DateField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['teacher', 'date', 'end_date'], name='booking_teacher_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['client', 'date', 'end_date'], name='booking_client_dates_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0027_booking_end_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0028_booking_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['role', 'id'], name='user_role_idx'),
+        ),
+    ]
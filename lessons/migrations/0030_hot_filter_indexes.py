@@ -0,0 +1,49 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0029_user_role_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='request',
+            name='client',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='invoice',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, to='lessons.invoice'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['date', 'id'], name='invoice_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(fields=['client', 'fulfilled'], name='request_client_fulfilled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='request',
+            index=models.Index(condition=models.Q(('fulfilled', False)), fields=['id'], name='request_unfulfilled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='term',
+            index=models.Index(fields=['start_date', 'end_date'], name='term_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['invoice', 'refund', 'amount'], name='transfer_invoice_refund_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['date', 'id'], name='transfer_date_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0030_hot_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeacherAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.BinaryField(max_length=84)),
+                ('teacher', models.OneToOneField(limit_choices_to={'role': 'TEACHER'}, on_delete=django.db.models.deletion.CASCADE, related_name='availability', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AvailabilityException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('slots', models.BinaryField(max_length=12)),
+                ('teacher', models.ForeignKey(limit_choices_to={'role': 'TEACHER'}, on_delete=django.db.models.deletion.CASCADE, related_name='availability_exceptions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('teacher', 'date')},
+            },
+        ),
+    ]
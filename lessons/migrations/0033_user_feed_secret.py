@@ -0,0 +1,29 @@
+# Generated by Django 4.1.13 on 2026-10-18 17:57
+
+from django.db import migrations, models
+import lessons.models
+
+
+def give_each_user_a_feed_secret(apps, schema_editor):
+    # The default is only worked out once for the existing rows, so they would all share a secret
+    User = apps.get_model('lessons', 'User')
+    users = list(User.objects.only('id'))
+    for user in users:
+        user.feed_secret = lessons.models.new_feed_secret()
+    User.objects.bulk_update(users, ['feed_secret'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0032_job_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_secret',
+            field=models.CharField(default=lessons.models.new_feed_secret, editable=False, max_length=32),
+        ),
+        migrations.RunPython(give_each_user_a_feed_secret, migrations.RunPython.noop),
+    ]
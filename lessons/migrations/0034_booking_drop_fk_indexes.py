@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-18 18:07
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lessons', '0033_user_feed_secret'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='client',
+            field=models.ForeignKey(db_index=False, limit_choices_to={'role': 'STUDENT'}, on_delete=django.db.models.deletion.CASCADE, related_name='client', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='teacher',
+            field=models.ForeignKey(db_index=False, limit_choices_to={'role': 'TEACHER'}, on_delete=django.db.models.deletion.CASCADE, related_name='teacher', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
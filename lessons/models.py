@@ -1,12 +1,64 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 from datetime import timedelta, date
-from django.db.models import Sum
+from django.db.models import Sum, Q, F, OuterRef, Subquery, Value, DecimalField, Prefetch
+from django.db.models.functions import Coalesce
 from decimal import Decimal
+from bisect import bisect_right
+from time import monotonic
+import secrets
+
+# Every stored amount of money uses the same precision
+MONEY = DecimalField(max_digits=19, decimal_places=2)
+
+""" Correlated subquery summing a column over the rows of a queryset that reference the outer row, 0 if there are none"""
+def summed(queryset, field, column='amount', **filters):
+    # Group by the referencing field so the subquery returns a single total
+    # rather than joining, which would repeat outer amounts once per inner row
+    total = (queryset.filter(**{field: OuterRef('pk')}, **filters)
+        .order_by()
+        .values(field)
+        .annotate(total=Sum(column))
+        .values('total'))
+    return Coalesce(Subquery(total, output_field=MONEY), Value(Decimal(0)), output_field=MONEY)
+
+class UserQuerySet(models.QuerySet):
+    def students(self):
+        return self.filter(role=User.STUDENT)
+
+    """
+    Annotate each user with their invoiced, paid, refunded, net paid and owed totals in a single query
+
+    If a date range is given, only invoices issued and transfers made within it are counted
+    """
+    def with_balances(self, start=None, end=None):
+        if start is None and end is None:
+            totals = dict(
+                invoiced=summed(Invoice.objects, 'booking__client'),
+                paid=summed(Invoice.objects, 'booking__client', 'paid_total'),
+                refunded=summed(Invoice.objects, 'booking__client', 'refunded_total'),
+            )
+        else:
+            # The invoice payment summaries cover every transfer, so sum the transfers in the range instead
+            dates = {}
+            if start is not None:
+                dates['date__gte'] = start
+            if end is not None:
+                dates['date__lte'] = end
+            totals = dict(
+                invoiced=summed(Invoice.objects, 'booking__client', **dates),
+                paid=summed(Transfer.objects, 'invoice__booking__client', refund=False, **dates),
+                refunded=summed(Transfer.objects, 'invoice__booking__client', refund=True, **dates),
+            )
+        return self.annotate(**totals).annotate(
+            net_paid=F('paid') - F('refunded'),
+        ).annotate(
+            owed=F('invoiced') - F('net_paid'),
+        )
 
-class CustomUserManager(BaseUserManager):
+class CustomUserManager(BaseUserManager.from_queryset(UserQuerySet)):
     def create_user(self, email, password=None, **extra_fields):
         extra_fields.setdefault('is_staff', False)
         extra_fields.setdefault('is_superuser', False)
@@ -38,6 +90,10 @@ class CustomUserManager(BaseUserManager):
         user.save(using=self._db)
         return user
 
+""" Get a new secret for the url of a user's calendar feed"""
+def new_feed_secret():
+    return secrets.token_urlsafe(16)
+
 class User(AbstractUser):
     """User Model"""
     username = None # Get rid of default username field
@@ -58,14 +114,25 @@ class User(AbstractUser):
         (TEACHER, 'Teacher'),
         (STUDENT, 'Student')
     ]
+    # Roles which can see and change other users' data
+    STAFF_ROLES = [DIRECTOR, SUPER_ADMIN, ADMIN]
     #director do what
     #
     #super-admin can create, edit and delete admin accounts
     #
     role = models.CharField(max_length=30, choices=ROLE_CHOICES, default=STUDENT)
 
+    # Part of the calendar feed url, replaced to stop a feed url which has been shared from working
+    feed_secret = models.CharField(max_length=32, default=new_feed_secret, editable=False)
+
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        # Used to page through the users with a role on the permissions page
+        indexes = [
+            models.Index(fields=['role', 'id'], name='user_role_idx'),
+        ]
+
     USERNAME_FIELD = 'email' # Use email as the username field
     REQUIRED_FIELDS = []
 
@@ -112,6 +179,22 @@ class Interval(models.IntegerChoices):
     WEEK1 = 7, 'Every week'
     WEEk2 = 14, 'Every 2 weeks'
 
+# Lesson calendar arithmetic, shared by bookings and the booking form
+
+""" Get the first date on or after the given date which falls on a day of the week, where Monday == 0 ... Sunday == 6"""
+def first_weekday_on_or_after(start, weekday):
+    return start + timedelta((int(weekday) - start.weekday()) % 7)
+
+""" Get the date of the nth lesson (counting from 0) of lessons starting on the first date"""
+def nth_lesson_date(first, n, days_between_lessons):
+    return first + timedelta(days_between_lessons * n)
+
+""" Count the lessons starting on the first date which fall on or before the last date"""
+def count_lessons(first, last, days_between_lessons):
+    if last < first:
+        return 0
+    return (last - first).days // days_between_lessons + 1
+
 # Possible durations for lessons 
 class Duration(models.IntegerChoices):
     MIN30 = 30, '30 minutes'
@@ -130,7 +213,8 @@ class Child(models.Model):
         return f'{self.first_name} {self.last_name}'
 
 class Request(models.Model):
-    client =  models.ForeignKey(User, blank=False, on_delete=models.CASCADE)
+    # Indexed by request_client_fulfilled_idx
+    client =  models.ForeignKey(User, blank=False, on_delete=models.CASCADE, db_index=False)
     availability = models.CharField(max_length=1000, blank=False)
     lessons = models.IntegerField(blank=False, validators=[MinValueValidator(1)])
     days_between_lessons = models.IntegerField(blank=False, choices=Interval.choices, default=Interval.WEEK1)
@@ -140,6 +224,15 @@ class Request(models.Model):
 
     child = models.ForeignKey(Child, null=True, blank=True, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Used to split a client's requests into active and fulfilled ones
+            models.Index(fields=['client', 'fulfilled'], name='request_client_fulfilled_idx'),
+            # Used to page through the requests which still need a booking. They are few compared to the
+            # fulfilled requests, which are paged through in id order without an index of their own
+            models.Index(fields=['id'], condition=Q(fulfilled=False), name='request_unfulfilled_idx'),
+        ]
+
     def clean(self):
         # Make sure client is not requesting lessons for another client's child
         if self.child is not None and self.child.parent != self.client:
@@ -156,27 +249,63 @@ class Request(models.Model):
         return self.get_duration_display()
 
 
+class BookingQuerySet(models.QuerySet):
+    """ Load each booking's invoice in one extra query, for get_invoice to use"""
+    def with_invoice(self):
+        invoices = Invoice.objects.only('id', 'booking', 'invoice_ref', 'amount', *Invoice.PAYMENT_SUMMARY_FIELDS).order_by('id')
+        return self.prefetch_related(Prefetch('invoice_set', queryset=invoices, to_attr='prefetched_invoices'))
+
+    """ Get the bookings with lessons between the start and end dates (inclusive)"""
+    def between(self, start, end):
+        return self.filter(date__lte=end, end_date__gte=start)
+
+    """ Get a (date, booking) pair for each lesson between the start and end dates, ordered by date and time"""
+    def occurrences(self, start, end):
+        lessons = [(d, booking) for booking in self.between(start, end) for d in booking.dates_between(start, end)]
+        lessons.sort(key=lambda lesson: (lesson[0], lesson[1].time))
+        return lessons
+
 class Booking(models.Model):
-    client =  models.ForeignKey(User, blank=False, related_name = 'client', on_delete=models.CASCADE, limit_choices_to={'role': User.STUDENT})
+    # Indexed by booking_client_dates_idx
+    client =  models.ForeignKey(User, blank=False, related_name = 'client', on_delete=models.CASCADE, limit_choices_to={'role': User.STUDENT}, db_index=False)
     lessons = models.IntegerField(blank=False, validators=[MinValueValidator(1)])
     days_between_lessons = models.IntegerField(blank=False, choices=Interval.choices, default=Interval.WEEK1)
     duration = models.IntegerField(blank=False, choices=Duration.choices, default=Duration.MIN60)
-    teacher = models.ForeignKey(User, blank=False, related_name = 'teacher', on_delete=models.CASCADE, limit_choices_to={'role': User.TEACHER})
+    # Indexed by booking_teacher_dates_idx
+    teacher = models.ForeignKey(User, blank=False, related_name = 'teacher', on_delete=models.CASCADE, limit_choices_to={'role': User.TEACHER}, db_index=False)
     date = models.DateField(blank=False) # Start Date
+    end_date = models.DateField(editable=False) # Date of the last lesson, kept in sync when saved
     time = models.TimeField(blank=False)
     child = models.ForeignKey(Child, null=True, blank=True, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True) # Used by calendar feeds to tell when a booking has changed
+
+    objects = BookingQuerySet.as_manager()
+
+    class Meta:
+        # Used to find a teacher's or client's bookings with lessons in a date range
+        indexes = [
+            models.Index(fields=['teacher', 'date', 'end_date'], name='booking_teacher_dates_idx'),
+            models.Index(fields=['client', 'date', 'end_date'], name='booking_client_dates_idx'),
+        ]
 
     def clean(self):
         # Make sure the child parent matches the client
         if self.child is not None and self.child.parent != self.client:
             raise ValidationError("Child must belong to client")
 
+    def save(self, *args, **kwargs):
+        self.end_date = self.calculate_end_date()
+        super().save(*args, **kwargs)
+
     def invoice_reference(self):
         #Invoices have a unique reference number consisting of: [student number] - [invoice number]
-        return f"{self.client.id}-{self.id}"
+        return f"{self.client_id}-{self.id}"
 
     @property
     def get_invoice(self):
+        # Use the invoice loaded by BookingQuerySet.with_invoice() if there is one
+        if hasattr(self, 'prefetched_invoices'):
+            return self.prefetched_invoices[0] if self.prefetched_invoices else None
         return Invoice.objects.filter(booking=self).first()
 
     """ Calculate the price of the lesson in a booking"""
@@ -184,13 +313,26 @@ class Booking(models.Model):
         # Each lesson is £30 an hour
         return Decimal(30 * (Decimal(self.lessons) * (Decimal(self.duration)/Decimal(60))))
     
+    """ Calculate the date of the last lesson in the booking"""
+    def calculate_end_date(self):
+        start = self._meta.get_field('date').to_python(self.date)
+        return nth_lesson_date(start, int(self.lessons) - 1, int(self.days_between_lessons))
+
     # Return day of the week, where Monday == 0 ... Sunday == 6
     def day(self):
         return self.date.weekday()
 
     # Get the dates of of the lessons in the booking
     def dates(self):
-        return [self.date + timedelta(self.days_between_lessons*n) for n in range(self.lessons)]
+        return [nth_lesson_date(self.date, n, self.days_between_lessons) for n in range(self.lessons)]
+
+    # Get the dates of the lessons in the booking between the start and end dates (inclusive)
+    def dates_between(self, start, end):
+        # Work out the numbers of the first and last lessons in the range
+        # rather than going through every lesson in the booking
+        first = max(0, -((self.date - start).days // self.days_between_lessons))
+        last = min(self.lessons, count_lessons(self.date, end, self.days_between_lessons)) - 1
+        return [nth_lesson_date(self.date, n, self.days_between_lessons) for n in range(first, last + 1)]
 
     """ String that can be used to display the interval between lessons"""
     @property
@@ -202,6 +344,24 @@ class Booking(models.Model):
     def duration_name(self):
         return self.get_duration_display()
 
+class InvoiceQuerySet(models.QuerySet):
+    """ Recalculate the stored payment summary of each invoice from its transfers in a single update"""
+    def update_payment_summaries(self):
+        paid = summed(Transfer.objects, 'invoice', refund=False)
+        refunded = summed(Transfer.objects, 'invoice', refund=True)
+        return self.update(paid_total=paid, refunded_total=refunded, net_paid_total=paid - refunded)
+
+    """ Get the invoices whose stored payment summary does not match their transfers"""
+    def with_payment_summary_drift(self):
+        return self.annotate(
+            actual_paid=summed(Transfer.objects, 'invoice', refund=False),
+            actual_refunded=summed(Transfer.objects, 'invoice', refund=True),
+        ).exclude(
+            paid_total=F('actual_paid'),
+            refunded_total=F('actual_refunded'),
+            net_paid_total=F('actual_paid') - F('actual_refunded'),
+        )
+
 class Invoice(models.Model):
     booking = models.ForeignKey(Booking, blank=False, on_delete=models.DO_NOTHING)
     invoice_ref = models.CharField(max_length=20, blank=False)
@@ -210,30 +370,80 @@ class Invoice(models.Model):
     amount = models.DecimalField(blank=False, max_digits=19, decimal_places=2, validators=[MinValueValidator(1)])
     refund = models.BooleanField(blank=False, default=False)
 
+    # Payment summary, kept up to date whenever a transfer for the invoice is saved or deleted
+    paid_total = models.DecimalField(max_digits=19, decimal_places=2, default=0, editable=False)
+    refunded_total = models.DecimalField(max_digits=19, decimal_places=2, default=0, editable=False)
+    net_paid_total = models.DecimalField(max_digits=19, decimal_places=2, default=0, editable=False)
+
+    PAYMENT_SUMMARY_FIELDS = ['paid_total', 'refunded_total', 'net_paid_total']
+
+    objects = InvoiceQuerySet.as_manager()
+
+    class Meta:
+        # Used to export the invoices issued in a date range
+        indexes = [
+            models.Index(fields=['date', 'id'], name='invoice_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The payment summary is only written by update_payment_summaries. Saving the copy loaded with the
+        # invoice could undo a transfer saved since, so an invoice which already exists is saved without it
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.PAYMENT_SUMMARY_FIELDS]
+        super().save(*args, **kwargs)
+
     """ Check the net amount the user has paid of the invoice"""
     def net_paid(self):
-        amount_paid = (Transfer.objects.filter(invoice=self, refund=False).aggregate(Sum('amount'))['amount__sum'] or 0)
-        amount_refunded = (Transfer.objects.filter(invoice=self, refund=True).aggregate(Sum('amount'))['amount__sum'] or 0)
-        return amount_paid - amount_refunded
+        return self.net_paid_total
 
     """ Check if the invoice has been fully paid"""
     def paid(self):
-        return self.net_paid() >= self.amount
+        return self.net_paid_total >= self.amount
 
     def __str__(self):
         return str(self.invoice_ref)
 
 class Transfer(models.Model):
-    invoice = models.ForeignKey(Invoice, blank=False, on_delete=models.DO_NOTHING)
+    # Indexed by transfer_invoice_refund_idx
+    invoice = models.ForeignKey(Invoice, blank=False, on_delete=models.DO_NOTHING, db_index=False)
     date = models.DateField(blank=False) # Payment date
     amount = models.DecimalField(blank=False, max_digits=19, decimal_places=2, validators=[MinValueValidator(1)])
     refund = models.BooleanField(blank=False, default=False)
 
+    class Meta:
+        indexes = [
+            # Lets the payment summaries and balances sum an invoice's payments or refunds from the index alone
+            models.Index(fields=['invoice', 'refund', 'amount'], name='transfer_invoice_refund_idx'),
+            # Used to export and total the transfers made in a date range
+            models.Index(fields=['date', 'id'], name='transfer_date_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        transfer = super().from_db(db, field_names, values)
+        # Remember the invoice the transfer was loaded with,
+        # so moving it to another invoice updates both payment summaries
+        transfer._loaded_invoice_id = transfer.__dict__.get('invoice_id')
+        return transfer
+
+    def save(self, *args, **kwargs):
+        # The invoice payment summary is updated by a post_save signal,
+        # so saving inside a transaction keeps the transfer and the summary in step
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
 class Term(models.Model):
     name = models.CharField(max_length=50, blank=False)
     start_date = models.DateField(blank=False)
     end_date = models.DateField(blank=False)
 
+    class Meta:
+        # Used to list terms in order and to find the terms overlapping a date range
+        indexes = [
+            models.Index(fields=['start_date', 'end_date'], name='term_dates_idx'),
+        ]
+
     """ Display the start to end date of a term as string"""
     def __str__(self):
         return self.name + ' ' + self.start_date.strftime('%d/%m/%Y') + '-' + self.end_date.strftime('%d/%m/%Y')
@@ -255,7 +465,141 @@ class Term(models.Model):
             raise ValidationError(f"This term overlaps with {overlapping_terms[0].name}")
 
     def current_term():
-       return Term.objects.filter(start_date__lte=date.today(), end_date__gte=date.today()).first()
+        return term_calendar.containing(date.today())
 
     def next_term():
-        return Term.objects.filter(start_date__gt=date.today()).first()
+        return term_calendar.after(date.today())
+
+class TeacherAvailability(models.Model):
+    """
+    The times a teacher can teach in a usual week, see lessons.timetable
+
+    Stored as a bitset of the 15 minute slots of each day, Monday first, 84 bytes a teacher.
+    """
+    teacher = models.OneToOneField(User, on_delete=models.CASCADE, related_name='availability', limit_choices_to={'role': User.TEACHER})
+    week = models.BinaryField(max_length=84)
+
+class AvailabilityException(models.Model):
+    """ The times a teacher can teach on one date instead of their usual times, no times if they are away"""
+    teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='availability_exceptions', limit_choices_to={'role': User.TEACHER})
+    date = models.DateField()
+    slots = models.BinaryField(max_length=12)
+
+    class Meta:
+        unique_together = ('teacher', 'date')
+
+class Job(models.Model):
+    """ Work queued to be done outside of a request by the run_worker command, see lessons.jobs"""
+    QUEUED = 'QUEUED'
+    RUNNING = 'RUNNING'
+    DONE = 'DONE'
+    FAILED = 'FAILED'
+
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=50)
+    arguments = models.JSONField(default=dict)
+    # Only one job with a key is queued at a time, queuing it again while it waits does nothing
+    dedup_key = models.CharField(max_length=100, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField() # When the job is next due
+    # A running job is given to another worker if it isn't finished by then
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Used by workers to find the jobs which are due
+            models.Index(fields=['status', 'run_at'], name='job_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedup_key'], condition=Q(status='QUEUED'), name='job_queued_dedup_key'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
+
+class TermCalendar:
+    """
+    All terms held in memory sorted by start date, so term lookups don't need the database.
+
+    Saving or deleting a term clears the calendar through signals, but only in the process
+    that made the change, so other processes reload their terms after max_age seconds.
+    """
+    max_age = 60
+
+    def __init__(self):
+        self._uncommitted_change = False
+        self.clear()
+
+    def clear(self):
+        self._loaded = None
+
+    """ Clear the calendar after a term has been saved or deleted"""
+    def changed(self):
+        self.clear()
+        if transaction.get_connection().in_atomic_block:
+            # Stop caching until the change is committed,
+            # otherwise a change which is rolled back would stay in the calendar
+            self._uncommitted_change = True
+            transaction.on_commit(self._committed)
+
+    def _committed(self):
+        self._uncommitted_change = False
+        self.clear()
+
+    def _load(self):
+        if self._uncommitted_change:
+            if transaction.get_connection().in_atomic_block:
+                return self._query()
+            # The transaction with the change has finished without committing
+            self._uncommitted_change = False
+            self.clear()
+
+        loaded = self._loaded
+        if loaded is None or monotonic() - loaded[0] > self.max_age:
+            # Replace everything at once so other threads never see a half built calendar
+            loaded = self._loaded = self._query()
+        return loaded
+
+    def _query(self):
+        terms = list(Term.objects.order_by('start_date'))
+        return (monotonic(), terms, [term.start_date for term in terms], {term.pk: term for term in terms})
+
+    """ Get all terms ordered by start date"""
+    def terms(self):
+        return self._load()[1]
+
+    """ Get the term with the given id, or None if there isn't one"""
+    def get(self, pk):
+        try:
+            return self._load()[3].get(int(pk))
+        except (TypeError, ValueError):
+            return None
+
+    """ Get the term a date falls in, or None if it isn't in term time"""
+    def containing(self, day):
+        _, terms, starts, _ = self._load()
+        # The last term starting on or before the day is the only one which could contain it
+        i = bisect_right(starts, day) - 1
+        if i >= 0 and terms[i].end_date >= day:
+            return terms[i]
+        return None
+
+    """ Get the first term starting after a date, or None if there isn't one"""
+    def after(self, day):
+        _, terms, starts, _ = self._load()
+        i = bisect_right(starts, day)
+        return terms[i] if i < len(terms) else None
+
+term_calendar = TermCalendar()
@@ -0,0 +1,68 @@
+"""
+Renders the month calendar on the schedule page.
+
+The parts of a month which don't depend on the lessons are built once per month and cached,
+so a render only has to fill in the lessons and join the pieces together.
+"""
+from calendar import HTMLCalendar
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from django.urls import reverse
+
+# Any booking id will do, it is only used to find where the id goes in the booking url
+URL_PLACEHOLDER_ID = 987654321
+
+""" Get the month name heading, the weekday header and the opening tag of each day cell in each week of a month"""
+@lru_cache(maxsize=128)
+def month_skeleton(year, month):
+    c = HTMLCalendar()
+    weeks = tuple(
+        # Days outside the month are 0 and appear as empty cells
+        tuple((d, f'<td><div>{d}</div>' if d else '<td>') for d, w in week)
+        for week in c.monthdays2calendar(year, month)
+    )
+    return c.formatmonthname(year, month, withyear=True), c.formatweekheader(), weeks
+
+""" Get the parts of the booking url before and after the booking id"""
+def booking_url_parts():
+    return reverse('view_booking', args=[URL_PLACEHOLDER_ID]).split(str(URL_PLACEHOLDER_ID))
+
+""" Get the times of a lesson, eg 1:00pm - 3:00pm"""
+def lesson_times(start_time, duration):
+    start = datetime.combine(date.min, start_time)
+    end = start + timedelta(minutes=duration)
+    return start.strftime("%I:%M%p").lower() + ' - ' + end.strftime("%I:%M%p").lower()
+
+"""
+Render the rows of the calendar for a month
+
+lessons maps each date to the bookings with a lesson on that date, in the order they should be shown
+"""
+def render_month_rows(year, month, lessons, today=None):
+    today = today or date.today()
+    _, _, weeks = month_skeleton(year, month)
+    url_start, url_end = booking_url_parts()
+    # Most bookings share a handful of times, so only format each one once
+    times = {}
+
+    html = []
+    for week in weeks:
+        html.append('<tr> ')
+        for d, cell in week:
+            if d == 0:
+                html.append('<td></td>')
+                continue
+
+            day = date(year, month, d)
+            # If the date is today, display it bold.
+            html.append(f"<td><div class='fw-bold'>{d}</div>" if day == today else cell)
+
+            # Add a link to each booking with lessons on that day
+            for booking in lessons.get(day, ()):
+                key = (booking.time, booking.duration)
+                if key not in times:
+                    times[key] = lesson_times(*key)
+                html.append(f'<div><a class="ms-3" href="{url_start}{booking.id}{url_end}">{times[key]}</a></div>')
+            html.append('</td>')
+        html.append(' </tr>\n')
+    return ''.join(html)
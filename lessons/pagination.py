@@ -0,0 +1,61 @@
+class KeysetPage:
+    """
+    A page of a queryset ordered by id.
+
+    Pages are found by seeking past the last id of the previous page instead of using an offset,
+    so every page costs the same however far through the results it is.
+    The position is read from the <prefix>_after or <prefix>_before query parameters,
+    so several lists on the same page can be paged separately.
+    """
+
+    def __init__(self, queryset, request, prefix, page_size):
+        self.request = request
+        self.prefix = prefix
+
+        after = request.GET.get(f'{prefix}_after', '')
+        before = request.GET.get(f'{prefix}_before', '')
+
+        if before.isnumeric():
+            # Going backwards, so fetch the rows before the first row of the next page in reverse
+            rows = list(queryset.filter(id__lt=before).order_by('-id')[:page_size + 1])
+            self.has_previous = len(rows) > page_size
+            self.object_list = rows[:page_size][::-1]
+            self.has_next = queryset.filter(id__gte=before).exists()
+        else:
+            if after.isnumeric():
+                self.has_previous = queryset.filter(id__lte=after).exists()
+                queryset = queryset.filter(id__gt=after)
+            else:
+                self.has_previous = False
+            # Fetch an extra row to find out if there is a next page
+            rows = list(queryset.order_by('id')[:page_size + 1])
+            self.has_next = len(rows) > page_size
+            self.object_list = rows[:page_size]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def _url(self, key, value):
+        params = self.request.GET.copy()
+        params.pop(f'{self.prefix}_after', None)
+        params.pop(f'{self.prefix}_before', None)
+        params[key] = value
+        params['tab'] = self.prefix
+        return '?' + params.urlencode()
+
+    """ Query string for the next page, keeping the other parameters"""
+    @property
+    def next_url(self):
+        if self.has_next and self.object_list:
+            return self._url(f'{self.prefix}_after', self.object_list[-1].id)
+        return None
+
+    """ Query string for the previous page, keeping the other parameters"""
+    @property
+    def previous_url(self):
+        if self.has_previous and self.object_list:
+            return self._url(f'{self.prefix}_before', self.object_list[0].id)
+        return None
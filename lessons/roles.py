@@ -0,0 +1,64 @@
+"""
+Changing the roles of many users at once, eg when a cohort of teachers is onboarded.
+"""
+import csv
+from django.db import transaction
+from lessons.middleware import forget_principals
+from lessons.models import User
+from lessons.view_cache import changed as view_data_changed
+
+# Roles which can be given to users on the permissions page, directors can only be made by hand
+ASSIGNABLE_ROLES = [User.SUPER_ADMIN, User.ADMIN, User.TEACHER, User.STUDENT]
+
+BATCH_SIZE = 500
+
+"""
+Read (id, role) pairs, returning a dictionary of the role each user id should have
+and a list of the problems with any invalid pairs
+"""
+def parse_role_changes(pairs):
+    roles = {}
+    errors = []
+    for number, pair in enumerate(pairs, start=1):
+        if len(pair) != 2:
+            errors.append(f'Line {number}: expected an id and a role')
+            continue
+        user_id, role = (str(value).strip() for value in pair)
+        if not user_id.isnumeric():
+            errors.append(f'Line {number}: {user_id!r} is not a user id')
+        elif role.upper() not in ASSIGNABLE_ROLES:
+            errors.append(f'Line {number}: {role!r} is not a role which can be given')
+        else:
+            roles[int(user_id)] = role.upper()
+    return roles, errors
+
+""" Read the (id, role) rows of a CSV file, skipping a header row if there is one"""
+def read_role_csv(lines):
+    rows = [row for row in csv.reader(lines) if any(cell.strip() for cell in row)]
+    if rows and rows[0][0].strip().lower() == 'id':
+        rows = rows[1:]
+    return rows
+
+"""
+Give users new roles in a single transaction
+
+Users who don't exist are skipped. Directors can be given another role, as they can one at a time.
+Returns the number of users whose role changed and the ids which were skipped.
+"""
+def update_roles(roles):
+    with transaction.atomic():
+        users = list(User.objects.select_for_update().filter(pk__in=roles).only('id', 'role'))
+        found = {user.pk for user in users}
+        changed_users = [user for user in users if user.role != roles[user.pk]]
+        for user in changed_users:
+            user.role = roles[user.pk]
+        User.objects.bulk_update(changed_users, ['role'], batch_size=BATCH_SIZE)
+
+        # bulk_update doesn't send the signals which keep cached users and pages up to date
+        if changed_users:
+            user_ids = [user.pk for user in changed_users]
+            forget_principals(user_ids)
+            transaction.on_commit(lambda: forget_principals(user_ids))
+            view_data_changed('user')
+
+    return len(changed_users), sorted(set(roles) - found)
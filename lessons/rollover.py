@@ -0,0 +1,154 @@
+"""
+Rolling the bookings of one term over into a later term, so continuing students don't have to be booked again one by one.
+
+Each booking with lessons in the first term is proposed again for the later term with the same client, child,
+teacher, day of the week, time, duration and interval, and as many lessons as fit in the later term. Lessons every
+two weeks keep to the same weeks, so bookings which share a time in alternate weeks still don't clash.
+
+The proposed bookings are checked against the teachers' teaching hours, the lessons already booked in the later
+term and each other, using the diaries of lessons the request matching uses, then at the lessons' exact times as
+bookings made one at a time are, since they are booked in bulk without a clash check.
+"""
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, timedelta
+from django.db import transaction
+from lessons.models import User, Booking, Term, nth_lesson_date, count_lessons
+from lessons.matching import Matcher
+from lessons.timetable import TeachingHours, time_mask
+from lessons.bookings import book_all
+from lessons.scheduling import LessonTimeline, find_clash
+
+ALREADY_CONTINUES = 'Already has lessons in the term'
+ALREADY_BOOKED = 'Already booked in the term'
+NOT_A_TEACHER = 'The teacher no longer teaches'
+NO_LESSONS = 'No lessons fit in the term'
+OUTSIDE_HOURS = "Outside the teacher's teaching hours"
+TEACHER_BUSY = 'The teacher has another lesson then'
+CLIENT_BUSY = 'The client has another lesson then'
+
+@dataclass(eq=False)
+class Rollover:
+    """ A booking and the lessons proposed to continue it in a later term"""
+    booking: Booking
+    date: date
+    lessons: int
+    # Why it can't be rolled over, empty if it can
+    problem: str = ''
+
+    @property
+    def dates(self):
+        return tuple(nth_lesson_date(self.date, n, self.booking.days_between_lessons) for n in range(self.lessons))
+
+    @property
+    def mask(self):
+        return time_mask(self.booking.time, self.booking.duration)
+
+    """ Get the new booking, unsaved"""
+    def new_booking(self):
+        old = self.booking
+        return Booking(client_id=old.client_id, teacher_id=old.teacher_id, child_id=old.child_id, date=self.date,
+            time=old.time, lessons=self.lessons, days_between_lessons=old.days_between_lessons, duration=old.duration)
+
+@dataclass
+class RolloverProposal:
+    """ The bookings of a term proposed for a later term"""
+    from_term: Term
+    to_term: Term
+    rollovers: list
+
+    @property
+    def bookable(self):
+        return [rollover for rollover in self.rollovers if not rollover.problem]
+
+    @property
+    def problems(self):
+        return [rollover for rollover in self.rollovers if rollover.problem]
+
+""" Get the date of the first lesson on or after a date which keeps to a booking's day of the week and weeks"""
+def continuing_date(booking, start):
+    return start + timedelta((booking.date - start).days % booking.days_between_lessons)
+
+""" Get the same lessons at the same time, to find bookings which have been rolled over already"""
+def lesson_slot(booking, lesson_date):
+    return (booking.client_id, booking.child_id, booking.teacher_id, lesson_date.weekday(), booking.time, booking.duration)
+
+"""
+Check a new booking against the teacher's and client's lessons at their exact times, as a booking made one at a time is
+
+Returns the problem, or an empty string if there is no clash, in which case the booking is added to their lessons.
+"""
+def exact_clash(new_booking, teacher_bookings, client_bookings, start, end):
+    if find_clash(new_booking, LessonTimeline(teacher_bookings, start, end)) is not None:
+        return TEACHER_BUSY
+    if find_clash(new_booking, LessonTimeline(client_bookings, start, end)) is not None:
+        return CLIENT_BUSY
+    teacher_bookings.append(new_booking)
+    client_bookings.append(new_booking)
+    return ''
+
+"""
+Propose the bookings with lessons in a term, or the ones with the given ids, for a later term
+
+Raises ValueError if the later term doesn't start after the first one ends.
+"""
+def propose_rollover(from_term, to_term, booking_ids=None):
+    if to_term.start_date <= from_term.end_date:
+        raise ValueError(f'{to_term.name} needs to start after {from_term.name} ends')
+    start, end = to_term.start_date, to_term.end_date
+
+    bookings = Booking.objects.between(from_term.start_date, from_term.end_date).select_related('client', 'teacher', 'child')
+    if booking_ids is not None:
+        bookings = bookings.filter(pk__in=booking_ids)
+    teachers = list(User.objects.filter(role=User.TEACHER).only('id'))
+    booked = list(Booking.objects.between(start, end)
+        .only('client_id', 'child_id', 'teacher_id', 'date', 'lessons', 'days_between_lessons', 'time', 'duration'))
+    hours = TeachingHours.load([teacher.id for teacher in teachers], start, end)
+    matcher = Matcher(teachers, booked, start, end)
+    booked_slots = {lesson_slot(booking, booking.date) for booking in booked}
+    teacher_bookings, client_bookings = defaultdict(list), defaultdict(list)
+    for booking in booked:
+        teacher_bookings[booking.teacher_id].append(booking)
+        client_bookings[booking.client_id].append(booking)
+
+    rollovers = []
+    for booking in bookings.order_by('id'):
+        first = continuing_date(booking, start)
+        rollover = Rollover(booking, first, count_lessons(first, end, booking.days_between_lessons))
+        rollovers.append(rollover)
+        teacher_diary = matcher.teacher_diaries.get(booking.teacher_id)
+        client_diary = matcher.client_diaries[booking.client_id]
+        mask = rollover.mask
+        if booking.end_date >= start:
+            rollover.problem = ALREADY_CONTINUES
+        elif lesson_slot(booking, first) in booked_slots:
+            rollover.problem = ALREADY_BOOKED
+        elif teacher_diary is None:
+            rollover.problem = NOT_A_TEACHER
+        elif not rollover.lessons:
+            rollover.problem = NO_LESSONS
+        elif hours.customised(booking.teacher_id) and any(hours.on(booking.teacher_id, day) & mask != mask for day in rollover.dates):
+            rollover.problem = OUTSIDE_HOURS
+        elif teacher_diary.busy_on(rollover.dates) & mask:
+            rollover.problem = TEACHER_BUSY
+        elif client_diary.busy_on(rollover.dates) & mask:
+            rollover.problem = CLIENT_BUSY
+        else:
+            rollover.problem = exact_clash(rollover.new_booking(), teacher_bookings[booking.teacher_id],
+                client_bookings[booking.client_id], first, end)
+        if not rollover.problem:
+            teacher_diary.add_booking(rollover.dates, mask)
+            client_diary.add_booking(rollover.dates, mask)
+    return RolloverProposal(from_term, to_term, rollovers)
+
+"""
+Roll the bookings with lessons in a term, or the ones with the given ids, over into a later term
+
+The bookings and their invoices are created in bulk in one transaction. Returns the new bookings and
+the rollovers of the bookings which couldn't be rolled over.
+"""
+def roll_over(from_term, to_term, booking_ids=None):
+    with transaction.atomic():
+        proposal = propose_rollover(from_term, to_term, booking_ids)
+        bookings = book_all([rollover.new_booking() for rollover in proposal.bookable])
+    return bookings, proposal.problems
@@ -0,0 +1,62 @@
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from lessons.models import Booking
+
+class LessonTimeline:
+    """ The lessons of a set of bookings within a date range, sorted by start time so overlaps can be found with a binary search"""
+
+    def __init__(self, bookings, start, end):
+        lessons = []
+        for booking in bookings:
+            for lesson_date in booking.dates_between(start, end):
+                lesson_start = datetime.combine(lesson_date, booking.time)
+                lessons.append((lesson_start, lesson_start + timedelta(minutes=booking.duration), booking))
+        lessons.sort(key=lambda lesson: lesson[0])
+
+        self.starts = [lesson_start for lesson_start, _, _ in lessons]
+
+        # For each lesson, the latest finishing lesson that starts no later than it
+        # so a single lookup tells whether anything starting earlier is still running
+        self.latest_ends = []
+        latest = None
+        for lesson in lessons:
+            if latest is None or lesson[1] > latest[1]:
+                latest = lesson
+            self.latest_ends.append((latest[1], latest[2]))
+
+    """ Get a booking with a lesson overlapping the given start and end times, or None if there isn't one"""
+    def overlapping(self, start, end):
+        # Lessons starting before the end time are the only ones which could overlap
+        i = bisect_left(self.starts, end) - 1
+        if i >= 0 and self.latest_ends[i][0] > start:
+            return self.latest_ends[i][1]
+        return None
+
+""" Find the first lesson of a booking which clashes with another of the teacher's lessons
+
+Returns a tuple of the lesson date and the clashing booking, or None if the teacher is free for every lesson.
+"""
+def find_teacher_clash(booking):
+    end_date = booking.calculate_end_date()
+
+    # Only the teacher's bookings with lessons during this booking can clash
+    others = Booking.objects.filter(teacher_id=booking.teacher_id).between(booking.date, end_date)
+    if booking.pk is not None:
+        others = others.exclude(pk=booking.pk)
+
+    return find_clash(booking, LessonTimeline(others, booking.date, end_date))
+
+""" Find the first lesson of a booking which overlaps a lesson in a timeline
+
+Returns a tuple of the lesson date and the overlapping booking, or None if there isn't one.
+"""
+def find_clash(booking, timeline):
+    if not timeline.starts:
+        return None
+
+    for lesson_date in booking.dates():
+        start = datetime.combine(lesson_date, booking.time)
+        clash = timeline.overlapping(start, start + timedelta(minutes=booking.duration))
+        if clash is not None:
+            return lesson_date, clash
+    return None
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from lessons.models import User, Booking, Request, Child, Invoice, Transfer, Term, term_calendar
+from lessons.view_cache import changed
+from lessons.middleware import forget_principal
+
+""" Keep the payment summary of the invoices a transfer belongs to in step with their transfers"""
+@receiver(post_save, sender=Transfer)
+@receiver(post_delete, sender=Transfer)
+def update_invoice_payment_summary(sender, instance, **kwargs):
+    invoice_ids = {instance.invoice_id, getattr(instance, '_loaded_invoice_id', None)} - {None}
+    Invoice.objects.filter(pk__in=invoice_ids).update_payment_summaries()
+    instance._loaded_invoice_id = instance.invoice_id
+
+    # An invoice object attached to the transfer would otherwise show the old totals
+    if Transfer.invoice.is_cached(instance):
+        instance.invoice.refresh_from_db(fields=Invoice.PAYMENT_SUMMARY_FIELDS)
+
+""" Reload the term calendar after a term is changed"""
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=Term)
+def clear_term_calendar(sender, **kwargs):
+    term_calendar.changed()
+
+""" Stop showing cached pages with the old data after a change"""
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+@receiver(post_save, sender=Request)
+@receiver(post_delete, sender=Request)
+@receiver(post_save, sender=Child)
+@receiver(post_delete, sender=Child)
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_save, sender=Transfer)
+@receiver(post_delete, sender=Transfer)
+@receiver(post_save, sender=Term)
+@receiver(post_delete, sender=Term)
+def expire_cached_views(sender, **kwargs):
+    changed(sender._meta.model_name)
+
+""" Stop using cached copies of a user and pages with their old name, except when all that changed is when they last logged in"""
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def expire_cached_views_of_user(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        changed('user')
+        forget_principal(instance.pk)
+
+""" Set up each new SQLite connection with the pragmas in settings.SQLITE_PRAGMAS"""
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
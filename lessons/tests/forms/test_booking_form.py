@@ -1,7 +1,7 @@
 from django import forms
 from django.test import TestCase
 from lessons.forms import BookingForm
-from lessons.models import User, Term
+from lessons.models import User, Term, Booking
 from datetime import date
 
 class BookingFormTestCase(TestCase):
@@ -44,12 +44,25 @@ class BookingFormTestCase(TestCase):
         self.assertIn('end_date', form.fields)
         self.assertTrue(isinstance(form.fields['end_date'], forms.DateField))
 
+    def test_form_term_choices_come_from_term_calendar(self):
+        form = BookingForm(user=self.client)
+        choices = list(form.fields['term'].choices)
+        self.assertEqual([str(term.id) for term in Term.objects.order_by('start_date')], [str(value) for value, _ in choices[1:]])
+
+    def test_form_rejects_unknown_term(self):
+        self.form_input["term"] = "1000"
+        form = BookingForm(user=self.client, data=self.form_input)
+        form.instance.client = self.client
+        self.assertFalse(form.is_valid())
+        self.assertIn('term', form.errors)
+
     def test_form_accepts_valid_input(self):
         form = BookingForm(user=self.client, data=self.form_input)
         form.instance.client = self.client
         self.assertTrue(form.is_valid())
         # Test form books right amount of lessons
         self.assertEqual(form.instance.lessons,3)
+        self.assertEqual(form.instance.end_date,date(2022,9,19))
 
     def test_form_books_correct_number_of_lessons_when_its_every_two_weeks(self):
         self.form_input["days_between_lessons"] = "14"
@@ -85,6 +98,19 @@ class BookingFormTestCase(TestCase):
         # Test form books right amount of lessons
         self.assertEqual(form.instance.lessons,6)
 
+    def test_form_books_correct_number_of_lessons_for_multi_year_term(self):
+        term = Term.objects.create(name="Contract", start_date=date(2030,1,2), end_date=date(2039,12,31))
+        self.form_input["term"] = term.id
+        self.form_input["day_of_week"] = "6" # Sunday
+        self.form_input.pop('start_date')
+        self.form_input.pop('end_date')
+        form = BookingForm(user=self.client, data=self.form_input)
+        form.instance.client = self.client
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.instance.date,date(2030,1,6))
+        self.assertEqual(form.instance.lessons,521)
+        self.assertEqual(form.instance.end_date,date(2039,12,25))
+
     def test_form_checks_start_date_is_correct_weekday(self):
         self.form_input["start_date"] = "2022-9-13"
         form = BookingForm(user=self.client, data=self.form_input)
@@ -142,4 +168,33 @@ class BookingFormTestCase(TestCase):
         form.instance.client = self.client
         self.assertEqual(form.initial['day_of_week'],0)
         self.assertEqual(form.initial['start_date'],date(2022, 9, 5))
-        self.assertTrue(form.is_valid())
\ No newline at end of file
+        self.assertTrue(form.is_valid())
+
+    def test_form_rejects_lessons_clashing_with_teachers_other_bookings(self):
+        Booking.objects.create(
+            client=User.objects.get(email="ryan.fuller@example.org"),
+            lessons=1,
+            days_between_lessons=7,
+            duration=30,
+            teacher=self.form_input["teacher"],
+            date=date(2022,9,12),
+            time="16:30"
+        )
+        form = BookingForm(user=self.client, data=self.form_input)
+        form.instance.client = self.client
+        self.assertFalse(form.is_valid())
+        self.assertTrue('already has a lesson at 16:30 on 12/09/2022' in str(form.errors['time']))
+
+    def test_form_accepts_lessons_after_teachers_other_booking(self):
+        Booking.objects.create(
+            client=User.objects.get(email="ryan.fuller@example.org"),
+            lessons=1,
+            days_between_lessons=7,
+            duration=30,
+            teacher=self.form_input["teacher"],
+            date=date(2022,9,12),
+            time="15:30"
+        )
+        form = BookingForm(user=self.client, data=self.form_input)
+        form.instance.client = self.client
+        self.assertTrue(form.is_valid())
@@ -0,0 +1,41 @@
+from django.test import TestCase
+from lessons.forms import LessonFilterForm
+from lessons.models import User, Term
+
+class LessonFilterFormTestCase(TestCase):
+    """Unit tests of the LessonFilterForm"""
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json'
+    ]
+    def setUp(self):
+        self.form_input = {
+            "teacher": User.objects.get(email="jane.doe@example.org").id,
+            "term": Term.objects.get(name="Term one").id,
+            "client": "john.doe@example.org",
+            "page_size": "10"
+        }
+
+    def test_form_accepts_valid_input(self):
+        form = LessonFilterForm(data=self.form_input)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_page_size(), 10)
+
+    def test_all_fields_are_optional(self):
+        form = LessonFilterForm(data={})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_page_size(), LessonFilterForm.DEFAULT_PAGE_SIZE)
+
+    def test_form_rejects_teacher_who_is_not_a_teacher(self):
+        self.form_input['teacher'] = User.objects.get(email="john.doe@example.org").id
+        form = LessonFilterForm(data=self.form_input)
+        self.assertFalse(form.is_valid())
+
+    def test_form_rejects_page_size_over_100(self):
+        self.form_input['page_size'] = "101"
+        form = LessonFilterForm(data=self.form_input)
+        self.assertFalse(form.is_valid())
+
+    def test_form_rejects_invalid_client_email(self):
+        self.form_input['client'] = "john.doe"
+        form = LessonFilterForm(data=self.form_input)
+        self.assertFalse(form.is_valid())
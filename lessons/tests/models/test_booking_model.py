@@ -1,6 +1,6 @@
 from django.core.exceptions import ValidationError
 from django.test import TestCase
-from lessons.models import User, Request, Child, Booking
+from lessons.models import User, Request, Child, Booking, first_weekday_on_or_after, nth_lesson_date, count_lessons
 from datetime import date, time, timedelta
 from decimal import Decimal
 
@@ -109,6 +109,31 @@ class BookingModelTestCase(TestCase):
     def test_booking_date(self):
         self.assertEqual(self.booking.day(),self.booking.date.weekday())
 
+    def test_end_date_is_last_lesson_date(self):
+        self.assertEqual(self.booking.end_date, self.booking.dates()[-1])
+
+    def test_end_date_is_updated_on_save(self):
+        self.booking.lessons = 5
+        self.booking.days_between_lessons = 14
+        self.booking.save()
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.end_date, date(2022, 2, 26))
+
+    def test_first_weekday_on_or_after(self):
+        self.assertEqual(first_weekday_on_or_after(date(2022,9,1), 3), date(2022,9,1))
+        self.assertEqual(first_weekday_on_or_after(date(2022,9,1), 0), date(2022,9,5))
+        self.assertEqual(first_weekday_on_or_after(date(2022,9,1), "2"), date(2022,9,7))
+
+    def test_count_lessons(self):
+        self.assertEqual(count_lessons(date(2022,9,5), date(2022,9,19), 7), 3)
+        self.assertEqual(count_lessons(date(2022,9,5), date(2022,9,18), 7), 2)
+        self.assertEqual(count_lessons(date(2022,9,5), date(2022,9,19), 14), 2)
+        self.assertEqual(count_lessons(date(2022,9,5), date(2022,9,4), 7), 0)
+
+    def test_nth_lesson_date(self):
+        self.assertEqual(nth_lesson_date(date(2022,9,5), 0, 14), date(2022,9,5))
+        self.assertEqual(nth_lesson_date(date(2022,9,5), 2, 14), date(2022,10,3))
+
     def _assert_booking_is_valid(self):
         try:
             self.booking.full_clean()
@@ -0,0 +1,80 @@
+from django.test import TestCase
+from lessons.models import User, Booking, Invoice
+from datetime import date, time
+
+class BookingQuerySetTestCase(TestCase):
+    """Unit tests for the Booking queryset lesson occurrence methods."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json'
+    ]
+
+    def setUp(self):
+        self.client = User.objects.get(email="john.doe@example.org")
+        self.teacher = User.objects.get(email="jane.doe@example.org")
+
+        # Lessons on 3rd, 17th and 31st of January 2022
+        self.fortnightly = self._create_booking(date(2022,1,3), lessons=3, days_between_lessons=14, lesson_time=time(17))
+        # Lessons every Monday from 3rd January to 21st March 2022
+        self.weekly = self._create_booking(date(2022,1,3), lessons=12, days_between_lessons=7, lesson_time=time(16))
+        # Lessons finish before February
+        self.finished = self._create_booking(date(2021,12,6), lessons=4, days_between_lessons=7, lesson_time=time(9))
+
+    def test_between_only_returns_bookings_with_lessons_in_range(self):
+        bookings = Booking.objects.between(date(2022,2,1), date(2022,2,28))
+        self.assertIn(self.weekly, bookings)
+        self.assertNotIn(self.fortnightly, bookings)
+        self.assertNotIn(self.finished, bookings)
+
+    def test_between_includes_lessons_on_range_boundaries(self):
+        self.assertIn(self.fortnightly, Booking.objects.between(date(2022,1,31), date(2022,2,28)))
+        self.assertIn(self.fortnightly, Booking.objects.between(date(2021,12,1), date(2022,1,3)))
+
+    def test_occurrences_are_within_range_and_ordered(self):
+        lessons = Booking.objects.occurrences(date(2022,1,1), date(2022,1,31))
+        self.assertEqual(lessons, [
+            (date(2022,1,3), self.weekly),
+            (date(2022,1,3), self.fortnightly),
+            (date(2022,1,10), self.weekly),
+            (date(2022,1,17), self.weekly),
+            (date(2022,1,17), self.fortnightly),
+            (date(2022,1,24), self.weekly),
+            (date(2022,1,31), self.weekly),
+            (date(2022,1,31), self.fortnightly),
+        ])
+
+    def test_occurrences_match_booking_dates(self):
+        start, end = date(2021,12,10), date(2022,3,14)
+        for booking in [self.fortnightly, self.weekly, self.finished]:
+            expected = [d for d in booking.dates() if start <= d <= end]
+            self.assertEqual(booking.dates_between(start, end), expected)
+
+    def test_dates_between_is_empty_outside_booking(self):
+        self.assertEqual(self.weekly.dates_between(date(2021,1,1), date(2021,12,31)), [])
+        self.assertEqual(self.weekly.dates_between(date(2022,3,22), date(2022,12,31)), [])
+
+    def test_with_invoice_loads_invoices_in_one_query(self):
+        invoice = Invoice.objects.create(
+            booking=self.weekly,
+            invoice_ref=self.weekly.invoice_reference(),
+            date="2022-11-21",
+            due_by_date=self.weekly.date,
+            amount=self.weekly.calculate_price(),
+        )
+        with self.assertNumQueries(2):
+            bookings = {booking.id: booking for booking in Booking.objects.with_invoice()}
+            self.assertEqual(bookings[self.weekly.id].get_invoice, invoice)
+            self.assertEqual(bookings[self.weekly.id].get_invoice.amount, invoice.amount)
+            self.assertEqual(bookings[self.weekly.id].get_invoice.net_paid(), 0)
+            self.assertIsNone(bookings[self.fortnightly.id].get_invoice)
+
+    def _create_booking(self, start, lessons, days_between_lessons, lesson_time):
+        return Booking.objects.create(
+            client=self.client,
+            lessons=lessons,
+            days_between_lessons=days_between_lessons,
+            duration=60,
+            teacher=self.teacher,
+            date=start,
+            time=lesson_time,
+        )
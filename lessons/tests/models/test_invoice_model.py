@@ -1,6 +1,7 @@
 from django.core.exceptions import ValidationError
 from django.test import TestCase
-from lessons.models import Invoice, Booking, User
+from lessons.models import Invoice, Booking, User, Transfer
+from decimal import Decimal
 
 class InvoiceModelTestCase(TestCase):
     """Unit tests for the Invoice model."""
@@ -84,6 +85,60 @@ class InvoiceModelTestCase(TestCase):
     def test_string_format(self):
         self.assertEqual(str(self.invoice),str(self.invoice.invoice_ref) )
 
+    def test_payment_summary_is_updated_when_transfers_are_created(self):
+        self.invoice.save()
+        Transfer.objects.create(invoice=self.invoice, date="2022-11-21", amount=50, refund=False)
+        Transfer.objects.create(invoice=self.invoice, date="2022-11-21", amount=10, refund=True)
+        self.assertEqual(self.invoice.paid_total, Decimal('50'))
+        self.assertEqual(self.invoice.refunded_total, Decimal('10'))
+        self.assertEqual(self.invoice.net_paid(), Decimal('40'))
+        invoice = Invoice.objects.get(id=self.invoice.id)
+        self.assertEqual(invoice.net_paid(), Decimal('40'))
+
+    def test_payment_summary_is_updated_when_transfers_are_edited_and_deleted(self):
+        self.invoice.save()
+        transfer = Transfer.objects.create(invoice=self.invoice, date="2022-11-21", amount=50, refund=False)
+        transfer = Transfer.objects.get(id=transfer.id)
+        transfer.amount = 70
+        transfer.save()
+        self.assertEqual(Invoice.objects.get(id=self.invoice.id).net_paid(), Decimal('70'))
+        transfer.delete()
+        self.assertEqual(Invoice.objects.get(id=self.invoice.id).net_paid(), 0)
+
+    def test_payment_summary_is_updated_when_transfer_moves_invoice(self):
+        self.invoice.save()
+        other_invoice = Invoice.objects.create(
+            booking=self.booking,
+            invoice_ref='other',
+            date="2022-11-21",
+            due_by_date=self.booking.date,
+            amount=10,
+        )
+        transfer = Transfer.objects.create(invoice=self.invoice, date="2022-11-21", amount=50, refund=False)
+        transfer = Transfer.objects.get(id=transfer.id)
+        transfer.invoice = other_invoice
+        transfer.save()
+        self.assertEqual(Invoice.objects.get(id=self.invoice.id).net_paid(), 0)
+        self.assertEqual(Invoice.objects.get(id=other_invoice.id).net_paid(), Decimal('50'))
+
+    def test_paid_uses_payment_summary(self):
+        self.invoice.save()
+        self.assertFalse(self.invoice.paid())
+        Transfer.objects.create(invoice=self.invoice, date="2022-11-21", amount=self.invoice.amount, refund=False)
+        invoice = Invoice.objects.get(id=self.invoice.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(invoice.paid())
+
+    def test_saving_a_stale_invoice_keeps_the_payment_summary(self):
+        self.invoice.save()
+        stale = Invoice.objects.get(id=self.invoice.id)
+        Transfer.objects.create(invoice=self.invoice, date="2022-11-21", amount=50, refund=False)
+        stale.amount = 100
+        stale.save()
+        invoice = Invoice.objects.get(id=self.invoice.id)
+        self.assertEqual(invoice.amount, 100)
+        self.assertEqual(invoice.net_paid(), Decimal('50'))
+
     def _assert_invoice_is_valid(self):
         try:
             self.invoice.full_clean()
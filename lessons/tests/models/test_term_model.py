@@ -1,6 +1,6 @@
 from django.core.exceptions import ValidationError
 from django.test import TestCase
-from lessons.models import Term
+from lessons.models import Term, term_calendar
 from datetime import date, timedelta
 
 class TermModelTestCase(TestCase):
@@ -64,6 +64,41 @@ class TermModelTestCase(TestCase):
         self.assertEqual(Term.current_term(),self.test_term1)
         self.assertEqual(Term.next_term(),self.test_term2)
 
+    def test_term_calendar_lookups(self):
+        self.assertEqual(term_calendar.terms()[0], self.term)
+        self.assertEqual(term_calendar.get(self.second_term.id), self.second_term)
+        self.assertIsNone(term_calendar.get('x'))
+        self.assertEqual(term_calendar.containing(self.term.start_date), self.term)
+        self.assertEqual(term_calendar.containing(self.term.end_date), self.term)
+        self.assertIsNone(term_calendar.containing(self.term.end_date + timedelta(1)))
+        self.assertIsNone(term_calendar.containing(self.term.start_date - timedelta(1)))
+        self.assertEqual(term_calendar.after(self.term.start_date), self.second_term)
+        self.assertEqual(term_calendar.after(self.term.start_date - timedelta(1)), self.term)
+
+    def test_term_calendar_does_not_query_database_once_loaded(self):
+        # Committing is only simulated, so the cached terms need clearing when the test is rolled back
+        self.addCleanup(term_calendar.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.term.save()
+        term_calendar.terms()
+        with self.assertNumQueries(0):
+            Term.current_term()
+            Term.next_term()
+            term_calendar.get(self.term.id)
+
+    def test_term_calendar_is_cleared_when_a_term_changes(self):
+        self.addCleanup(term_calendar.clear)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.term.save()
+        term_calendar.terms()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.term.name = 'Renamed'
+            self.term.save()
+        self.assertEqual(term_calendar.get(self.term.id).name, 'Renamed')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second_term.delete()
+        self.assertIsNone(term_calendar.get(self.second_term.id))
+
     def _assert_term_is_valid(self):
         try:
             self.term.full_clean()
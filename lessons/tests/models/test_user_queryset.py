@@ -0,0 +1,88 @@
+from django.test import TestCase
+from lessons.models import User, Booking, Invoice, Transfer
+from datetime import date, time
+from decimal import Decimal
+
+class UserQuerySetTestCase(TestCase):
+    """Unit tests for the User queryset balance annotations."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json'
+    ]
+
+    def setUp(self):
+        self.user = User.objects.get(email="john.doe@example.org")
+        self.user2 = User.objects.get(email="ryan.fuller@example.org")
+        self.teacher = User.objects.get(email="jane.doe@example.org")
+
+        for amount in [100, 50]:
+            booking = Booking.objects.create(
+                client=self.user,
+                lessons=2,
+                days_between_lessons=7,
+                duration=60,
+                teacher=self.teacher,
+                date=date(2022,1,1),
+                time=time(16),
+            )
+            invoice = Invoice.objects.create(
+                booking=booking,
+                invoice_ref=booking.invoice_reference(),
+                date="2022-11-21",
+                due_by_date=booking.date,
+                amount=amount,
+                refund=False
+            )
+            Transfer.objects.create(invoice=invoice, date="2022-11-21", amount=40, refund=False)
+            Transfer.objects.create(invoice=invoice, date="2022-11-21", amount=30, refund=False)
+
+        Transfer.objects.create(invoice=invoice, date="2022-11-21", amount=20, refund=True)
+
+    def test_students_only_returns_students(self):
+        for user in User.objects.students():
+            self.assertEqual(user.role, User.STUDENT)
+        self.assertIn(self.user, User.objects.students())
+        self.assertNotIn(self.teacher, User.objects.students())
+
+    def test_with_balances_matches_per_user_methods(self):
+        for user in User.objects.students().with_balances():
+            self.assertEqual(user.invoiced, user.total_invoice_amount())
+            self.assertEqual(user.paid, user.total_paid())
+            self.assertEqual(user.refunded, user.total_refunded())
+            self.assertEqual(user.net_paid, user.total_paid_net())
+            self.assertEqual(user.owed, user.total_owed())
+
+    def test_with_balances_totals(self):
+        user = User.objects.with_balances().get(pk=self.user.pk)
+        self.assertEqual(user.invoiced, Decimal('150'))
+        self.assertEqual(user.paid, Decimal('140'))
+        self.assertEqual(user.refunded, Decimal('20'))
+        self.assertEqual(user.net_paid, Decimal('120'))
+        self.assertEqual(user.owed, Decimal('30'))
+
+    def test_with_balances_defaults_to_zero(self):
+        user = User.objects.with_balances().get(pk=self.user2.pk)
+        self.assertEqual(user.invoiced, 0)
+        self.assertEqual(user.net_paid, 0)
+        self.assertEqual(user.owed, 0)
+
+    def test_with_balances_uses_a_single_query(self):
+        with self.assertNumQueries(1):
+            list(User.objects.students().with_balances())
+
+    def test_with_balances_in_date_range(self):
+        invoice = Invoice.objects.first()
+        Transfer.objects.create(invoice=invoice, date="2022-12-05", amount=5, refund=False)
+        user = User.objects.with_balances(start=date(2022,12,1)).get(pk=self.user.pk)
+        self.assertEqual(user.invoiced, 0)
+        self.assertEqual(user.paid, Decimal('5'))
+        self.assertEqual(user.owed, Decimal('-5'))
+
+        user = User.objects.with_balances(start=date(2022,11,1), end=date(2022,11,30)).get(pk=self.user.pk)
+        self.assertEqual(user.invoiced, Decimal('150'))
+        self.assertEqual(user.paid, Decimal('140'))
+        self.assertEqual(user.refunded, Decimal('20'))
+        self.assertEqual(user.owed, Decimal('30'))
+
+        with self.assertNumQueries(1):
+            list(User.objects.students().with_balances(end=date(2022,11,30)))
@@ -46,6 +46,7 @@ class AllowedRolesDecoratorTestCase(TestCase):
         request = self.factory.get('/page')
         request.user = self.student
         response = exampleView(request)
+        self.assertEquals(response.status_code, 403)
         self.assertEquals(response.content,b'403 Forbidden')
 
     def test_user_is_logged_in_and_no_roles_allowed(self):
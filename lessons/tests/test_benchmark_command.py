@@ -0,0 +1,67 @@
+"""Tests of the benchmark management command."""
+import json
+import os
+from io import StringIO
+from tempfile import mkdtemp
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import get_resolver
+from lessons.benchmarks import VIEW_QUERY_BUDGETS, query_budget_failures
+from lessons.models import User, Term
+
+class BenchmarkCommandTestCase(TestCase):
+    """Tests of the benchmark command."""
+
+    def test_booking_form_benchmark_runs_and_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark', 'booking_form', number=1, stdout=out)
+        self.assertIn('36500 days', out.getvalue())
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Term.objects.exists())
+
+    def test_unknown_benchmark(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark', 'unknown', stdout=StringIO())
+
+    def test_views_stay_within_their_query_budgets(self):
+        out = StringIO()
+        report = os.path.join(mkdtemp(), 'report.json')
+        call_command('benchmark', 'views', sizes=[10, 40], report=report, stdout=out)
+        with open(report) as report_file:
+            results = json.load(report_file)
+        self.assertEqual(results['failures'], [])
+        self.assertGreaterEqual(results['runs'][0]['bookings'], 10)
+        self.assertGreaterEqual(results['runs'][1]['bookings'], 40)
+        for run in results['runs']:
+            for name, result in run['views'].items():
+                self.assertIn(result['status'], (200, 302), name)
+        self.assertFalse(User.objects.exists())
+
+    def test_every_named_url_has_a_query_budget(self):
+        names = {pattern.name for pattern in get_resolver().url_patterns if getattr(pattern, 'name', None)}
+        self.assertEqual(names - set(VIEW_QUERY_BUDGETS), set())
+
+    def test_query_budget_failures(self):
+        report = [
+            {'bookings': 10, 'views': {name: {'queries': 0} for name in VIEW_QUERY_BUDGETS}},
+            {'bookings': 100, 'views': {name: {'queries': 0} for name in VIEW_QUERY_BUDGETS}},
+        ]
+        report[1]['views']['billing']['queries'] = 2
+        report[1]['views']['lessons']['queries'] = 100
+        self.assertEqual(query_budget_failures(report), [
+            f'lessons made 100 queries, its budget is {VIEW_QUERY_BUDGETS["lessons"]}',
+            'billing made 0 queries with 10 bookings but 2 with 100',
+        ])
+
+    def test_schedule_benchmark_runs_and_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark', 'schedule', number=1, stdout=out)
+        self.assertIn('442 lessons rendered', out.getvalue())
+        self.assertFalse(User.objects.exists())
+
+    def test_log_in_benchmark_runs_and_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark', 'log_in', number=1, stdout=out)
+        self.assertIn('pbkdf2', out.getvalue())
+        self.assertFalse(User.objects.exists())
@@ -0,0 +1,77 @@
+"""Tests of making bookings with their invoices."""
+from datetime import date, time
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from lessons.bookings import book, book_all
+from lessons.models import User, Booking, Invoice, Request
+
+class BookingsTestCase(TestCase):
+    """Tests of making bookings with their invoices."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.student = User.objects.get(email='john.doe@example.org')
+        self.teacher = User.objects.get(email='norma.noe@example.org')
+        self.request = Request.objects.create(client=self.student, availability='Mondays', lessons=4,
+            days_between_lessons=7, duration=60, info='')
+
+    def new_booking(self, first=date(2030, 1, 7), at=time(16), lessons=4):
+        return Booking(client=self.student, teacher=self.teacher, date=first, time=at, lessons=lessons,
+            days_between_lessons=7, duration=60)
+
+    def test_booking_is_saved_with_its_invoice_and_fulfils_its_request(self):
+        booking = book(self.new_booking(), self.request)
+        self.assertIsNotNone(booking.pk)
+        self.assertEqual(booking.end_date, date(2030, 1, 28))
+        invoice = Invoice.objects.get(booking=booking)
+        self.assertEqual(invoice.invoice_ref, f'{self.student.id}-{booking.id}')
+        self.assertEqual((invoice.amount, invoice.due_by_date, invoice.refund), (120, date(2030, 1, 7), False))
+        self.assertTrue(self.request.fulfilled)
+        self.request.refresh_from_db()
+        self.assertTrue(self.request.fulfilled)
+
+    def test_booking_without_a_request(self):
+        booking = book(self.new_booking())
+        self.assertTrue(Invoice.objects.filter(booking=booking).exists())
+        self.request.refresh_from_db()
+        self.assertFalse(self.request.fulfilled)
+
+    def test_request_fulfilled_since_the_booking_was_checked_is_not_booked_again(self):
+        Request.objects.filter(pk=self.request.pk).update(fulfilled=True)
+        bookings_before, invoices_before = Booking.objects.count(), Invoice.objects.count()
+        with self.assertRaisesMessage(ValidationError, 'The request has already been fulfilled'):
+            book(self.new_booking(), self.request)
+        self.assertEqual((Booking.objects.count(), Invoice.objects.count()), (bookings_before, invoices_before))
+
+    def test_clash_booked_since_the_booking_was_checked_saves_nothing(self):
+        book(self.new_booking(first=date(2030, 1, 21), at=time(16, 30), lessons=1))
+        bookings_before, invoices_before = Booking.objects.count(), Invoice.objects.count()
+        with self.assertRaisesMessage(ValidationError, 'The teacher already has a lesson at 16:30 on 21/01/2030'):
+            book(self.new_booking(), self.request)
+        self.assertEqual((Booking.objects.count(), Invoice.objects.count()), (bookings_before, invoices_before))
+        self.request.refresh_from_db()
+        self.assertFalse(self.request.fulfilled)
+
+    def test_booking_takes_a_fixed_number_of_queries(self):
+        # Savepoint, request update, booking insert, clash check, invoice insert, release
+        with self.assertNumQueries(6):
+            book(self.new_booking(), self.request)
+        longer = Request.objects.create(client=self.student, availability='Mondays', lessons=40, duration=60, info='')
+        with self.assertNumQueries(6):
+            book(self.new_booking(first=date(2031, 1, 6), lessons=40), longer)
+
+    def test_book_all(self):
+        other = Request.objects.create(client=self.student, availability='Tuesdays', lessons=1, duration=60, info='')
+        with self.assertNumQueries(3):
+            bookings = book_all([self.new_booking(), self.new_booking(first=date(2030, 1, 8), lessons=1)], [self.request, other])
+        self.assertEqual([booking.end_date for booking in bookings], [date(2030, 1, 28), date(2030, 1, 8)])
+        self.assertEqual(sorted(Invoice.objects.filter(booking__in=bookings).values_list('invoice_ref', flat=True)),
+            sorted(f'{self.student.id}-{booking.id}' for booking in bookings))
+        self.assertEqual(Request.objects.filter(pk__in=[self.request.pk, other.pk], fulfilled=True).count(), 2)
+
+    def test_book_all_with_nothing_to_book(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(book_all([]), [])
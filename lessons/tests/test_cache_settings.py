@@ -0,0 +1,31 @@
+"""Tests of the cache settings."""
+from pathlib import Path
+from django.test import SimpleTestCase
+from impala.caches import cache_settings, is_shared
+
+class CacheSettingsTestCase(SimpleTestCase):
+    """Tests of the cache settings read from the environment."""
+
+    def test_local_memory_by_default(self):
+        settings = cache_settings(Path('/app'), {})
+        self.assertEqual(settings['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+        self.assertEqual(settings['TIMEOUT'], 300)
+
+    def test_file(self):
+        settings = cache_settings(Path('/app'), {'CACHE_BACKEND': 'file'})
+        self.assertEqual(settings['BACKEND'], 'django.core.cache.backends.filebased.FileBasedCache')
+        self.assertEqual(settings['LOCATION'], '/app/cache')
+
+    def test_redis(self):
+        settings = cache_settings(Path('/app'), {'CACHE_BACKEND': 'redis', 'CACHE_LOCATION': 'redis://cache:6379/0', 'CACHE_TIMEOUT': '60'})
+        self.assertEqual(settings['BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+        self.assertEqual(settings['LOCATION'], 'redis://cache:6379/0')
+        self.assertEqual(settings['TIMEOUT'], 60)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            cache_settings(Path('/app'), {'CACHE_BACKEND': 'memcached'})
+
+    def test_only_file_and_redis_are_shared_between_processes(self):
+        shared = {backend: is_shared(cache_settings(Path('/app'), {'CACHE_BACKEND': backend})) for backend in ['locmem', 'file', 'redis', 'dummy']}
+        self.assertEqual(shared, {'locmem': False, 'file': True, 'redis': True, 'dummy': False})
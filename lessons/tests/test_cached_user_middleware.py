@@ -0,0 +1,87 @@
+"""Tests of the cached user middleware."""
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.test import TransactionTestCase, override_settings
+from django.urls import reverse
+from lessons.middleware import PRINCIPAL_TIMEOUT, principal_key, principal_timeout
+from lessons.models import User
+
+# Users are only cached outside of transactions, so these tests can't run inside one
+class CachedUserMiddlewareTestCase(TransactionTestCase):
+    """Tests of the cached user middleware."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.login(username="john.doe@example.org", password='Password123')
+        # Loaded after logging in, which may have rehashed the password with the hasher used by the tests
+        self.user = User.objects.get(email="john.doe@example.org")
+
+    def test_user_is_cached(self):
+        self.client.get(reverse('home'))
+        principal = cache.get(principal_key(self.user.pk))
+        self.assertEqual(principal['role'], User.STUDENT)
+        self.assertEqual(principal['email'], self.user.email)
+
+    def test_forbidden_page_does_not_load_the_user(self):
+        self.client.get(reverse('home'))
+        # Only the session is loaded
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('billing'))
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.content, b'403 Forbidden')
+
+    def test_navbar_uses_cached_user(self):
+        self.client.get(reverse('home'))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Student')
+
+    def test_user_is_loaded_when_needed(self):
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('payments'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_changing_role_updates_the_cached_user(self):
+        self.client.get(reverse('home'))
+        self.user.role = User.ADMIN
+        self.user.save()
+        self.assertIsNone(cache.get(principal_key(self.user.pk)))
+        response = self.client.get(reverse('billing'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_changing_password_logs_out_other_sessions(self):
+        self.client.get(reverse('home'))
+        self.user.set_password('NewPassword123')
+        self.user.save()
+        response = self.client.get(reverse('billing'))
+        self.assertRedirects(response, f"{reverse('log_in')}?next={reverse('billing')}")
+
+    def test_logging_in_keeps_the_cached_user(self):
+        self.client.get(reverse('home'))
+        self.client.login(username=self.user.email, password='Password123')
+        self.assertIsNotNone(cache.get(principal_key(self.user.pk)))
+
+    def test_demoted_staff_lose_their_role_before_the_cached_user_expires(self):
+        self.client.login(username='petra.pickles@example.org', password='Password123')
+        self.assertEqual(self.client.get(reverse('billing')).status_code, 200)
+        # A change made by another process doesn't delete this process's cached user
+        User.objects.filter(email='petra.pickles@example.org').update(role=User.STUDENT)
+        self.assertEqual(cache.get(principal_key(2))['role'], User.ADMIN)
+        self.assertEqual(self.client.get(reverse('billing')).status_code, 403)
+
+    def test_deactivated_staff_are_refused_before_the_cached_user_expires(self):
+        self.client.login(username='marty.major@example.org', password='Password123')
+        self.assertEqual(self.client.get(reverse('permissions')).status_code, 200)
+        User.objects.filter(email='marty.major@example.org').update(is_active=False)
+        self.assertEqual(self.client.get(reverse('permissions')).status_code, 403)
+
+    def test_users_are_only_cached_briefly_without_a_shared_cache(self):
+        self.assertEqual(principal_timeout(), PRINCIPAL_TIMEOUT)
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379/1'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(principal_timeout(), DEFAULT_TIMEOUT)
@@ -0,0 +1,59 @@
+"""Tests of the database settings and connection set up."""
+from pathlib import Path
+from django.db import connection
+from django.test import TestCase, override_settings
+from impala.database import database_settings, sqlite_pragmas
+
+class DatabaseSettingsTestCase(TestCase):
+    """Tests of the database settings read from the environment."""
+
+    def test_sqlite_by_default(self):
+        settings = database_settings(Path('/app'), {})
+        self.assertEqual(settings['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(settings['NAME'], Path('/app/db.sqlite3'))
+        self.assertEqual(settings['CONN_MAX_AGE'], 0)
+        self.assertEqual(settings['OPTIONS']['timeout'], 5)
+
+    def test_postgresql(self):
+        settings = database_settings(Path('/app'), {
+            'DATABASE_ENGINE': 'postgresql',
+            'DATABASE_NAME': 'lessons',
+            'DATABASE_USER': 'impala',
+            'DATABASE_PASSWORD': 'secret',
+            'DATABASE_HOST': 'db.example.org',
+            'DATABASE_PORT': '5432',
+        })
+        self.assertEqual(settings['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual(settings['NAME'], 'lessons')
+        self.assertEqual(settings['HOST'], 'db.example.org')
+        self.assertEqual(settings['CONN_MAX_AGE'], 60)
+        self.assertTrue(settings['CONN_HEALTH_CHECKS'])
+
+    def test_connection_options(self):
+        settings = database_settings(Path('/app'), {
+            'DATABASE_ENGINE': 'postgresql',
+            'DATABASE_CONN_MAX_AGE': '600',
+            'DATABASE_CONN_HEALTH_CHECKS': 'false',
+        })
+        self.assertEqual(settings['CONN_MAX_AGE'], 600)
+        self.assertFalse(settings['CONN_HEALTH_CHECKS'])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            database_settings(Path('/app'), {'DATABASE_ENGINE': 'oracle'})
+
+    def test_sqlite_pragmas(self):
+        pragmas = sqlite_pragmas({'SQLITE_BUSY_TIMEOUT': '1000', 'SQLITE_MMAP_SIZE': '0'})
+        self.assertEqual(pragmas['journal_mode'], 'WAL')
+        self.assertEqual(pragmas['busy_timeout'], 1000)
+        self.assertEqual(pragmas['mmap_size'], 0)
+
+    def test_pragmas_are_run_on_new_connections(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Only SQLite connections have pragmas')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            # 1 is NORMAL
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
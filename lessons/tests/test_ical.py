@@ -0,0 +1,47 @@
+"""Tests of the iCalendar helpers."""
+from django.test import TestCase
+from lessons.models import User, Booking
+from lessons.ical import escape_text, fold, recurrence_rule, feed_token, feed_user_id, reset_feed_secret
+
+class ICalTestCase(TestCase):
+    """Tests of the iCalendar helpers."""
+
+    def test_escape_text(self):
+        self.assertEqual(escape_text('a,b;c\\d\ne'), 'a\\,b\\;c\\\\d\\ne')
+
+    def test_short_lines_are_not_folded(self):
+        self.assertEqual(fold('x' * 75), 'x' * 75)
+
+    def test_long_lines_are_folded(self):
+        folded = fold('x' * 200)
+        lines = folded.split('\r\n')
+        self.assertEqual([len(line) for line in lines], [75, 75, 52])
+        self.assertEqual(''.join(line[1:] if i else line for i, line in enumerate(lines)), 'x' * 200)
+
+    def test_folding_does_not_split_characters(self):
+        for line in fold('é' * 100).split('\r\n'):
+            self.assertLessEqual(len(line.encode()), 75)
+
+    def test_recurrence_rule(self):
+        self.assertEqual(recurrence_rule(Booking(days_between_lessons=7, lessons=3)), 'FREQ=WEEKLY;INTERVAL=1;COUNT=3')
+        self.assertEqual(recurrence_rule(Booking(days_between_lessons=14, lessons=2)), 'FREQ=WEEKLY;INTERVAL=2;COUNT=2')
+        self.assertEqual(recurrence_rule(Booking(days_between_lessons=3, lessons=2)), 'FREQ=DAILY;INTERVAL=3;COUNT=2')
+
+    def test_feed_token(self):
+        user = User.objects.create_user('feed.user@example.org', first_name='Feed', last_name='User')
+        self.assertEqual(feed_user_id(feed_token(user)), user.pk)
+        self.assertIsNone(feed_user_id(str(user.pk)))
+        self.assertIsNone(feed_user_id(f'{user.pk}:forged'))
+
+    def test_each_user_has_their_own_feed_secret(self):
+        user = User.objects.create_user('feed.user@example.org', first_name='Feed', last_name='User')
+        other = User.objects.create_user('other.user@example.org', first_name='Other', last_name='User')
+        self.assertNotEqual(user.feed_secret, other.feed_secret)
+        self.assertNotEqual(feed_token(user), feed_token(other))
+
+    def test_reset_feed_secret_stops_the_old_token_working(self):
+        user = User.objects.create_user('feed.user@example.org', first_name='Feed', last_name='User')
+        old_token = feed_token(user)
+        reset_feed_secret(user)
+        self.assertIsNone(feed_user_id(old_token))
+        self.assertEqual(feed_user_id(feed_token(User.objects.get(pk=user.pk))), user.pk)
@@ -0,0 +1,178 @@
+"""Tests of the job queue and the run_worker command."""
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from lessons.jobs import (MAX_RETRY_DELAY, Worker, claim_jobs, enqueue, job, purge_finished_jobs, retry_delay,
+    run_job, run_queued_jobs)
+from lessons.models import User, Child, Job
+
+@job()
+def add_child(parent_id, first_name):
+    Child.objects.get_or_create(parent_id=parent_id, first_name=first_name, last_name='Doe')
+
+@job(max_attempts=3)
+def add_child_then_fail(parent_id):
+    add_child(parent_id, 'Failed')
+    raise RuntimeError('Something went wrong')
+
+class JobQueueTestCase(TestCase):
+    """Tests of queuing and running jobs."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.parent = User.objects.get(email='john.doe@example.org')
+        self.children = Child.objects.count()
+
+    def make_due(self):
+        Job.objects.update(run_at=timezone.now() - timedelta(seconds=1))
+
+    def test_run_job(self):
+        queued = enqueue(add_child, parent_id=self.parent.id, first_name='Jim')
+        self.assertEqual(Child.objects.count(), self.children)
+        self.assertEqual(run_queued_jobs(), (1, 0))
+        self.assertTrue(Child.objects.filter(first_name='Jim').exists())
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts, queued.locked_until), (Job.DONE, 1, None))
+        self.assertIsNotNone(queued.finished_at)
+        self.assertEqual(run_queued_jobs(), (0, 0))
+
+    def test_only_registered_functions_can_be_queued(self):
+        with self.assertRaises(ValueError):
+            enqueue('not_a_job')
+
+    def test_jobs_waiting_to_run_are_not_queued_twice(self):
+        first = enqueue(add_child, dedup_key='jim', parent_id=self.parent.id, first_name='Jim')
+        second = enqueue(add_child, dedup_key='jim', parent_id=self.parent.id, first_name='Jim')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(run_queued_jobs(), (1, 0))
+        # Once it has run it can be queued again
+        third = enqueue(add_child, dedup_key='jim', parent_id=self.parent.id, first_name='Jim')
+        self.assertNotEqual(third.pk, first.pk)
+        self.assertEqual(Job.objects.count(), 2)
+
+    def test_delayed_job(self):
+        enqueue(add_child, delay=timedelta(minutes=1), parent_id=self.parent.id, first_name='Jim')
+        self.assertEqual(run_queued_jobs(), (0, 0))
+        self.make_due()
+        self.assertEqual(run_queued_jobs(), (1, 0))
+
+    def test_failed_job_is_retried_with_backoff(self):
+        queued = enqueue(add_child_then_fail, parent_id=self.parent.id)
+        with self.assertLogs('lessons.jobs', 'WARNING') as logs:
+            self.assertEqual(run_queued_jobs(), (0, 1))
+        self.assertIn('failed on attempt 1 of 3', logs.output[0])
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.QUEUED, 1))
+        self.assertIn('Something went wrong', queued.last_error)
+        self.assertGreater(queued.run_at, timezone.now() + timedelta(seconds=9))
+        # What the job did before it failed is undone
+        self.assertEqual(Child.objects.count(), self.children)
+        # It isn't due yet
+        self.assertEqual(run_queued_jobs(), (0, 0))
+
+        with self.assertLogs('lessons.jobs', 'WARNING'):
+            self.make_due()
+            self.assertEqual(run_queued_jobs(), (0, 1))
+            self.make_due()
+            self.assertEqual(run_queued_jobs(), (0, 1))
+        queued.refresh_from_db()
+        self.assertEqual((queued.status, queued.attempts), (Job.FAILED, 3))
+        self.make_due()
+        self.assertEqual(run_queued_jobs(), (0, 0))
+
+    def test_retry_delay_doubles_up_to_a_limit(self):
+        self.assertEqual([retry_delay(attempts).total_seconds() for attempts in range(1, 5)], [10, 20, 40, 80])
+        self.assertEqual(retry_delay(50), MAX_RETRY_DELAY)
+
+    def test_retry_is_dropped_when_the_job_is_queued_again(self):
+        queued = enqueue(add_child_then_fail, dedup_key='fail', parent_id=self.parent.id)
+        [claimed] = claim_jobs('worker', 1)
+        again = enqueue(add_child_then_fail, dedup_key='fail', parent_id=self.parent.id)
+        self.assertNotEqual(again.pk, queued.pk)
+        with self.assertLogs('lessons.jobs', 'WARNING'):
+            self.assertFalse(run_job(claimed, 'worker'))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.FAILED)
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).get().pk, again.pk)
+
+    def test_claimed_job_is_not_claimed_again_until_it_times_out(self):
+        queued = enqueue(add_child, parent_id=self.parent.id, first_name='Jim')
+        [claimed] = claim_jobs('first', 5)
+        self.assertEqual(claimed.locked_by, 'first')
+        self.assertEqual(claim_jobs('second', 5), [])
+
+        # The first worker stopped without finishing it
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        [reclaimed] = claim_jobs('second', 5)
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (queued.pk, 2))
+
+        # The first worker no longer runs the job, the second one does
+        self.assertIsNone(run_job(claimed, 'first'))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.RUNNING)
+        self.assertFalse(Child.objects.filter(first_name='Jim').exists())
+        self.assertTrue(run_job(reclaimed, 'second'))
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.DONE)
+        self.assertTrue(Child.objects.filter(first_name='Jim').exists())
+
+    def test_job_which_times_out_on_its_last_attempt_fails(self):
+        queued = enqueue(add_child, parent_id=self.parent.id, first_name='Jim')
+        Job.objects.update(status=Job.RUNNING, attempts=5, locked_by='dead', locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_jobs('worker', 5), [])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, Job.FAILED)
+        self.assertIn('Timed out', queued.last_error)
+
+    def test_unknown_job_fails(self):
+        Job.objects.create(name='removed_job', run_at=timezone.now(), max_attempts=1)
+        with self.assertLogs('lessons.jobs', 'WARNING'):
+            self.assertEqual(run_queued_jobs(), (0, 1))
+        self.assertIn('removed_job is not a job', Job.objects.get().last_error)
+
+    def test_purge_finished_jobs(self):
+        enqueue(add_child, parent_id=self.parent.id, first_name='Jim')
+        enqueue(add_child, parent_id=self.parent.id, first_name='Jan')
+        run_queued_jobs()
+        Job.objects.filter(arguments__first_name='Jim').update(finished_at=timezone.now() - timedelta(days=8))
+        self.assertEqual(purge_finished_jobs(), 1)
+        self.assertEqual(Job.objects.get().arguments['first_name'], 'Jan')
+
+    def test_run_worker_command(self):
+        enqueue(add_child, parent_id=self.parent.id, first_name='Jim')
+        out = StringIO()
+        call_command('run_worker', threads=1, until_empty=True, stdout=out)
+        self.assertIn('1 jobs done, 0 failed', out.getvalue())
+        self.assertTrue(Child.objects.filter(first_name='Jim').exists())
+
+    def test_run_worker_command_needs_a_shared_cache_when_pages_are_cached(self):
+        enqueue(add_child, parent_id=self.parent.id, first_name='Jim')
+        # The tests use a cache in local memory, which the worker can't share with the web processes
+        with override_settings(VIEW_CACHE=True), self.assertRaisesMessage(CommandError, 'VIEW_CACHE needs a cache shared by every process'):
+            call_command('run_worker', threads=1, until_empty=True, stdout=StringIO())
+        self.assertFalse(Child.objects.filter(first_name='Jim').exists())
+
+class JobWorkerThreadsTestCase(TransactionTestCase):
+    """Tests of running jobs on more than one thread, which each have their own database connection."""
+
+    def setUp(self):
+        # Connections to an in-memory SQLite database fail at once rather than wait while another one writes
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('needs a database file or server')
+
+    def test_every_job_is_run_once(self):
+        parent = User.objects.create_user('parent@example.org', first_name='Jane', last_name='Doe', role=User.STUDENT)
+        for i in range(20):
+            enqueue(add_child, parent_id=parent.id, first_name=f'Child {i}')
+        worker = Worker(threads=4, poll_interval=0.01)
+        worker.run(until_empty=True)
+        self.assertEqual((worker.done, worker.failed), (20, 0))
+        self.assertEqual(sorted(Child.objects.values_list('first_name', flat=True)), sorted(f'Child {i}' for i in range(20)))
+        self.assertFalse(Job.objects.exclude(status=Job.DONE).exists())
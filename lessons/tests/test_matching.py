@@ -0,0 +1,216 @@
+"""Tests of matching open lesson requests with teachers."""
+from datetime import date, time
+from django.test import TestCase
+from lessons.matching import parse_availability, propose_matches, book_matches, Match, parse_match_key, lesson_starts, slot_of, TEACHING_SLOTS
+from lessons.models import User, Booking, Invoice, Request, Term, TeacherAvailability
+from lessons.timetable import WEEK_BYTES, parse_windows, slots_to_bytes, with_day
+
+class AvailabilityTestCase(TestCase):
+    """Tests of reading availability from the text of a request."""
+
+    def allowed_times(self, availability, weekday):
+        mask = availability.masks[weekday]
+        return [slot for slot in range(96) if mask >> slot & 1]
+
+    def test_any_time(self):
+        availability = parse_availability('Any time')
+        self.assertTrue(availability.understood)
+        self.assertEqual(availability.masks, (TEACHING_SLOTS,) * 7)
+
+    def test_days(self):
+        availability = parse_availability('Mondays, tues and Thursday')
+        self.assertEqual([bool(mask) for mask in availability.masks], [True, True, False, True, False, False, False])
+
+    def test_weekends(self):
+        availability = parse_availability('weekends only')
+        self.assertEqual([bool(mask) for mask in availability.masks], [False] * 5 + [True] * 2)
+
+    def test_time_range(self):
+        availability = parse_availability('Wednesday 4-6pm')
+        self.assertEqual(self.allowed_times(availability, 2), list(range(slot_of(time(16)), slot_of(time(18)))))
+        self.assertEqual(availability.masks[0], 0)
+
+    def test_after_a_time(self):
+        availability = parse_availability('weekdays after 4:30')
+        self.assertEqual(self.allowed_times(availability, 4), list(range(slot_of(time(16, 30)), slot_of(time(20)))))
+        self.assertEqual(availability.masks[5], 0)
+
+    def test_before_a_time_and_parts_of_day(self):
+        self.assertEqual(self.allowed_times(parse_availability('before 11am'), 0), list(range(slot_of(time(9)), slot_of(time(11)))))
+        self.assertEqual(self.allowed_times(parse_availability('evenings'), 0), list(range(slot_of(time(17)), slot_of(time(20)))))
+
+    def test_text_which_cant_be_read_allows_any_time(self):
+        availability = parse_availability('Please ask my mum')
+        self.assertFalse(availability.understood)
+        self.assertEqual(availability.masks, (TEACHING_SLOTS,) * 7)
+
+    def test_lesson_starts(self):
+        free = 0b1110111
+        self.assertEqual(lesson_starts(free, 30), 0b0110011)
+        self.assertEqual(lesson_starts(free, 45), 0b0010001)
+        self.assertEqual(lesson_starts(free, 60), 0)
+
+class MatchingTestCase(TestCase):
+    """Tests of proposing and booking matches for open requests."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.term = Term.objects.get(name='Term one')
+        self.student = User.objects.get(email='john.doe@example.org')
+        self.student2 = User.objects.get(email='ryan.fuller@example.org')
+        self.teacher = User.objects.get(email='norma.noe@example.org')
+        self.teacher2 = User.objects.get(email='jane.doe@example.org')
+
+    def create_request(self, client, availability='any', **fields):
+        fields = {'lessons': 4, 'days_between_lessons': 7, 'duration': 60, 'info': '', **fields}
+        return Request.objects.create(client=client, availability=availability, **fields)
+
+    def propose(self):
+        return propose_matches(self.term, self.term.start_date)
+
+    def test_match_respects_availability(self):
+        request = self.create_request(self.student, 'Tuesdays after 5pm', lessons=3, days_between_lessons=14)
+        [match] = self.propose().matches
+        self.assertEqual(match.request, request)
+        self.assertEqual(match.date, date(2022, 9, 6))
+        self.assertEqual(match.time, time(17))
+        self.assertEqual(match.lessons, 3)
+
+    def test_lessons_are_limited_to_the_term(self):
+        self.create_request(self.student, 'Fridays', lessons=20)
+        [match] = self.propose().matches
+        # Fridays from 2 September to 21 October
+        self.assertEqual(match.lessons, 8)
+
+    def test_request_which_doesnt_fit_in_the_term(self):
+        request = self.create_request(self.student, 'Fridays')
+        proposal = propose_matches(self.term, date(2022, 10, 22))
+        self.assertEqual(proposal.matches, [])
+        self.assertEqual([unmatched for unmatched, _ in proposal.unmatched], [request])
+
+    def test_booked_lessons_are_avoided(self):
+        for teacher in [self.teacher, self.teacher2]:
+            Booking.objects.create(client=self.student2, teacher=teacher, date=date(2022, 9, 5), time=time(9),
+                lessons=7, days_between_lessons=7, duration=60)
+        self.create_request(self.student, 'Mondays 9-11am', duration=45)
+        [match] = self.propose().matches
+        self.assertEqual(match.time, time(10))
+
+    def test_clients_lessons_are_avoided(self):
+        Booking.objects.create(client=self.student, teacher=self.teacher, date=date(2022, 9, 5), time=time(16),
+            lessons=7, days_between_lessons=7, duration=60)
+        self.create_request(self.student, 'Mondays 4-6pm')
+        [match] = self.propose().matches
+        self.assertEqual(match.time, time(17))
+
+    def test_client_stays_with_their_teacher(self):
+        Booking.objects.create(client=self.student, teacher=self.teacher2, date=date(2022, 9, 5), time=time(16),
+            lessons=7, days_between_lessons=7, duration=60)
+        self.create_request(self.student, 'Tuesdays')
+        [match] = self.propose().matches
+        self.assertEqual(match.teacher_id, self.teacher2.id)
+
+    def test_teaching_hours_are_respected(self):
+        for teacher, hours in [(self.teacher, '17:00-18:00'), (self.teacher2, '')]:
+            TeacherAvailability.objects.create(teacher=teacher, week=slots_to_bytes(with_day(0, 0, parse_windows(hours)), WEEK_BYTES))
+        self.create_request(self.student, 'Mondays')
+        self.create_request(self.student2, 'Tuesdays')
+        proposal = self.propose()
+        [match] = proposal.matches
+        self.assertEqual((match.teacher_id, match.time), (self.teacher.id, time(17)))
+        self.assertEqual(len(proposal.unmatched), 1)
+
+    def test_load_is_spread_between_teachers(self):
+        self.create_request(self.student, 'Mondays')
+        self.create_request(self.student2, 'Mondays')
+        matches = self.propose().matches
+        self.assertEqual({match.teacher_id for match in matches}, {self.teacher.id, self.teacher2.id})
+        self.assertEqual({match.time for match in matches}, {time(9)})
+
+    def test_requests_never_overlap(self):
+        for i in range(12):
+            self.create_request(self.student if i % 2 else self.student2, 'Wednesday 4-7pm', duration=45)
+        proposal = self.propose()
+        self.assertEqual(len(proposal.matches), 8)
+        self.assertEqual(len(proposal.unmatched), 4)
+        for match in proposal.matches:
+            for other in proposal.matches:
+                if match is not other and (match.teacher_id == other.teacher_id or match.request.client_id == other.request.client_id):
+                    self.assertFalse(match.mask & other.mask)
+
+    def test_a_match_is_moved_to_make_room(self):
+        other_student = User.objects.create_user('other.student@example.org', first_name='Other', last_name='Student', role=User.STUDENT)
+        for client, lesson_time in [(other_student, time(9)), (self.student2, time(10))]:
+            Booking.objects.create(client=client, teacher=self.teacher2, date=date(2022, 9, 5), time=lesson_time,
+                lessons=7, days_between_lessons=7, duration=60)
+        # Placed first as it has fewer possible times, with the only teacher free on Mondays at 9
+        flexible = self.create_request(self.student, 'Mondays and Tuesdays 9-10am')
+        # Can only be on Mondays at 9, as the client has a lesson at 10
+        constrained = self.create_request(self.student2, 'Mondays 9-11am')
+        proposal = self.propose()
+        self.assertEqual(proposal.unmatched, [])
+        matches = {match.request.id: match for match in proposal.matches}
+        self.assertEqual((matches[constrained.id].teacher_id, matches[constrained.id].date, matches[constrained.id].time),
+            (self.teacher.id, date(2022, 9, 5), time(9)))
+        self.assertEqual((matches[flexible.id].teacher_id, matches[flexible.id].date, matches[flexible.id].time),
+            (self.teacher.id, date(2022, 9, 6), time(9)))
+
+    def test_fulfilled_requests_are_not_matched(self):
+        self.create_request(self.student, fulfilled=True)
+        self.assertEqual(self.propose().matches, [])
+
+    def test_match_keys(self):
+        request = self.create_request(self.student)
+        match = Match(request, self.teacher.id, date(2022, 9, 5), time(16, 15), 4)
+        self.assertEqual(parse_match_key(match.key), (request.id, self.teacher.id, date(2022, 9, 5), time(16, 15), 4))
+
+    def test_book_matches(self):
+        request = self.create_request(self.student, 'Mondays', duration=30)
+        request2 = self.create_request(self.student2, 'Tuesdays')
+        proposal = self.propose()
+        with self.assertNumQueries(10):
+            bookings, skipped = book_matches([match.key for match in proposal.matches] + ['not a match'])
+        self.assertEqual(skipped, [])
+        self.assertEqual(len(bookings), 2)
+        self.assertFalse(Request.objects.filter(fulfilled=False).exists())
+
+        booking = Booking.objects.get(client=self.student)
+        self.assertEqual((booking.date, booking.time, booking.lessons, booking.duration), (date(2022, 9, 5), time(9), 4, 30))
+        self.assertEqual(booking.end_date, date(2022, 9, 26))
+        invoice = Invoice.objects.get(booking=booking)
+        self.assertEqual(invoice.invoice_ref, f'{self.student.id}-{booking.id}')
+        self.assertEqual(invoice.amount, 60)
+        self.assertEqual(Invoice.objects.count(), 2)
+
+    def test_matches_which_now_clash_are_skipped(self):
+        request = self.create_request(self.student, 'Mondays')
+        [match] = self.propose().matches
+        Booking.objects.create(client=self.student2, teacher_id=match.teacher_id, date=date(2022, 9, 12), time=match.time,
+            lessons=1, days_between_lessons=7, duration=30)
+        bookings, skipped = book_matches([match.key])
+        self.assertEqual((bookings, skipped), ([], [request.id]))
+        self.assertFalse(Request.objects.get(pk=request.pk).fulfilled)
+
+    def test_lessons_booked_between_slots_are_not_double_booked(self):
+        for teacher in [self.teacher, self.teacher2]:
+            Booking.objects.create(client=self.student2, teacher=teacher, date=date(2022, 9, 5), time=time(16, 10),
+                lessons=7, days_between_lessons=7, duration=60)
+        request = self.create_request(self.student, 'Mondays 5pm-6pm')
+        proposal = self.propose()
+        self.assertEqual(proposal.matches, [])
+        self.assertEqual([unmatched for unmatched, _ in proposal.unmatched], [request])
+        for lesson_time in [time(17), time(16, 40)]:
+            match = Match(request, self.teacher.id, date(2022, 9, 5), lesson_time, 4)
+            self.assertEqual(book_matches([match.key]), ([], [request.id]))
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_matches_of_fulfilled_requests_are_skipped(self):
+        request = self.create_request(self.student, 'Mondays')
+        [match] = self.propose().matches
+        book_matches([match.key])
+        bookings, skipped = book_matches([match.key])
+        self.assertEqual((bookings, skipped), ([], [request.id]))
+        self.assertEqual(Booking.objects.count(), 1)
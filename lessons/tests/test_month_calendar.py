@@ -0,0 +1,42 @@
+"""Tests of the month calendar renderer."""
+from django.test import TestCase
+from django.urls import reverse
+from lessons.models import Booking
+from lessons.month_calendar import month_skeleton, render_month_rows, lesson_times
+from datetime import date, time
+
+class MonthCalendarTestCase(TestCase):
+    """Tests of the month calendar renderer."""
+
+    def setUp(self):
+        self.booking = Booking(id=7, time=time(13), duration=90)
+        self.booking2 = Booking(id=8, time=time(9, 15), duration=30)
+
+    def test_skeleton_is_cached(self):
+        self.assertIs(month_skeleton(2022, 1), month_skeleton(2022, 1))
+
+    def test_skeleton_has_headings(self):
+        month, week, weeks = month_skeleton(2022, 1)
+        self.assertIn('January 2022', month)
+        self.assertIn('Mon', week)
+        self.assertEqual(len(weeks), 6)
+
+    def test_days_outside_month_are_empty(self):
+        rows = render_month_rows(2022, 1, {}, today=date(2000, 1, 1))
+        # January 2022 starts on a Saturday
+        self.assertTrue(rows.startswith('<tr> <td></td><td></td><td></td><td></td><td></td><td><div>1</div></td>'))
+        self.assertEqual(rows.count('<tr>'), 6)
+
+    def test_today_is_bold(self):
+        rows = render_month_rows(2022, 1, {}, today=date(2022, 1, 12))
+        self.assertIn("<td><div class='fw-bold'>12</div></td>", rows)
+        self.assertEqual(rows.count('fw-bold'), 1)
+
+    def test_lessons_link_to_their_booking(self):
+        rows = render_month_rows(2022, 1, {date(2022, 1, 3): [self.booking2, self.booking]}, today=date(2000, 1, 1))
+        first = f'<div><a class="ms-3" href="{reverse("view_booking", args=[8])}">09:15am - 09:45am</a></div>'
+        second = f'<div><a class="ms-3" href="{reverse("view_booking", args=[7])}">01:00pm - 02:30pm</a></div>'
+        self.assertIn(f'<td><div>3</div>{first}{second}</td>', rows)
+
+    def test_lesson_times(self):
+        self.assertEqual(lesson_times(time(23, 30), 60), '11:30pm - 12:30am')
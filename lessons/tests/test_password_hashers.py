@@ -0,0 +1,43 @@
+"""Tests of the password hasher settings."""
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from impala.passwords import password_hashers, available, HASHERS
+from lessons.models import User
+
+class PasswordHashersTestCase(TestCase):
+    """Tests of the password hasher settings."""
+
+    def test_pbkdf2_by_default(self):
+        hashers = password_hashers({})
+        self.assertEqual(hashers[0], HASHERS['pbkdf2'])
+        self.assertNotIn(HASHERS['fast'], hashers)
+
+    def test_fast_when_testing(self):
+        self.assertEqual(password_hashers({}, testing=True)[0], HASHERS['fast'])
+
+    def test_test_runner_uses_the_hashers_for_tests(self):
+        self.assertEqual(settings.PASSWORD_HASHERS, password_hashers(testing=True))
+
+    def test_chosen_hasher_comes_first(self):
+        for name in HASHERS:
+            if available(name):
+                hashers = password_hashers({'PASSWORD_HASHER': name})
+                self.assertEqual(hashers[0], HASHERS[name])
+                self.assertIn(HASHERS['pbkdf2'], hashers)
+
+    def test_unknown_hasher(self):
+        with self.assertRaises(ValueError):
+            password_hashers({'PASSWORD_HASHER': 'sha1'})
+
+    def test_password_is_rehashed_with_the_chosen_hasher_on_log_in(self):
+        with override_settings(PASSWORD_HASHERS=[HASHERS['pbkdf2']]):
+            user = User.objects.create_user('old.hash@example.org', password='Password123', first_name='Old', last_name='Hash', role=User.STUDENT)
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+
+        with override_settings(PASSWORD_HASHERS=password_hashers({'PASSWORD_HASHER': 'fast'})):
+            response = self.client.post(reverse('log_in'), {'email': 'old.hash@example.org', 'password': 'Password123'})
+        self.assertEqual(response.status_code, 302)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('md5$'))
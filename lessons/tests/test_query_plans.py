@@ -0,0 +1,77 @@
+"""Tests that the queries behind the busiest pages are answered from indexes."""
+import re
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+from io import StringIO
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase
+from lessons.management.commands.seed import Command as SeedCommand
+from lessons.models import User, Booking, Request, Invoice, Transfer, Term
+
+# Matches a step of a query plan which reads every row of a table, for SQLite and PostgreSQL
+FULL_SCAN = re.compile(r'\bSCAN (?P<sqlite>\w+)$|Seq Scan on (?P<postgresql>\w+)', re.MULTILINE)
+
+class QueryPlanTestCase(TestCase):
+    """Tests that the queries behind the busiest pages are answered from indexes, on about 100,000 rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        with redirect_stdout(StringIO()):
+            SeedCommand().seed_at_scale(students=12000, teachers=50, terms=6, batch_size=4000)
+        # Give the query planner statistics, as a database in use would have
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        cls.student = User.objects.filter(role=User.STUDENT).last()
+        cls.teacher = User.objects.filter(role=User.TEACHER).last()
+        cls.booking = Booking.objects.last()
+        cls.invoice = Invoice.objects.last()
+        cls.start = date.today() + timedelta(100)
+        cls.end = cls.start + timedelta(30)
+
+    def assertUsesIndexes(self, queryset):
+        plan = queryset.explain()
+        full_scans = [match['sqlite'] or match['postgresql'] for match in FULL_SCAN.finditer(plan)]
+        self.assertEqual(full_scans, [], f'Full table scan in the plan of {queryset.query}:\n{plan}')
+
+    def test_seeded_rows(self):
+        rows = sum(model.objects.count() for model in [User, Booking, Request, Invoice, Transfer, Term])
+        self.assertGreater(rows, 90000)
+
+    def test_bookings_of_a_client(self):
+        self.assertUsesIndexes(Booking.objects.filter(client=self.student))
+
+    def test_bookings_of_a_teacher(self):
+        self.assertUsesIndexes(Booking.objects.filter(teacher=self.teacher))
+
+    def test_schedule_of_a_teacher(self):
+        self.assertUsesIndexes(Booking.objects.filter(teacher=self.teacher).between(self.start, self.end))
+
+    def test_requests_of_a_client(self):
+        self.assertUsesIndexes(Request.objects.filter(client=self.student, fulfilled=False))
+        self.assertUsesIndexes(Request.objects.filter(client=self.student, fulfilled=True))
+
+    def test_pages_of_active_requests(self):
+        self.assertUsesIndexes(Request.objects.filter(fulfilled=False).order_by('id')[:51])
+        self.assertUsesIndexes(Request.objects.filter(fulfilled=False, id__lt=1000).order_by('-id')[:51])
+
+    def test_invoice_of_a_booking(self):
+        self.assertUsesIndexes(Invoice.objects.filter(booking=self.booking))
+
+    def test_payments_of_an_invoice(self):
+        self.assertUsesIndexes(Transfer.objects.filter(invoice=self.invoice, refund=False).values('invoice').annotate(total=Sum('amount')))
+
+    def test_invoices_and_transfers_in_a_date_range(self):
+        self.assertUsesIndexes(Invoice.objects.filter(date__gte=self.start, date__lte=self.end).order_by('date', 'id'))
+        self.assertUsesIndexes(Transfer.objects.filter(date__gte=self.start, date__lte=self.end).order_by('date', 'id'))
+
+    def test_terms_overlapping_a_date_range(self):
+        self.assertUsesIndexes(Term.objects.filter(end_date__gte=self.start, start_date__lte=self.end))
+
+    def test_users_with_a_role(self):
+        self.assertUsesIndexes(User.objects.filter(role=User.TEACHER).order_by('id')[:51])
+
+    def test_balance_of_a_student(self):
+        self.assertUsesIndexes(User.objects.with_balances().filter(pk=self.student.pk))
+        self.assertUsesIndexes(User.objects.with_balances(self.start, self.end).filter(pk=self.student.pk))
@@ -0,0 +1,49 @@
+"""Tests of the rebuild_payment_summaries management command."""
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from lessons.models import User, Booking, Invoice, Transfer
+from datetime import date, time
+from decimal import Decimal
+
+class RebuildPaymentSummariesCommandTestCase(TestCase):
+    """Tests of the rebuild_payment_summaries command."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json'
+    ]
+
+    def setUp(self):
+        booking = Booking.objects.create(
+            client=User.objects.get(email="john.doe@example.org"),
+            lessons=2,
+            days_between_lessons=7,
+            duration=60,
+            teacher=User.objects.get(email="jane.doe@example.org"),
+            date=date(2022,1,1),
+            time=time(16),
+        )
+        self.invoice = Invoice.objects.create(
+            booking=booking,
+            invoice_ref=booking.invoice_reference(),
+            date="2022-11-21",
+            due_by_date=booking.date,
+            amount=100,
+        )
+        Transfer.objects.create(invoice=self.invoice, date="2022-11-21", amount=60, refund=False)
+
+        # Simulate drift by changing the summary behind the transfers' back
+        Invoice.objects.filter(id=self.invoice.id).update(paid_total=0, net_paid_total=0)
+
+    def test_command_reports_and_fixes_drift(self):
+        out = StringIO()
+        call_command('rebuild_payment_summaries', stdout=out)
+        self.assertIn('1 of 1 invoices have drifted', out.getvalue())
+        self.assertEqual(Invoice.objects.get(id=self.invoice.id).net_paid(), Decimal('60'))
+        self.assertFalse(Invoice.objects.with_payment_summary_drift().exists())
+
+    def test_dry_run_only_reports_drift(self):
+        out = StringIO()
+        call_command('rebuild_payment_summaries', dry_run=True, stdout=out)
+        self.assertIn('1 of 1 invoices have drifted', out.getvalue())
+        self.assertEqual(Invoice.objects.get(id=self.invoice.id).net_paid(), 0)
@@ -0,0 +1,37 @@
+"""Tests of changing many roles at once."""
+from django.core.cache import cache
+from django.test import TestCase
+from lessons.middleware import principal_key
+from lessons.models import User
+from lessons.roles import parse_role_changes, read_role_csv, update_roles
+
+class RolesTestCase(TestCase):
+    """Tests of changing many roles at once."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def test_parse_role_changes(self):
+        roles, errors = parse_role_changes([['1', 'teacher'], [' 4 ', 'ADMIN'], ['x', 'ADMIN'], ['5', 'DIRECTOR'], ['6']])
+        self.assertEqual(roles, {1: User.TEACHER, 4: User.ADMIN})
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(errors[0].startswith('Line 3'))
+
+    def test_read_role_csv_skips_header_and_blank_lines(self):
+        self.assertEqual(read_role_csv(['id,role', '', '1,TEACHER']), [['1', 'TEACHER']])
+        self.assertEqual(read_role_csv(['1,TEACHER']), [['1', 'TEACHER']])
+
+    def test_update_roles(self):
+        updated, skipped = update_roles({1: User.TEACHER, 4: User.STUDENT, 3: User.ADMIN, 1000: User.ADMIN})
+        # User 4 is already a student and user 1000 doesn't exist
+        self.assertEqual(updated, 2)
+        self.assertEqual(skipped, [1000])
+        self.assertEqual(User.objects.get(pk=1).role, User.TEACHER)
+        # User 3 was a director
+        self.assertEqual(User.objects.get(pk=3).role, User.ADMIN)
+
+    def test_update_roles_forgets_cached_users(self):
+        cache.set(principal_key(1), {'role': User.STUDENT})
+        update_roles({1: User.TEACHER})
+        self.assertIsNone(cache.get(principal_key(1)))
@@ -0,0 +1,148 @@
+"""Tests of rolling bookings over into a later term."""
+from datetime import date, time
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from lessons.models import User, Booking, Child, Invoice, Term, TeacherAvailability
+from lessons.rollover import (ALREADY_BOOKED, ALREADY_CONTINUES, CLIENT_BUSY, NOT_A_TEACHER, OUTSIDE_HOURS,
+    TEACHER_BUSY, propose_rollover, roll_over)
+from lessons.timetable import WEEK_BYTES, parse_windows, slots_to_bytes, with_day
+
+class RolloverTestCase(TestCase):
+    """Tests of rolling bookings over into a later term."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.student = User.objects.get(email='john.doe@example.org')
+        self.student2 = User.objects.get(email='ryan.fuller@example.org')
+        self.teacher = User.objects.get(email='norma.noe@example.org')
+        self.teacher2 = User.objects.get(email='jane.doe@example.org')
+        self.child = Child.objects.get(pk=1)
+        # Term one is 1 September to 21 October 2022, term two 31 October to 16 December 2022
+        self.term_one = Term.objects.get(pk=1)
+        self.term_two = Term.objects.get(pk=2)
+
+    def book(self, client=None, teacher=None, first=date(2022, 9, 5), lessons=7, days_between_lessons=7, at=time(16), **kwargs):
+        return Booking.objects.create(client=client or self.student, teacher=teacher or self.teacher, date=first, time=at,
+            lessons=lessons, days_between_lessons=days_between_lessons, duration=60, **kwargs)
+
+    def test_booking_is_rolled_over_with_its_lessons_recounted(self):
+        booking = self.book(child=self.child)
+        bookings, problems = roll_over(self.term_one, self.term_two)
+        self.assertEqual(problems, [])
+        [new] = bookings
+        new.refresh_from_db()
+        self.assertEqual((new.client, new.child, new.teacher, new.time, new.duration, new.days_between_lessons),
+            (booking.client, booking.child, booking.teacher, booking.time, booking.duration, booking.days_between_lessons))
+        self.assertEqual((new.date, new.lessons, new.end_date), (date(2022, 10, 31), 7, date(2022, 12, 12)))
+        invoice = Invoice.objects.get(booking=new)
+        self.assertEqual(invoice.invoice_ref, f'{self.student.id}-{new.id}')
+        self.assertEqual((invoice.amount, invoice.due_by_date), (210, date(2022, 10, 31)))
+
+    def test_lessons_every_two_weeks_keep_to_their_weeks(self):
+        self.book(first=date(2022, 9, 5), lessons=4, days_between_lessons=14)
+        self.book(client=self.student2, first=date(2022, 9, 12), lessons=3, days_between_lessons=14)
+        bookings, problems = roll_over(self.term_one, self.term_two)
+        self.assertEqual(problems, [])
+        self.assertEqual(sorted((booking.date, booking.lessons) for booking in bookings),
+            [(date(2022, 10, 31), 4), (date(2022, 11, 7), 3)])
+
+    def test_reasons_bookings_are_not_rolled_over(self):
+        self.book(client=self.student2, first=date(2022, 10, 31), at=time(16, 30))
+        self.book(client=self.student, teacher=self.teacher, first=date(2022, 11, 1), at=time(10), lessons=1)
+        teacher_busy = self.book(at=time(17))
+        client_busy = self.book(teacher=self.teacher2, first=date(2022, 9, 6), at=time(9, 30))
+        continues = self.book(client=self.student2, first=date(2022, 10, 17), lessons=3, at=time(12))
+        proposal = propose_rollover(self.term_one, self.term_two)
+        self.assertEqual(proposal.bookable, [])
+        self.assertEqual({rollover.booking.id: rollover.problem for rollover in proposal.problems}, {
+            teacher_busy.id: TEACHER_BUSY,
+            client_busy.id: CLIENT_BUSY,
+            continues.id: ALREADY_CONTINUES,
+        })
+
+    def test_teaching_hours_and_teachers_who_left(self):
+        TeacherAvailability.objects.create(teacher=self.teacher, week=slots_to_bytes(with_day(0, 0, parse_windows('09:00-12:00')), WEEK_BYTES))
+        outside_hours = self.book(at=time(16))
+        inside_hours = self.book(client=self.student2, at=time(10))
+        left = self.book(teacher=self.teacher2, first=date(2022, 9, 7))
+        User.objects.filter(pk=self.teacher2.pk).update(role=User.STUDENT)
+        proposal = propose_rollover(self.term_one, self.term_two)
+        self.assertEqual([rollover.booking.id for rollover in proposal.bookable], [inside_hours.id])
+        self.assertEqual({rollover.booking.id: rollover.problem for rollover in proposal.problems}, {
+            outside_hours.id: OUTSIDE_HOURS,
+            left.id: NOT_A_TEACHER,
+        })
+
+    def test_rolled_over_bookings_clash_with_each_other(self):
+        first = self.book()
+        second = self.book(client=self.student2)
+        proposal = propose_rollover(self.term_one, self.term_two)
+        self.assertEqual([rollover.booking.id for rollover in proposal.bookable], [first.id])
+        self.assertEqual([(rollover.booking.id, rollover.problem) for rollover in proposal.problems], [(second.id, TEACHER_BUSY)])
+
+    def test_lessons_between_slots_are_not_rolled_over_into_a_clash(self):
+        self.book(client=self.student2, first=date(2022, 10, 31), lessons=1, at=time(16, 10))
+        TeacherAvailability.objects.create(teacher=self.teacher2, week=slots_to_bytes(with_day(0, 1, parse_windows('09:00-10:00')), WEEK_BYTES))
+        teacher_busy = self.book(at=time(17))
+        outside_hours = self.book(teacher=self.teacher2, first=date(2022, 9, 6), at=time(9, 10))
+        bookings, problems = roll_over(self.term_one, self.term_two)
+        self.assertEqual(bookings, [])
+        self.assertEqual({rollover.booking.id: rollover.problem for rollover in problems}, {
+            teacher_busy.id: TEACHER_BUSY,
+            outside_hours.id: OUTSIDE_HOURS,
+        })
+
+    def test_rolling_over_again_books_nothing(self):
+        self.book()
+        roll_over(self.term_one, self.term_two)
+        bookings, problems = roll_over(self.term_one, self.term_two)
+        self.assertEqual(bookings, [])
+        self.assertEqual([rollover.problem for rollover in problems], [ALREADY_BOOKED])
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_only_chosen_bookings_are_rolled_over(self):
+        chosen = self.book()
+        self.book(client=self.student2, at=time(10))
+        bookings, problems = roll_over(self.term_one, self.term_two, [chosen.id])
+        self.assertEqual([booking.client_id for booking in bookings], [chosen.client_id])
+        self.assertEqual(problems, [])
+
+    def test_term_needs_to_be_later(self):
+        with self.assertRaises(ValueError):
+            propose_rollover(self.term_two, self.term_one)
+        with self.assertRaises(ValueError):
+            propose_rollover(self.term_one, self.term_one)
+
+    def test_queries_do_not_grow_with_the_bookings(self):
+        self.book()
+        with self.assertNumQueries(9):
+            roll_over(self.term_one, self.term_two)
+        Invoice.objects.all().delete()
+        Booking.objects.filter(date__gte=self.term_two.start_date).delete()
+        for hour in range(9, 19):
+            self.book(client=self.student2, teacher=self.teacher2, at=time(hour))
+        with self.assertNumQueries(9):
+            bookings, _ = roll_over(self.term_one, self.term_two)
+        self.assertEqual(len(bookings), 11)
+
+    def test_rollover_term_command(self):
+        self.book()
+        out = StringIO()
+        call_command('rollover_term', self.term_one.id, self.term_two.id, dry_run=True, stdout=out)
+        self.assertIn('Would book 1 bookings from Term one into Term two', out.getvalue())
+        self.assertEqual(Booking.objects.count(), 1)
+        call_command('rollover_term', self.term_one.id, self.term_two.id, stdout=out)
+        self.assertEqual(Booking.objects.count(), 2)
+        call_command('rollover_term', self.term_one.id, self.term_two.id, stdout=out)
+        self.assertIn(f'1 not rolled over: {ALREADY_BOOKED}', out.getvalue())
+
+    def test_rollover_term_command_with_wrong_terms(self):
+        with self.assertRaises(CommandError):
+            call_command('rollover_term', self.term_two.id, self.term_one.id, stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('rollover_term', self.term_one.id, 999, stdout=StringIO())
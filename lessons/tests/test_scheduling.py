@@ -0,0 +1,62 @@
+"""Tests of the lesson clash detection."""
+from django.test import TestCase
+from lessons.models import User, Booking
+from lessons.scheduling import LessonTimeline, find_teacher_clash
+from datetime import date, time, datetime
+
+class SchedulingTestCase(TestCase):
+    """Tests of the lesson timeline and teacher clash detection."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json'
+    ]
+
+    def setUp(self):
+        self.client = User.objects.get(email="john.doe@example.org")
+        self.teacher = User.objects.get(email="jane.doe@example.org")
+        self.other_teacher = User.objects.get(email="norma.noe@example.org")
+
+        # Mondays at 16:00-17:00 from 3rd January to 21st February 2022
+        self.booking = self._create_booking(self.teacher, date(2022,1,3), time(16), duration=60, lessons=8)
+        # A 2 hour lesson on 10th January 2022 from 10:00-12:00
+        self.long_lesson = self._create_booking(self.teacher, date(2022,1,10), time(10), duration=120, lessons=1)
+
+    def test_timeline_finds_overlapping_lesson(self):
+        timeline = LessonTimeline(Booking.objects.all(), date(2022,1,1), date(2022,1,31))
+        self.assertEqual(timeline.overlapping(datetime(2022,1,17,16,30), datetime(2022,1,17,17,30)), self.booking)
+        self.assertEqual(timeline.overlapping(datetime(2022,1,10,11), datetime(2022,1,10,11,30)), self.long_lesson)
+
+    def test_timeline_allows_back_to_back_lessons(self):
+        timeline = LessonTimeline(Booking.objects.all(), date(2022,1,1), date(2022,1,31))
+        self.assertIsNone(timeline.overlapping(datetime(2022,1,17,17), datetime(2022,1,17,18)))
+        self.assertIsNone(timeline.overlapping(datetime(2022,1,10,12), datetime(2022,1,10,16)))
+
+    def test_timeline_ignores_lessons_outside_date_range(self):
+        timeline = LessonTimeline(Booking.objects.all(), date(2022,1,1), date(2022,1,31))
+        self.assertIsNone(timeline.overlapping(datetime(2022,2,7,16), datetime(2022,2,7,17)))
+
+    def test_clash_with_teachers_other_booking(self):
+        candidate = Booking(teacher=self.teacher, date=date(2022,2,7), time=time(15,30), duration=45, lessons=4, days_between_lessons=7)
+        self.assertEqual(find_teacher_clash(candidate), (date(2022,2,7), self.booking))
+
+    def test_clash_only_on_later_lesson(self):
+        candidate = Booking(teacher=self.teacher, date=date(2021,12,27), time=time(16), duration=30, lessons=3, days_between_lessons=14)
+        self.assertEqual(find_teacher_clash(candidate), (date(2022,1,10), self.booking))
+
+    def test_no_clash_with_other_teacher(self):
+        candidate = Booking(teacher=self.other_teacher, date=date(2022,1,3), time=time(16), duration=60, lessons=8, days_between_lessons=7)
+        self.assertIsNone(find_teacher_clash(candidate))
+
+    def test_booking_does_not_clash_with_itself(self):
+        self.assertIsNone(find_teacher_clash(self.booking))
+
+    def _create_booking(self, teacher, start, lesson_time, duration, lessons):
+        return Booking.objects.create(
+            client=self.client,
+            lessons=lessons,
+            days_between_lessons=7,
+            duration=duration,
+            teacher=teacher,
+            date=start,
+            time=lesson_time,
+        )
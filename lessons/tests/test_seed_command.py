@@ -0,0 +1,44 @@
+"""Tests of the bulk load testing mode of the seed management command."""
+from contextlib import redirect_stdout
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase
+from lessons.models import User, Term, Booking, Invoice, Request
+
+class SeedCommandTestCase(TestCase):
+    """Tests of the seed command with --students, --teachers and --terms."""
+
+    def _seed(self, **options):
+        out = StringIO()
+        with redirect_stdout(out):
+            call_command('seed', **options)
+        return out.getvalue()
+
+    def test_seed_at_scale_creates_requested_users_and_terms(self):
+        out = self._seed(students=30, teachers=3, terms=2, batch_size=10)
+        self.assertEqual(User.objects.filter(role=User.STUDENT).count(), 30)
+        self.assertEqual(User.objects.filter(role=User.TEACHER).count(), 3)
+        self.assertEqual(Term.objects.count(), 2)
+        self.assertEqual(Request.objects.count(), 60)
+        self.assertIn('rows/s', out)
+
+    def test_seeded_users_share_a_working_password(self):
+        self._seed(students=2, teachers=1, terms=1)
+        for user in User.objects.all():
+            self.assertTrue(user.check_password('Password123'))
+
+    def test_seeded_bookings_and_invoices_are_consistent(self):
+        self._seed(students=30, teachers=2, terms=1)
+        self.assertEqual(Booking.objects.count(), Invoice.objects.count())
+        self.assertEqual(Booking.objects.count(), Request.objects.filter(fulfilled=True).count())
+        for booking in Booking.objects.all():
+            self.assertEqual(booking.end_date, booking.calculate_end_date())
+            self.assertEqual(booking.get_invoice.invoice_ref, booking.invoice_reference())
+        self.assertFalse(Invoice.objects.with_payment_summary_drift().exists())
+
+    def test_seeded_terms_do_not_overlap(self):
+        self._seed(terms=3)
+        self._seed(terms=3)
+        terms = list(Term.objects.order_by('start_date'))
+        for term, next_term in zip(terms, terms[1:]):
+            self.assertLess(term.end_date, next_term.start_date)
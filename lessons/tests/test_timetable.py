@@ -0,0 +1,134 @@
+"""Tests of teachers' teaching hours and free time."""
+from datetime import date, time
+from django.test import TestCase
+from lessons.models import User, Booking, TeacherAvailability, AvailabilityException
+from lessons.scheduling import find_teacher_clash
+from lessons.timetable import (DAY_BYTES, DEFAULT_WEEK, WEEK_BYTES, TEACHING_SLOTS, Timetable, TeachingHours, day_of_week,
+    every_day, format_windows, lesson_dates, parse_windows, slot_of, slots_mask, slots_to_bytes, time_mask, with_day)
+
+class WindowsTestCase(TestCase):
+    """Tests of reading and writing the times of a day."""
+
+    def test_parse_windows(self):
+        self.assertEqual(parse_windows('09:00-10:00, 14:30-15:00'), slots_mask(36, 40) | slots_mask(58, 60))
+        self.assertEqual(parse_windows(''), 0)
+        self.assertEqual(parse_windows('22:00-24:00'), slots_mask(88, 96))
+
+    def test_invalid_windows(self):
+        for text in ['9am-10am', '09:10-10:00', '10:00-09:00', '10:00-25:00']:
+            with self.assertRaises(ValueError):
+                parse_windows(text)
+
+    def test_format_windows(self):
+        self.assertEqual(format_windows(slots_mask(36, 40) | slots_mask(58, 60)), '09:00-10:00, 14:30-15:00')
+        self.assertEqual(format_windows(slots_mask(88, 96)), '22:00-24:00')
+        self.assertEqual(format_windows(0), '')
+
+    def test_days_of_a_week(self):
+        week = with_day(every_day(TEACHING_SLOTS), 2, 0)
+        self.assertEqual(day_of_week(week, 1), TEACHING_SLOTS)
+        self.assertEqual(day_of_week(week, 2), 0)
+        self.assertEqual(week.bit_length() <= WEEK_BYTES * 8, True)
+
+    def test_time_mask_covers_every_slot_a_lesson_is_in(self):
+        self.assertEqual(time_mask(time(16), 60), slots_mask(64, 68))
+        self.assertEqual(time_mask(time(16, 10), 60), slots_mask(64, 69))
+        self.assertEqual(time_mask(time(16, 15, 30), 30), slots_mask(65, 68))
+
+class TimetableTestCase(TestCase):
+    """Tests of finding teachers who are free."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.student = User.objects.get(email='john.doe@example.org')
+        self.teacher = User.objects.get(email='norma.noe@example.org')
+        self.teacher2 = User.objects.get(email='jane.doe@example.org')
+        # Mondays from 5 September 2022
+        self.start = date(2022, 9, 5)
+        self.end = date(2022, 10, 31)
+
+    def load(self):
+        return Timetable.load(self.start, self.end)
+
+    def test_teachers_are_free_in_the_teaching_day_by_default(self):
+        timetable = self.load()
+        self.assertEqual(timetable.free_teachers(0, time(9), 60, 8, self.start), [self.teacher.id, self.teacher2.id])
+        self.assertEqual(timetable.free_teachers(0, time(8), 60, 8, self.start), [])
+        self.assertEqual(timetable.free_teachers(0, time(19, 15), 45, 8, self.start), [self.teacher.id, self.teacher2.id])
+        self.assertEqual(timetable.free_teachers(0, time(19, 15), 60, 8, self.start), [])
+
+    def test_booked_lessons_are_not_free(self):
+        Booking.objects.create(client=self.student, teacher=self.teacher, date=date(2022, 9, 19), time=time(16),
+            lessons=2, days_between_lessons=14, duration=60)
+        timetable = self.load()
+        # The lessons on 19 September and 3 October clash
+        self.assertEqual(timetable.free_teachers(0, time(16, 30), 30, 5, self.start), [self.teacher2.id])
+        self.assertEqual(timetable.free_teachers(0, time(16, 30), 30, 2, self.start), [self.teacher.id, self.teacher2.id])
+        self.assertEqual(timetable.free_teachers(0, time(17), 30, 5, self.start), [self.teacher.id, self.teacher2.id])
+        # Every other week misses the booked lessons
+        self.assertEqual(timetable.free_teachers(0, time(16), 60, 3, date(2022, 9, 12), 14), [self.teacher.id, self.teacher2.id])
+
+    def test_lessons_booked_between_slots_are_not_free(self):
+        Booking.objects.create(client=self.student, teacher=self.teacher, date=self.start, time=time(16, 10),
+            lessons=1, days_between_lessons=7, duration=60)
+        timetable = self.load()
+        self.assertEqual(timetable.free_teachers(0, time(17), 60, 1, self.start), [self.teacher2.id])
+        self.assertIsNotNone(find_teacher_clash(Booking(teacher=self.teacher, date=self.start, time=time(17),
+            lessons=1, days_between_lessons=7, duration=60)))
+        self.assertEqual(timetable.free_teachers(0, time(17, 15), 60, 1, self.start), [self.teacher.id, self.teacher2.id])
+        self.assertEqual(timetable.free_teachers(0, time(15), 60, 1, self.start), [self.teacher.id, self.teacher2.id])
+        free_times = timetable.free_times(self.teacher.id, 0, 60, 1, self.start)
+        self.assertEqual([at for at in free_times if time(15) <= at <= time(17, 15)], [time(15), time(17, 15)])
+
+    def test_teaching_hours_and_exceptions(self):
+        week = with_day(0, 0, parse_windows('16:00-18:00'))
+        TeacherAvailability.objects.create(teacher=self.teacher, week=slots_to_bytes(week, WEEK_BYTES))
+        AvailabilityException.objects.create(teacher=self.teacher2, date=date(2022, 9, 12), slots=slots_to_bytes(0, DAY_BYTES))
+        AvailabilityException.objects.create(teacher=self.teacher, date=date(2022, 9, 13), slots=slots_to_bytes(parse_windows('07:00-08:00'), DAY_BYTES))
+        timetable = self.load()
+        self.assertEqual(timetable.free_teachers(0, time(16), 60, 1, self.start), [self.teacher.id, self.teacher2.id])
+        self.assertEqual(timetable.free_teachers(0, time(16), 60, 2, self.start), [self.teacher.id])
+        self.assertEqual(timetable.free_teachers(0, time(10), 60, 1, self.start), [self.teacher2.id])
+        self.assertEqual(timetable.free_teachers(1, time(7), 60, 1, date(2022, 9, 12)), [self.teacher.id])
+        self.assertEqual(timetable.free_teachers(1, time(7), 60, 1, self.start), [])
+
+    def test_free_times(self):
+        TeacherAvailability.objects.create(teacher=self.teacher, week=slots_to_bytes(with_day(0, 2, parse_windows('16:00-17:30')), WEEK_BYTES))
+        Booking.objects.create(client=self.student, teacher=self.teacher, date=date(2022, 9, 14), time=time(16, 30),
+            lessons=1, days_between_lessons=7, duration=30)
+        timetable = self.load()
+        self.assertEqual(timetable.free_times(self.teacher.id, 2, 30, 1, date(2022, 9, 12)), [time(16), time(17)])
+        self.assertEqual(timetable.free_times(self.teacher.id, 2, 30, 1, self.start), [time(16), time(16, 15), time(16, 30), time(16, 45), time(17)])
+        self.assertEqual(timetable.free_times(self.teacher.id, 2, 60, 1, self.start), [time(16), time(16, 15), time(16, 30)])
+        self.assertEqual(timetable.free_times(self.teacher.id, 2, 60, 2, self.start), [])
+
+    def test_lessons_outside_the_timetable(self):
+        timetable = self.load()
+        with self.assertRaises(ValueError):
+            timetable.free_teachers(0, time(16), 60, 20, self.start)
+
+    def test_loading_takes_the_same_queries_however_many_bookings(self):
+        Booking.objects.bulk_create([
+            Booking(client=self.student, teacher=self.teacher, date=date(2022, 9, 5 + i % 7), end_date=date(2022, 10, 31),
+                time=time(9 + i % 10), lessons=9, days_between_lessons=7, duration=30)
+            for i in range(70)
+        ])
+        with self.assertNumQueries(4):
+            timetable = self.load()
+        with self.assertNumQueries(0):
+            timetable.free_teachers(0, time(9), 30, 8, self.start)
+
+    def test_teaching_hours_on_a_date(self):
+        AvailabilityException.objects.create(teacher=self.teacher, date=date(2022, 9, 6), slots=slots_to_bytes(0, DAY_BYTES))
+        hours = TeachingHours.load([self.teacher.id, self.teacher2.id], self.start, self.end)
+        self.assertTrue(hours.customised(self.teacher.id))
+        self.assertFalse(hours.customised(self.teacher2.id))
+        self.assertEqual(hours.on(self.teacher.id, date(2022, 9, 6)), 0)
+        self.assertEqual(hours.on(self.teacher.id, date(2022, 9, 7)), TEACHING_SLOTS)
+        self.assertEqual(hours.week(self.teacher2.id, self.start), DEFAULT_WEEK)
+
+    def test_lesson_dates(self):
+        self.assertEqual(lesson_dates(2, date(2022, 9, 5), 3, 14), [date(2022, 9, 7), date(2022, 9, 21), date(2022, 10, 5)])
@@ -0,0 +1,116 @@
+"""Tests of the per user view cache."""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.test import TestCase
+from django.urls import reverse
+from lessons.models import User, Booking, Term, Invoice, Transfer
+from lessons.view_cache import versions, bump
+from lessons.checks import check_view_cache
+from datetime import date, time
+
+# The tests run in one process, so its local memory cache is shared by everything which changes the data
+@override_settings(VIEW_CACHE=True)
+class ViewCacheTestCase(TestCase):
+    """Tests of the per user view cache."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.user = User.objects.get(email="john.doe@example.org")
+        self.teacher = User.objects.get(email="jane.doe@example.org")
+        self.booking = Booking.objects.create(
+            client=self.user,
+            lessons=2,
+            days_between_lessons=7,
+            duration=60,
+            teacher=self.teacher,
+            date=date(2022,1,3),
+            time=time(16),
+        )
+        self.url = reverse('view_booking', args=[self.booking.id])
+        self.client.login(username=self.user.email, password='Password123')
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+
+    def test_cached_page_does_not_query_the_view_data(self):
+        first = self.client.get(self.url)
+        # Only the session and user are loaded
+        with self.assertNumQueries(2):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+
+    def test_saving_a_booking_renders_the_page_again(self):
+        self.client.get(self.url)
+        self.booking.duration = 45
+        self.booking.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, '45')
+
+    def test_paying_an_invoice_renders_the_page_again(self):
+        invoice = Invoice.objects.create(booking=self.booking, invoice_ref=self.booking.invoice_reference(),
+            date=date(2022,1,1), due_by_date=date(2022,1,3), amount=60)
+        url = reverse('invoice', args=[invoice.id])
+        before = self.client.get(url).content
+        Transfer.objects.create(invoice=invoice, date=date(2022,1,2), amount=60)
+        self.assertNotEqual(self.client.get(url).content, before)
+
+    def test_pages_are_cached_per_user(self):
+        self.client.get(self.url)
+        self.client.login(username=self.teacher.email, password='Password123')
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Teacher')
+
+    def test_not_cached_without_csrf_cookie(self):
+        del self.client.cookies[settings.CSRF_COOKIE_NAME]
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertGreater(len(queries), 2)
+
+    def test_not_cached_without_a_shared_cache(self):
+        self.client.get(self.url)
+        with override_settings(VIEW_CACHE=False), CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url)
+        self.assertGreater(len(queries), 2)
+
+    def test_caching_pages_in_memory_fails_the_checks(self):
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379/1'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual(check_view_cache(None), [])
+        in_memory = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=in_memory):
+            self.assertEqual([error.id for error in check_view_cache(None)], ['lessons.E001'])
+            with override_settings(VIEW_CACHE=False):
+                self.assertEqual(check_view_cache(None), [])
+
+    def test_posts_are_not_cached(self):
+        self.client.login(username='marty.major@example.org', password='Password123')
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+        self.client.get(reverse('terms'))
+        self.client.post(reverse('terms'), {'name': 'Summer', 'start_date': '2024-07-01', 'end_date': '2024-08-01'})
+        self.assertContains(self.client.get(reverse('terms')), 'Summer')
+
+    def test_deleting_a_term_renders_the_page_again(self):
+        self.client.login(username='marty.major@example.org', password='Password123')
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = 'a' * 32
+        self.assertContains(self.client.get(reverse('terms')), 'Term six')
+        Term.objects.filter(name='Term six').first().delete()
+        self.assertNotContains(self.client.get(reverse('terms')), 'Term six')
+
+    def test_logging_in_does_not_expire_pages(self):
+        before = versions(['user'])
+        self.client.login(username=self.user.email, password='Password123')
+        self.assertEqual(versions(['user']), before)
+        self.user.first_name = 'Johnny'
+        self.user.save()
+        self.assertNotEqual(versions(['user']), before)
+
+    def test_bump_after_eviction_does_not_reuse_versions(self):
+        before = versions(['booking'])[0]
+        cache.delete('view_cache:version:booking')
+        bump('booking')
+        self.assertGreater(versions(['booking'])[0], before)
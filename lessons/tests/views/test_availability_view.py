@@ -0,0 +1,76 @@
+"""Tests of the teacher availability view."""
+from datetime import date, timedelta
+from django.test import TestCase
+from django.urls import reverse
+from lessons.models import User, TeacherAvailability, AvailabilityException
+from lessons.timetable import DAY_BYTES, TEACHING_SLOTS, day_of_week, parse_windows, slots_from_bytes, slots_to_bytes
+
+class AvailabilityViewTestCase(TestCase):
+    """Tests of the teacher availability view."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.url = reverse('availability')
+        self.teacher = User.objects.get(email='norma.noe@example.org')
+        self.student = User.objects.get(email='john.doe@example.org')
+        self.week = {f'day_{weekday}': '16:00-18:00' for weekday in range(5)}
+        self.week.update(day_5='09:00-12:00, 13:00-15:00', day_6='', weekly='')
+        self.client.login(username=self.teacher.email, password='Password123')
+
+    def test_availability_url(self):
+        self.assertEqual(self.url, '/availability/')
+
+    def test_get_availability(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'availability.html')
+        self.assertEqual(response.context['weekly_form'].initial['day_0'], '09:00-20:00')
+
+    def test_students_cannot_see_availability(self):
+        self.client.login(username=self.student.email, password='Password123')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 403)
+
+    def test_save_week(self):
+        response = self.client.post(self.url, self.week, follow=True)
+        self.assertRedirects(response, self.url, status_code=302, target_status_code=200)
+        week = slots_from_bytes(TeacherAvailability.objects.get(teacher=self.teacher).week)
+        self.assertEqual(day_of_week(week, 0), parse_windows('16:00-18:00'))
+        self.assertEqual(day_of_week(week, 5), parse_windows('09:00-12:00, 13:00-15:00'))
+        self.assertEqual(day_of_week(week, 6), 0)
+        self.assertEqual(response.context['weekly_form'].initial['day_5'], '09:00-12:00, 13:00-15:00')
+
+    def test_invalid_week(self):
+        self.week['day_2'] = '16:10-18:00'
+        response = self.client.post(self.url, self.week)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['weekly_form'].errors)
+        self.assertFalse(TeacherAvailability.objects.exists())
+
+    def test_add_and_delete_exception(self):
+        day = date.today() + timedelta(3)
+        response = self.client.post(self.url, {'date': day, 'times': '', 'exception': ''})
+        self.assertRedirects(response, self.url, status_code=302, target_status_code=200)
+        exception = AvailabilityException.objects.get(teacher=self.teacher)
+        self.assertEqual((exception.date, slots_from_bytes(exception.slots)), (day, 0))
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['exceptions'], [(exception, '')])
+
+        self.client.post(self.url, {'id': exception.id, 'delete_exception': ''})
+        self.assertFalse(AvailabilityException.objects.exists())
+
+    def test_cannot_add_exception_in_the_past(self):
+        response = self.client.post(self.url, {'date': date.today() - timedelta(1), 'times': '', 'exception': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('date', response.context['exception_form'].errors)
+        self.assertFalse(AvailabilityException.objects.exists())
+
+    def test_cannot_delete_another_teachers_exception(self):
+        other = User.objects.get(email='jane.doe@example.org')
+        exception = AvailabilityException.objects.create(teacher=other, date=date.today(), slots=slots_to_bytes(TEACHING_SLOTS, DAY_BYTES))
+        self.client.post(self.url, {'id': exception.id, 'delete_exception': ''})
+        self.assertTrue(AvailabilityException.objects.filter(id=exception.id).exists())
@@ -4,6 +4,7 @@ from django.urls import reverse
 from lessons.forms import BookingForm, UserSelectForm
 from lessons.models import User, Booking, Child, Request, Invoice, Transfer
 from lessons.tests.helpers import LogInTester
+from lessons.jobs import run_queued_jobs
 from datetime import date, datetime, time
 
 
@@ -345,11 +346,17 @@ class BookLessonTestCase(TestCase,LogInTester):
         response = self.client.post(self.url, self.form_input, follow=True)
         self.assertContains(response,'Booking updated successfully')
         self.assertContains(response,'Pricing for booking has decreased')
-        self.assertContains(response,'Client has been given a refund')
+        self.assertContains(response,'Client will be given a refund')
         self.assertTemplateUsed(response, 'book_lesson.html')
         form = response.context['form']
         self.assertTrue(isinstance(form, BookingForm))
         self.assertTrue(form.is_bound)
+        # The refund is made by a worker
+        self.assertFalse(Transfer.objects.filter(refund=True).exists())
+        self.assertEqual(run_queued_jobs(), (1, 0))
+        self.invoice.refresh_from_db()
+        self.assertEqual(Transfer.objects.get(refund=True).amount, 1000 - self.invoice.amount)
+        self.assertEqual(self.invoice.net_paid(), self.invoice.amount)
         self.assertEqual(Booking.objects.count(), self.before_count)
 
     def test_successful_create_booking_from_request(self):
@@ -0,0 +1,132 @@
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+from lessons.models import User, Child, Booking
+from lessons.ical import feed_token
+from datetime import date, time
+
+class CalendarFeedViewTestCase(TestCase):
+    """Tests of the calendar feed view."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.user = User.objects.get(email="john.doe@example.org")
+        self.user2 = User.objects.get(email="ryan.fuller@example.org")
+        self.teacher = User.objects.get(email="jane.doe@example.org")
+        self.child = Child.objects.get(first_name="Alice",last_name="Doe")
+
+        self.booking = Booking.objects.create(
+            client=self.user,
+            lessons=10,
+            days_between_lessons=14,
+            duration=45,
+            teacher=self.teacher,
+            date=date(2022,1,3),
+            time=time(16),
+            child=self.child
+        )
+
+        self.booking2 = Booking.objects.create(
+            client=self.user2,
+            lessons=2,
+            days_between_lessons=7,
+            duration=60,
+            teacher=self.teacher,
+            date=date(2022,1,4),
+            time=time(9,30),
+        )
+
+        self.url = reverse('calendar_feed', args=[feed_token(self.user)])
+        self.teacher_url = reverse('calendar_feed', args=[feed_token(self.teacher)])
+
+    def test_feed_has_an_event_for_each_booking(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        content = response.content.decode()
+        self.assertTrue(content.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(content.count('BEGIN:VEVENT'), 1)
+        self.assertIn('DTSTART:20220103T160000\r\n', content)
+        self.assertIn('DURATION:PT45M\r\n', content)
+        self.assertIn('RRULE:FREQ=WEEKLY;INTERVAL=2;COUNT=10\r\n', content)
+        self.assertIn('SUMMARY:Lesson with Jane Doe for Alice\r\n', content)
+
+    def test_teacher_feed_has_all_their_bookings(self):
+        response = self.client.get(self.teacher_url)
+        content = response.content.decode()
+        self.assertEqual(content.count('BEGIN:VEVENT'), 2)
+        self.assertIn('RRULE:FREQ=WEEKLY;INTERVAL=1;COUNT=2\r\n', content)
+        self.assertIn('SUMMARY:Lesson with Alice Doe\r\n', content)
+        self.assertIn('SUMMARY:Lesson with Ryan Fuller\r\n', content)
+
+    def test_feed_does_not_need_log_in(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_token(self):
+        response = self.client.get(reverse('calendar_feed', args=[feed_token(self.user) + 'x']))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('calendar_feed', args=[str(self.user.id)]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_unchanged_feed_is_not_modified(self):
+        response = self.client.get(self.url)
+        # Checking the feed secret and looking up the state of the feed
+        with self.assertNumQueries(2):
+            not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+    def test_editing_a_booking_changes_the_feed(self):
+        response = self.client.get(self.url)
+        self.booking.lessons = 5
+        self.booking.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertIn('COUNT=5', changed.content.decode())
+
+    def test_deleting_a_booking_changes_the_feed(self):
+        response = self.client.get(self.teacher_url)
+        self.booking2.delete()
+        changed = self.client.get(self.teacher_url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.content.decode().count('BEGIN:VEVENT'), 1)
+
+    def test_deleting_a_booking_changes_the_feed_for_clients_without_the_etag(self):
+        response = self.client.get(self.teacher_url)
+        self.assertNotIn('Last-Modified', response)
+        self.booking2.delete()
+        changed = self.client.get(self.teacher_url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.content.decode().count('BEGIN:VEVENT'), 1)
+
+    def test_feed_size_depends_on_bookings_not_lessons(self):
+        size = len(self.client.get(self.url).content)
+        self.booking.lessons = 1000
+        self.booking.save()
+        self.assertLessEqual(len(self.client.get(self.url).content), size + 3)
+
+    def test_schedule_links_to_feed(self):
+        self.client.login(username=self.teacher.email, password='Password123')
+        response = self.client.get(reverse('schedule'))
+        self.assertContains(response, f'http://testserver{self.teacher_url}')
+
+    def test_replacing_the_link_stops_the_old_one_working(self):
+        self.client.login(username=self.user.email, password='Password123')
+        response = self.client.post(reverse('reset_calendar_feed'), follow=True)
+        self.assertRedirects(response, reverse('schedule'))
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        new_url = reverse('calendar_feed', args=[feed_token(User.objects.get(pk=self.user.pk))])
+        self.assertContains(response, f'http://testserver{new_url}')
+        self.assertEqual(self.client.get(new_url).status_code, 200)
+        self.assertEqual(self.client.get(self.teacher_url).status_code, 200)
+
+    def test_replacing_the_link_needs_a_post(self):
+        self.client.login(username=self.user.email, password='Password123')
+        response = self.client.get(reverse('reset_calendar_feed'))
+        self.assertEqual(response.status_code, 405)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
@@ -0,0 +1,116 @@
+import csv
+from django.test import TestCase
+from django.urls import reverse
+from lessons.models import User, Booking, Transfer, Invoice
+from datetime import date, time
+
+class ExportBillingViewTestCase(TestCase):
+    """Tests of the billing export views."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.user = User.objects.get(email="john.doe@example.org")
+        self.user2 = User.objects.get(email="ryan.fuller@example.org")
+        self.teacher = User.objects.get(email="jane.doe@example.org")
+
+        self.invoices = []
+        for client, invoice_date in [(self.user, date(2022,9,5)), (self.user, date(2022,11,21)), (self.user2, date(2023,1,10))]:
+            booking = Booking.objects.create(
+                client=client,
+                lessons=2,
+                days_between_lessons=7,
+                duration=60,
+                teacher=self.teacher,
+                date=date(2022,1,1),
+                time=time(16),
+            )
+            self.invoices.append(Invoice.objects.create(
+                booking=booking,
+                invoice_ref=booking.invoice_reference(),
+                date=invoice_date,
+                due_by_date=invoice_date,
+                amount=60,
+                refund=False
+            ))
+
+        Transfer.objects.create(invoice=self.invoices[0], date=date(2022,9,10), amount=60, refund=False)
+        Transfer.objects.create(invoice=self.invoices[1], date=date(2022,11,25), amount=100, refund=False)
+        Transfer.objects.create(invoice=self.invoices[1], date=date(2022,11,25), amount=40, refund=True)
+
+        self.client.login(username='marty.major@example.org', password='Password123')
+
+    def test_export_urls(self):
+        self.assertEqual(reverse('export_invoices'), '/billing/export/invoices.csv')
+        self.assertEqual(reverse('export_transfers'), '/billing/export/transfers.csv')
+        self.assertEqual(reverse('export_balances'), '/billing/export/balances.csv')
+
+    def test_export_invoices(self):
+        response = self.client.get(reverse('export_invoices'))
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="invoices.csv"')
+        rows = self._rows(response)
+        self.assertEqual(rows[0][:3], ['ID', 'Invoice Ref', 'Client'])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[2], [str(self.invoices[1].id), self.invoices[1].invoice_ref, 'john.doe@example.org',
+            '2022-11-21', '2022-11-21', '60.00', '100.00', '40.00', '60.00', '0.00', 'False'])
+
+    def test_export_transfers_in_date_range(self):
+        response = self.client.get(reverse('export_transfers'), {'start_date': '2022-11-01', 'end_date': '2022-11-30'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transfers_2022-11-01_2022-11-30.csv"')
+        rows = self._rows(response)
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[2][1:], ['2022-11-25', self.invoices[1].invoice_ref, 'john.doe@example.org', '40.00', 'True'])
+
+    def test_export_balances(self):
+        rows = self._rows(self.client.get(reverse('export_balances')))
+        balances = {row[1]: row[4:] for row in rows[1:]}
+        self.assertEqual(balances['john.doe@example.org'], ['120.00', '160.00', '40.00', '120.00', '0.00'])
+        self.assertEqual(balances['ryan.fuller@example.org'], ['60.00', '0.00', '0.00', '0.00', '60.00'])
+        for student in User.objects.students():
+            self.assertEqual(balances[student.email][4], f'{student.total_owed():.2f}')
+
+    def test_export_balances_for_term(self):
+        # Term two runs from 2022-10-31 to 2022-12-16
+        rows = self._rows(self.client.get(reverse('export_balances'), {'term': 2}))
+        balances = {row[1]: row[4:] for row in rows[1:]}
+        self.assertEqual(balances['john.doe@example.org'], ['60.00', '100.00', '40.00', '60.00', '0.00'])
+        self.assertEqual(balances['ryan.fuller@example.org'], ['0.00', '0.00', '0.00', '0.00', '0.00'])
+
+    def test_term_and_dates_are_combined(self):
+        rows = self._rows(self.client.get(reverse('export_invoices'), {'term': 2, 'end_date': '2022-11-01'}))
+        self.assertEqual(len(rows), 1)
+
+    def test_invalid_filters(self):
+        response = self.client.get(reverse('export_invoices'), {'start_date': '2022-12-01', 'end_date': '2022-11-01'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get(reverse('export_invoices'), {'term': 1000})
+        self.assertEqual(response.status_code, 400)
+
+    def test_export_queries_do_not_grow_with_rows(self):
+        with self.assertNumQueries(3):
+            self._rows(self.client.get(reverse('export_balances')))
+
+    def test_text_which_would_run_as_a_formula_is_escaped(self):
+        User.objects.filter(pk=self.user2.pk).update(first_name='=HYPERLINK("http://example.org")', last_name='-Fuller')
+        rows = self._rows(self.client.get(reverse('export_balances')))
+        balances = {row[1]: row for row in rows[1:]}
+        self.assertEqual(balances['ryan.fuller@example.org'][2:4], ['\'=HYPERLINK("http://example.org")', "'-Fuller"])
+        self.assertEqual(balances['john.doe@example.org'][2:4], ['John', 'Doe'])
+
+    def test_students_cannot_export(self):
+        self.client.login(username=self.user.email, password='Password123')
+        response = self.client.get(reverse('export_invoices'))
+        self.assertContains(response, '403 Forbidden', status_code=403)
+
+    def test_billing_page_links_to_exports(self):
+        response = self.client.get(reverse('billing'))
+        self.assertContains(response, reverse('export_invoices'))
+        self.assertContains(response, reverse('export_balances'))
+
+    def _rows(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
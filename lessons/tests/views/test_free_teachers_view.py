@@ -0,0 +1,51 @@
+"""Tests of the free teachers view."""
+from datetime import date, time
+from django.test import TestCase
+from django.urls import reverse
+from lessons.models import User, Booking
+
+class FreeTeachersViewTestCase(TestCase):
+    """Tests of the free teachers view."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.url = reverse('free_teachers')
+        self.admin = User.objects.get(email='petra.pickles@example.org')
+        self.teacher = User.objects.get(email='norma.noe@example.org')
+        self.teacher2 = User.objects.get(email='jane.doe@example.org')
+        self.student = User.objects.get(email='john.doe@example.org')
+        self.search = {'day_of_week': 0, 'time': '16:00', 'duration': 60, 'lessons': 4, 'days_between_lessons': 7, 'start_date': '2022-09-05'}
+        self.client.login(username=self.admin.email, password='Password123')
+
+    def test_free_teachers_url(self):
+        self.assertEqual(self.url, '/free_teachers/')
+
+    def test_get_free_teachers_without_a_search(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'free_teachers.html')
+        self.assertIsNone(response.context['teachers'])
+
+    def test_students_cannot_find_free_teachers(self):
+        self.client.login(username=self.student.email, password='Password123')
+        response = self.client.get(self.url, self.search)
+        self.assertEqual(response.status_code, 403)
+
+    def test_free_teachers_are_listed_first(self):
+        Booking.objects.create(client=self.student, teacher=self.teacher2, date=date(2022, 9, 19), time=time(16, 30),
+            lessons=1, days_between_lessons=7, duration=30)
+        response = self.client.get(self.url, self.search)
+        self.assertEqual(response.context['teachers'], [
+            (self.teacher, True, '09:00-20:00'),
+            (self.teacher2, False, '09:00-16:30, 17:00-20:00'),
+        ])
+        self.assertContains(response, f'id="teacher-{self.teacher2.id}"')
+
+    def test_invalid_search(self):
+        self.search['lessons'] = 0
+        response = self.client.get(self.url, self.search)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.context['teachers'])
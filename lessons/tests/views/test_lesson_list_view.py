@@ -1,6 +1,8 @@
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.urls import reverse
-from lessons.models import User, Child, Request, Booking
+from lessons.models import User, Child, Request, Booking, Invoice
 from datetime import date, time, timedelta
 
 class ListLessonsViewTestCase(TestCase):
@@ -135,4 +137,36 @@ class ListLessonsViewTestCase(TestCase):
         response = self.client.post(self.url, self.data, follow=True)
         request_count_after = Request.objects.count()
         self.assertEqual(request_count_before, request_count_after)
-        self.assertTemplateUsed(response, 'list_lessons.html')
\ No newline at end of file
+        self.assertTemplateUsed(response, 'list_lessons.html')
+
+    def test_query_count_does_not_grow_with_bookings(self):
+        self.client.login(username=self.user.email, password='Password123')
+        self._create_invoiced_bookings(2)
+        with CaptureQueriesContext(connection) as few_bookings:
+            self.client.get(reverse('list_lessons'))
+        self._create_invoiced_bookings(10)
+        with CaptureQueriesContext(connection) as many_bookings:
+            response = self.client.get(reverse('list_lessons'))
+        self.assertEqual(len(few_bookings), len(many_bookings))
+        for invoice in Invoice.objects.all():
+            self.assertContains(response, reverse('invoice', args=[invoice.id]))
+
+    def _create_invoiced_bookings(self, count):
+        for _ in range(count):
+            booking = Booking.objects.create(
+                client=self.user,
+                lessons=2,
+                days_between_lessons=7,
+                duration=60,
+                teacher=self.teacher,
+                date=date(2022,1,1),
+                time=time(16),
+                child=self.child
+            )
+            Invoice.objects.create(
+                booking=booking,
+                invoice_ref=booking.invoice_reference(),
+                date="2022-11-21",
+                due_by_date=booking.date,
+                amount=booking.calculate_price(),
+            )
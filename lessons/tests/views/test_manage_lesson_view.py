@@ -1,6 +1,6 @@
 from django.test import TestCase
 from django.urls import reverse
-from lessons.models import User, Child, Request, Booking
+from lessons.models import User, Child, Request, Booking, Term
 from datetime import date, time, timedelta
 
 class ManageLessonsViewTestCase(TestCase):
@@ -95,4 +95,58 @@ class ManageLessonsViewTestCase(TestCase):
     def test_admin_can_see_all_bookings(self):
         response = self.client.get(self.url)
         for booking in Request.objects.all():
-            self.assertContains(response,f'booking-{booking.id}')
\ No newline at end of file
+            self.assertContains(response,f'booking-{booking.id}')
+
+    def test_bookings_are_paginated(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(list(response.context['bookings']), [self.booking, self.booking2])
+        self.assertNotContains(response, f'booking-{self.booking3.id}"')
+        next_url = response.context['bookings'].next_url
+        self.assertIn(f'bookings_after={self.booking2.id}', next_url)
+        self.assertIn('page_size=2', next_url)
+
+        response = self.client.get(self.url + next_url)
+        self.assertEqual(list(response.context['bookings']), [self.booking3])
+        self.assertEqual(response.context['active_tab'], 'bookings')
+        self.assertIsNone(response.context['bookings'].next_url)
+
+        response = self.client.get(self.url + response.context['bookings'].previous_url)
+        self.assertEqual(list(response.context['bookings']), [self.booking, self.booking2])
+        self.assertIsNone(response.context['bookings'].previous_url)
+
+    def test_tabs_are_paginated_separately(self):
+        response = self.client.get(self.url, {'page_size': 1, 'requests_after': self.request1.id})
+        self.assertEqual(list(response.context['active_requests']), [self.request2])
+        self.assertEqual(list(response.context['bookings']), [self.booking])
+
+    def test_filter_bookings_by_client(self):
+        response = self.client.get(self.url, {'client': self.user2.email})
+        self.assertEqual(list(response.context['bookings']), [self.booking3])
+        self.assertEqual(list(response.context['fulfilled_requests']), [self.request3])
+        self.assertEqual(list(response.context['active_requests']), [])
+
+    def test_filter_bookings_by_teacher(self):
+        other_teacher = User.objects.get(email="norma.noe@example.org")
+        response = self.client.get(self.url, {'teacher': other_teacher.id})
+        self.assertEqual(list(response.context['bookings']), [])
+
+    def test_filter_bookings_by_term(self):
+        term = Term.objects.create(name="Winter", start_date=date(2021,12,20), end_date=date(2022,1,7))
+        booking = Booking.objects.create(
+            client=self.user,
+            lessons=2,
+            days_between_lessons=7,
+            duration=60,
+            teacher=self.teacher,
+            date=date(2022,9,5),
+            time=time(16),
+        )
+        response = self.client.get(self.url, {'term': term.id})
+        self.assertEqual(list(response.context['bookings']), [self.booking, self.booking2, self.booking3])
+        self.assertNotIn(booking, response.context['bookings'])
+
+    def test_invalid_filters_are_ignored(self):
+        response = self.client.get(self.url, {'page_size': 1000, 'teacher': 'x'})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['form'].is_valid())
+        self.assertEqual(len(response.context['bookings']), 3)
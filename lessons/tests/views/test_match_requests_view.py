@@ -0,0 +1,68 @@
+"""Tests of the match requests view."""
+from datetime import date, timedelta
+from django.test import TestCase
+from django.urls import reverse
+from lessons.models import User, Booking, Invoice, Request, Term
+
+class MatchRequestsViewTestCase(TestCase):
+    """Tests of the match requests view."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.url = reverse('match_requests')
+        self.admin = User.objects.get(email='petra.pickles@example.org')
+        self.student = User.objects.get(email='john.doe@example.org')
+        start = date.today() + timedelta(30)
+        self.term = Term.objects.create(name='Future term', start_date=start, end_date=start + timedelta(49))
+        self.request = Request.objects.create(client=self.student, availability='Mondays after 4pm', lessons=3,
+            days_between_lessons=7, duration=60, info='')
+        self.client.login(username=self.admin.email, password='Password123')
+
+    def test_match_requests_url(self):
+        self.assertEqual(self.url, '/match_requests/')
+
+    def test_get_match_requests_without_a_term(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'match_requests.html')
+        self.assertIsNone(response.context['proposal'])
+
+    def test_get_proposal(self):
+        response = self.client.get(self.url, {'term': self.term.id})
+        proposal = response.context['proposal']
+        self.assertEqual(len(proposal.matches), 1)
+        self.assertContains(response, f'id="match-{self.request.id}"')
+        self.assertContains(response, proposal.matches[0].key)
+
+    def test_invalid_term(self):
+        response = self.client.get(self.url, {'term': 1000})
+        self.assertIsNone(response.context['proposal'])
+        self.assertFalse(response.context['form'].is_valid())
+
+    def test_book_accepted_matches(self):
+        proposal = self.client.get(self.url, {'term': self.term.id}).context['proposal']
+        response = self.client.post(self.url, {'match': [match.key for match in proposal.matches]}, follow=True)
+        self.assertRedirects(response, reverse('manage_lessons'))
+        self.assertContains(response, 'Booked 1 lessons')
+        booking = Booking.objects.get(client=self.student)
+        self.assertTrue(self.term.start_date <= booking.date <= self.term.end_date)
+        self.assertEqual(booking.date.weekday(), 0)
+        self.assertTrue(Invoice.objects.filter(booking=booking).exists())
+        self.assertTrue(Request.objects.get(pk=self.request.pk).fulfilled)
+
+    def test_booking_twice_is_skipped(self):
+        proposal = self.client.get(self.url, {'term': self.term.id}).context['proposal']
+        keys = [match.key for match in proposal.matches]
+        self.client.post(self.url, {'match': keys})
+        response = self.client.post(self.url, {'match': keys}, follow=True)
+        self.assertContains(response, '1 requests were not booked')
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_students_cannot_match_requests(self):
+        self.client.login(username=self.student.email, password='Password123')
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.post(self.url, {'match': ['1/6/2023-06-05/16:00/3']}).status_code, 403)
+        self.assertFalse(Booking.objects.exists())
@@ -3,6 +3,7 @@ from django.urls import reverse
 from lessons.models import User, Child, Request, Booking, Transfer, Invoice
 from datetime import date, time, timedelta
 from lessons.forms import TransferForm
+from lessons.jobs import run_queued_jobs
 
 class PaymentsViewTestCase(TestCase):
     """Tests of the payments view."""
@@ -152,13 +153,18 @@ class PaymentsViewTestCase(TestCase):
         before_count = Transfer.objects.count()
         response = self.client.post(self.url, self.form_input)
         after_count = Transfer.objects.count()
-        self.assertEqual(after_count, before_count+2)# 1 payment, 1 refund transfer
+        self.assertEqual(after_count, before_count+1)# The refund is made by a worker
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'payments.html')
         form = response.context['form']
         self.assertTrue(isinstance(form, TransferForm))
         self.assertContains(response,"You have overpaid")
         self.assertTrue(form.is_valid())
+        self.assertEqual(run_queued_jobs(), (1, 0))
+        refund = Transfer.objects.get(refund=True)
+        self.assertEqual(refund.invoice_id, 1)
+        self.assertEqual(Transfer.objects.count(), before_count+2)# 1 payment, 1 refund transfer
+        self.assertEqual(Invoice.objects.get(id=1).net_paid(), Invoice.objects.get(id=1).amount)
 
     def test_view_shows_all_students_balance_info(self):
         response = self.client.get(self.url)
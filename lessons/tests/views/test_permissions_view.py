@@ -1,4 +1,7 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from lessons.models import User
 
@@ -63,7 +66,102 @@ class PermissionsViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertTemplateUsed(response, 'permissions.html')
 
+    def test_change_role_of_director(self):
+        director = User.objects.create_user('other.director@example.org', first_name='Other', last_name='Director', role=User.DIRECTOR)
+        self.client.post(self.url, {'id': director.id, 'role': User.ADMIN})
+        self.assertEqual(User.objects.get(pk=director.id).role, User.ADMIN)
+
     def test_page_displays_all_users(self):
         response = self.client.get(self.url)
         for user in User.objects.all():
-            self.assertContains(response,f'user-{user.id}')
\ No newline at end of file
+            self.assertContains(response,f'user-{user.id}')
+
+    def test_search_users(self):
+        response = self.client.get(self.url, {'search': 'doe'})
+        self.assertContains(response, f'user-{self.user3.id}')
+        self.assertNotContains(response, f'user-{self.user2.id}"')
+
+    def test_filter_users_by_role(self):
+        response = self.client.get(self.url, {'role': User.ADMIN})
+        for user in User.objects.all():
+            if user.role == User.ADMIN:
+                self.assertContains(response, f'id="user-{user.id}"')
+            else:
+                self.assertNotContains(response, f'id="user-{user.id}"')
+
+    def test_users_are_paged(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(len(response.context['users']), 2)
+        self.assertTrue(response.context['users'].has_next)
+        response = self.client.get(self.url + response.context['users'].next_url)
+        self.assertEqual([user.id for user in response.context['users']], [3, 4])
+
+
+class BulkPermissionsViewTestCase(TestCase):
+    """Tests of the bulk permissions view."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.director = User.objects.get(email='marty.major@example.org')
+        self.student = User.objects.get(email='john.doe@example.org')
+        self.student2 = User.objects.get(email='ryan.fuller@example.org')
+        self.url = reverse('bulk_permissions')
+        self.client.login(username=self.director.email, password='Password123')
+
+    def test_bulk_permissions_url(self):
+        self.assertEqual(self.url, '/permissions/bulk/')
+
+    def test_change_roles_from_lines(self):
+        response = self.client.post(self.url, {'roles': f'{self.student.id},TEACHER\n{self.student2.id}, admin\n'}, follow=True)
+        self.assertRedirects(response, reverse('permissions'))
+        self.assertEqual(User.objects.get(pk=self.student.id).role, User.TEACHER)
+        self.assertEqual(User.objects.get(pk=self.student2.id).role, User.ADMIN)
+        self.assertContains(response, 'Updated the role of 2 users')
+
+    def test_change_roles_from_csv_file(self):
+        csv_file = SimpleUploadedFile('roles.csv', f'id,role\n{self.student.id},TEACHER\n'.encode(), content_type='text/csv')
+        self.client.post(self.url, {'csv_file': csv_file})
+        self.assertEqual(User.objects.get(pk=self.student.id).role, User.TEACHER)
+
+    def test_change_roles_from_json(self):
+        response = self.client.post(self.url, {'roles': [[self.student.id, 'TEACHER'], [100000, 'ADMIN'], [self.director.id, 'STUDENT']]},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'updated': 2, 'skipped': [100000]})
+        self.assertEqual(User.objects.get(pk=self.student.id).role, User.TEACHER)
+        self.assertEqual(User.objects.get(pk=self.director.id).role, User.STUDENT)
+
+    def test_invalid_json(self):
+        response = self.client.post(self.url, {'roles': [[self.student.id, 'DIRECTOR']]}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, '{"users": []}', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(User.objects.get(pk=self.student.id).role, User.STUDENT)
+
+    def test_invalid_line_changes_nothing(self):
+        response = self.client.post(self.url, {'roles': f'{self.student.id},TEACHER\nabc,TEACHER'}, follow=True)
+        self.assertEqual(User.objects.get(pk=self.student.id).role, User.STUDENT)
+        self.assertContains(response, 'is not a user id')
+
+    def test_queries_do_not_grow_with_users(self):
+        users = User.objects.bulk_create([
+            User(email=f'new.teacher.{i}@example.org', first_name='New', last_name='Teacher', role=User.STUDENT)
+            for i in range(200)
+        ])
+        lines = '\n'.join(f'{user.id},TEACHER' for user in User.objects.filter(email__startswith='new.teacher'))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(self.url, {'roles': lines})
+        self.assertLess(len(queries), 15)
+        self.assertEqual(User.objects.filter(email__startswith='new.teacher', role=User.TEACHER).count(), 200)
+
+    def test_students_cannot_change_roles(self):
+        self.client.login(username=self.student.email, password='Password123')
+        response = self.client.post(self.url, {'roles': f'{self.student.id},ADMIN'})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(User.objects.get(pk=self.student.id).role, User.STUDENT)
+
+    def test_get_is_not_allowed(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
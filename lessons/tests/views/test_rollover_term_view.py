@@ -0,0 +1,67 @@
+"""Tests of the rollover term view."""
+from datetime import date, time
+from django.test import TestCase
+from django.urls import reverse
+from lessons.models import User, Booking, Invoice, Term
+
+class RolloverTermViewTestCase(TestCase):
+    """Tests of the rollover term view."""
+
+    fixtures = [
+        'lessons/tests/fixtures/test_data.json',
+    ]
+
+    def setUp(self):
+        self.url = reverse('rollover_term')
+        self.admin = User.objects.get(email='petra.pickles@example.org')
+        self.student = User.objects.get(email='john.doe@example.org')
+        self.student2 = User.objects.get(email='ryan.fuller@example.org')
+        self.teacher = User.objects.get(email='norma.noe@example.org')
+        self.booking = Booking.objects.create(client=self.student, teacher=self.teacher, date=date(2022, 9, 5), time=time(16),
+            lessons=7, days_between_lessons=7, duration=60)
+        self.clash = Booking.objects.create(client=self.student2, teacher=self.teacher, date=date(2022, 9, 5), time=time(16, 30),
+            lessons=7, days_between_lessons=7, duration=30)
+        self.terms = {'from_term': 1, 'to_term': 2}
+        self.client.login(username=self.admin.email, password='Password123')
+
+    def test_rollover_term_url(self):
+        self.assertEqual(self.url, '/rollover_term/')
+
+    def test_get_rollover_term_without_terms(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'rollover_term.html')
+        self.assertIsNone(response.context['proposal'])
+        # Every fixture term is over, so the last one is rolled over by default
+        self.assertEqual(response.context['form'].initial['from_term'], Term.objects.get(pk=6))
+
+    def test_get_proposal(self):
+        response = self.client.get(self.url, self.terms)
+        proposal = response.context['proposal']
+        self.assertEqual([rollover.booking for rollover in proposal.bookable], [self.booking])
+        self.assertEqual([rollover.booking for rollover in proposal.problems], [self.clash])
+        self.assertContains(response, f'id="rollover-{self.booking.id}"')
+        self.assertContains(response, f'id="problem-{self.clash.id}"')
+
+    def test_terms_in_the_wrong_order(self):
+        response = self.client.get(self.url, {'from_term': 2, 'to_term': 1})
+        self.assertIsNone(response.context['proposal'])
+        self.assertIn('to_term', response.context['form'].errors)
+
+    def test_book_selected(self):
+        response = self.client.post(self.url, {**self.terms, 'booking': [self.booking.id]}, follow=True)
+        self.assertRedirects(response, reverse('manage_lessons'), status_code=302, target_status_code=200)
+        self.assertContains(response, 'Booked 1 bookings into Term two')
+        new = Booking.objects.get(date=date(2022, 10, 31))
+        self.assertEqual((new.client, new.teacher, new.lessons), (self.student, self.teacher, 7))
+        self.assertTrue(Invoice.objects.filter(booking=new).exists())
+
+    def test_book_nothing_selected(self):
+        self.client.post(self.url, self.terms)
+        self.assertEqual(Booking.objects.count(), 2)
+
+    def test_students_cannot_roll_over(self):
+        self.client.login(username=self.student.email, password='Password123')
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.post(self.url, {**self.terms, 'booking': [self.booking.id]}).status_code, 403)
+        self.assertEqual(Booking.objects.count(), 2)
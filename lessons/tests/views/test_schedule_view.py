@@ -120,4 +120,12 @@ class ScheduleViewTestCase(TestCase):
         self.client.login(username=self.user.email, password='Password123')
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, 200)
-        self.assertTemplateUsed(response, 'schedule.html')
\ No newline at end of file
+        self.assertTemplateUsed(response, 'schedule.html')
+
+    def test_schedule_only_shows_lessons_in_month(self):
+        self.client.login(username=self.teacher.email, password='Password123')
+        url = reverse('view_booking', args=[self.booking.id])
+        response = self.client.get(reverse('schedule_custom', kwargs={'year': 2022, 'month': 1}))
+        self.assertContains(response, f'href="{url}"', count=2)
+        response = self.client.get(reverse('schedule_custom', kwargs={'year': 2022, 'month': 2}))
+        self.assertNotContains(response, f'href="{url}"')
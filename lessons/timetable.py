@@ -0,0 +1,245 @@
+"""
+When teachers can teach and when they are free, as bitsets of 15 minute slots.
+
+A day is 96 slots, the bit of a slot being its number counting from midnight. A week is the
+7 days one after the other, Monday first, so a week is a 672 bit integer and the slot of a day is
+at bit weekday * 96 + slot.
+
+A teacher's usual week is stored in TeacherAvailability and changes to single dates in
+AvailabilityException. Teachers who haven't given their times can teach at any time in the teaching day.
+Their bookings are overlaid on top, so finding who is free is a few ANDs and shifts per lesson.
+"""
+import re
+from collections import defaultdict
+from datetime import time, timedelta
+from lessons.models import User, Booking, TeacherAvailability, AvailabilityException, first_weekday_on_or_after, nth_lesson_date
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+DAY_SLOTS = (1 << SLOTS_PER_DAY) - 1
+DAY_BYTES = SLOTS_PER_DAY // 8
+WEEK_BYTES = 7 * DAY_BYTES
+
+# Lessons are only matched to times within the teaching day
+TEACHING_DAY = (time(9), time(20))
+
+""" Get the number of the 15 minute slot a time falls in, counting from midnight"""
+def slot_of(t):
+    return (t.hour * 60 + t.minute) // SLOT_MINUTES
+
+""" Get the time a 15 minute slot starts"""
+def time_of_slot(slot):
+    return time(*divmod(slot * SLOT_MINUTES, 60))
+
+""" Get a bitmask of the slots from the first up to, but not including, the last"""
+def slots_mask(first, last):
+    return ((1 << (last - first)) - 1) << first if last > first else 0
+
+""" Get a bitmask of the slots taken by a lesson starting at a slot"""
+def lesson_mask(start_slot, duration):
+    return slots_mask(start_slot, start_slot + duration // SLOT_MINUTES)
+
+""" Get a bitmask of every slot a lesson starting at a time is in, the slots it only starts or ends part way through included"""
+def time_mask(start, duration):
+    slot = timedelta(minutes=SLOT_MINUTES)
+    start = timedelta(hours=start.hour, minutes=start.minute, seconds=start.second, microseconds=start.microsecond)
+    return slots_mask(start // slot, -(-(start + timedelta(minutes=duration)) // slot))
+
+""" Get the slots in a bitmask where a lesson of the given duration could start and only use slots in the bitmask"""
+def lesson_starts(free, duration):
+    starts = free
+    for offset in range(1, duration // SLOT_MINUTES):
+        starts &= free >> offset
+    return starts
+
+""" Count the slots in a bitmask, int.bit_count() needs Python 3.10"""
+def count_slots(mask):
+    return bin(mask).count('1')
+
+""" Get the numbers of the bits which are set, lowest first"""
+def set_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+TEACHING_SLOTS = slots_mask(slot_of(TEACHING_DAY[0]), slot_of(TEACHING_DAY[1]))
+
+# ---- Weeks
+
+""" Get the slots of one day of a week"""
+def day_of_week(week, weekday):
+    return week >> (weekday * SLOTS_PER_DAY) & DAY_SLOTS
+
+""" Get a week with the slots of one day replaced"""
+def with_day(week, weekday, slots):
+    shift = weekday * SLOTS_PER_DAY
+    return week & ~(DAY_SLOTS << shift) | (slots & DAY_SLOTS) << shift
+
+""" Get a week with the same slots every day"""
+def every_day(slots):
+    week = 0
+    for weekday in range(7):
+        week = with_day(week, weekday, slots)
+    return week
+
+""" Get the Monday of the week a date is in"""
+def monday_of(day):
+    return day - timedelta(day.weekday())
+
+# The week of teachers who haven't said when they can teach
+DEFAULT_WEEK = every_day(TEACHING_SLOTS)
+
+""" Store slots as bytes"""
+def slots_to_bytes(slots, size):
+    return slots.to_bytes(size, 'little')
+
+""" Read slots stored as bytes"""
+def slots_from_bytes(data):
+    return int.from_bytes(bytes(data), 'little')
+
+WINDOW = re.compile(r'^(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})$')
+
+"""
+Read the slots of a day from times like '09:00-12:00, 14:30-18:00'
+
+Raises ValueError if a time isn't on a 15 minute boundary or a window ends before it starts.
+"""
+def parse_windows(text):
+    slots = 0
+    for window in filter(None, (part.strip() for part in text.split(','))):
+        match = WINDOW.match(window)
+        if match is None:
+            raise ValueError(f'{window!r} is not a time range like 09:00-12:00')
+        start_hour, start_minute, end_hour, end_minute = map(int, match.groups())
+        start, end = start_hour * 60 + start_minute, end_hour * 60 + end_minute
+        if start % SLOT_MINUTES or end % SLOT_MINUTES:
+            raise ValueError(f'{window!r} needs to start and end on the hour or at a quarter past, half past or quarter to')
+        if not start < end <= 24 * 60:
+            raise ValueError(f'{window!r} needs to end after it starts, by midnight')
+        slots |= slots_mask(start // SLOT_MINUTES, end // SLOT_MINUTES)
+    return slots
+
+""" Write the slots of a day as times like '09:00-12:00, 14:30-18:00'"""
+def format_windows(slots):
+    windows = []
+    start = None
+    for slot in range(SLOTS_PER_DAY + 1):
+        is_set = slot < SLOTS_PER_DAY and slots >> slot & 1
+        if is_set and start is None:
+            start = slot
+        elif not is_set and start is not None:
+            end = '24:00' if slot == SLOTS_PER_DAY else f'{time_of_slot(slot):%H:%M}'
+            windows.append(f'{time_of_slot(start):%H:%M}-{end}')
+            start = None
+    return ', '.join(windows)
+
+# ---- Teaching hours and free time
+
+class TeachingHours:
+    """ When teachers can teach, from their usual weeks and the exceptions on single dates"""
+
+    def __init__(self, weeks, exceptions):
+        # The usual week of each teacher who has given one
+        self.weeks = weeks
+        # The slots of each (teacher id, date) which differs from the usual week
+        self.exceptions = exceptions
+        self.customised_ids = set(weeks) | {teacher_id for teacher_id, _ in exceptions}
+
+    """ Load the teaching hours of the teachers between the start and end dates (inclusive)"""
+    @classmethod
+    def load(cls, teacher_ids, start, end):
+        weeks = {teacher_id: slots_from_bytes(week)
+            for teacher_id, week in TeacherAvailability.objects.filter(teacher_id__in=teacher_ids).values_list('teacher_id', 'week')}
+        exceptions = {(teacher_id, day): slots_from_bytes(slots)
+            for teacher_id, day, slots in AvailabilityException.objects
+                .filter(teacher_id__in=teacher_ids, date__gte=start, date__lte=end)
+                .values_list('teacher_id', 'date', 'slots')}
+        return cls(weeks, exceptions)
+
+    """ Check whether a teacher has given any teaching hours or exceptions"""
+    def customised(self, teacher_id):
+        return teacher_id in self.customised_ids
+
+    """ Get the slots a teacher can teach in on a date"""
+    def on(self, teacher_id, day):
+        slots = self.exceptions.get((teacher_id, day))
+        if slots is None:
+            slots = day_of_week(self.weeks.get(teacher_id, DEFAULT_WEEK), day.weekday())
+        return slots
+
+    """ Get the slots a teacher can teach in during the week starting on a Monday"""
+    def week(self, teacher_id, monday):
+        week = self.weeks.get(teacher_id, DEFAULT_WEEK)
+        for weekday in range(7):
+            slots = self.exceptions.get((teacher_id, monday + timedelta(weekday)))
+            if slots is not None:
+                week = with_day(week, weekday, slots)
+        return week
+
+class Timetable:
+    """
+    The slots each teacher is free in for every week between two dates, their teaching hours
+    with the lessons they are already booked for taken out
+    """
+
+    def __init__(self, teacher_ids, hours, bookings, start, end):
+        self.teacher_ids = list(teacher_ids)
+        self.hours = hours
+        self.start = start
+        self.end = end
+
+        # The slots each teacher has lessons in, for each week by its Monday
+        self.busy = defaultdict(lambda: defaultdict(int))
+        for booking in bookings:
+            mask = time_mask(booking.time, booking.duration)
+            for lesson_date in booking.dates_between(start, end):
+                self.busy[booking.teacher_id][monday_of(lesson_date)] |= mask << (lesson_date.weekday() * SLOTS_PER_DAY)
+        self.free_weeks = {}
+
+    """ Load the timetable of every teacher between the start and end dates (inclusive)"""
+    @classmethod
+    def load(cls, start, end):
+        teacher_ids = list(User.objects.filter(role=User.TEACHER).order_by('id').values_list('id', flat=True))
+        hours = TeachingHours.load(teacher_ids, start, end)
+        bookings = (Booking.objects.filter(teacher_id__in=teacher_ids).between(start, end)
+            .only('teacher_id', 'date', 'lessons', 'days_between_lessons', 'time', 'duration'))
+        return cls(teacher_ids, hours, bookings, start, end)
+
+    """ Get the slots a teacher is free in during the week starting on a Monday"""
+    def free_week(self, teacher_id, monday):
+        key = (teacher_id, monday)
+        week = self.free_weeks.get(key)
+        if week is None:
+            week = self.hours.week(teacher_id, monday) & ~self.busy[teacher_id].get(monday, 0)
+            self.free_weeks[key] = week
+        return week
+
+    """ Get the slots a teacher is free in on every one of the dates"""
+    def free_on_all(self, teacher_id, dates):
+        free = DAY_SLOTS
+        for day in dates:
+            free &= day_of_week(self.free_week(teacher_id, monday_of(day)), day.weekday())
+        return free
+
+    """ Get the ids of the teachers free for every one of a number of lessons, on a day of the week from a date"""
+    def free_teachers(self, weekday, start, duration, lessons, from_date, days_between_lessons=7):
+        dates = self.checked_dates(weekday, from_date, lessons, days_between_lessons)
+        mask = time_mask(start, duration)
+        return [teacher_id for teacher_id in self.teacher_ids if self.free_on_all(teacher_id, dates) & mask == mask]
+
+    """ Get the times a teacher could start every one of a number of lessons at, on a day of the week from a date"""
+    def free_times(self, teacher_id, weekday, duration, lessons, from_date, days_between_lessons=7):
+        dates = self.checked_dates(weekday, from_date, lessons, days_between_lessons)
+        return [time_of_slot(slot) for slot in set_bits(lesson_starts(self.free_on_all(teacher_id, dates), duration))]
+
+    def checked_dates(self, weekday, from_date, lessons, days_between_lessons):
+        dates = lesson_dates(weekday, from_date, lessons, days_between_lessons)
+        if dates[0] < self.start or dates[-1] > self.end:
+            raise ValueError(f'The lessons need to be between {self.start} and {self.end}')
+        return dates
+
+""" Get the dates of a number of lessons on a day of the week, starting on or after a date"""
+def lesson_dates(weekday, from_date, lessons, days_between_lessons=7):
+    first = first_weekday_on_or_after(from_date, weekday)
+    return [nth_lesson_date(first, n, days_between_lessons) for n in range(lessons)]
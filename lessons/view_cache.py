@@ -0,0 +1,86 @@
+"""
+Caching of read-mostly pages, per user.
+
+Each cached page depends on some kinds of data, eg 'booking' or 'term'. Every kind has a
+version number in the cache, which signals increase whenever one of its rows is saved or deleted.
+The versions are part of the cache keys, so a change makes the old copies unreachable
+instead of having to find and delete them.
+
+Pages are only cached when settings.VIEW_CACHE is set, which needs a cache shared by every process.
+"""
+import hashlib
+from datetime import date
+from functools import wraps
+from time import time_ns
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.http import HttpResponse
+
+VERSION_KEY = 'view_cache:version:{}'
+
+""" Get the current version of each kind of data"""
+def versions(kinds):
+    keys = [VERSION_KEY.format(kind) for kind in kinds]
+    found = cache.get_many(keys)
+    missing = {key: time_ns() for key in keys if key not in found}
+    if missing:
+        # Start from the time rather than 0, so a version which was evicted isn't reused
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+""" Increase the version of a kind of data, so the pages showing it are rendered again"""
+def bump(kind):
+    key = VERSION_KEY.format(kind)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time_ns(), None)
+
+""" Bump a kind of data now, and again when the change is committed, so a page cached before the commit isn't kept"""
+def changed(kind):
+    bump(kind)
+    transaction.on_commit(lambda: bump(kind))
+
+""" Get the key a user's copy of a page is cached under"""
+def view_cache_key(request, view_name, kinds, daily):
+    parts = [
+        view_name,
+        str(request.user.pk),
+        request.user.role,
+        request.get_full_path(),
+        # Forms on the page contain a CSRF token which is only valid with the user's CSRF cookie
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+        *map(str, versions(kinds)),
+    ]
+    if daily:
+        parts.append(date.today().isoformat())
+    return 'view_cache:page:' + hashlib.sha256('\n'.join(parts).encode()).hexdigest()
+
+"""
+Cache the GET responses of a view for each user until the kinds of data it shows change
+
+daily - the page also depends on today's date
+"""
+def cache_per_user(*kinds, timeout=DEFAULT_TIMEOUT, daily=False):
+    def decorator(view_function):
+        @wraps(view_function)
+        def wrapper(request, *args, **kwargs):
+            # Without a CSRF cookie a cached form would have a token the user can't use
+            if not settings.VIEW_CACHE or request.method != 'GET' or settings.CSRF_COOKIE_NAME not in request.COOKIES:
+                return view_function(request, *args, **kwargs)
+
+            key = view_cache_key(request, view_function.__name__, kinds, daily)
+            cached = cache.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return HttpResponse(content, content_type=content_type)
+
+            response = view_function(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming and not response.cookies:
+                cache.set(key, (response.content, response['Content-Type']), timeout)
+            return response
+        return wrapper
+    return decorator
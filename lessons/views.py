@@ -1,4 +1,4 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
@@ -6,13 +6,29 @@ from django.shortcuts import redirect, render
 from django.contrib import messages
 from django import forms
 from django.forms.models import model_to_dict
+from django.core.exceptions import ValidationError
 from django.urls import reverse
 from functools import wraps
 
-from lessons.forms import SignUpForm, LogInForm, UserForm, BookingForm, UserSelectForm, ChildForm, TransferForm, InvoiceForm, CreateLessonRequestForm, TermForm
-from lessons.models import User, Request, Booking, Child, Invoice, Transfer, Term
-from datetime import date, datetime, timedelta
-from calendar import HTMLCalendar
+from lessons.forms import SignUpForm, LogInForm, UserForm, BookingForm, UserSelectForm, ChildForm, TransferForm, InvoiceForm, CreateLessonRequestForm, TermForm, LessonFilterForm, ExportFilterForm, UserFilterForm, BulkRoleForm, MatchRequestsForm, RolloverForm, WeeklyAvailabilityForm, AvailabilityExceptionForm, FreeTeachersForm
+from lessons.models import User, Request, Booking, Child, Invoice, Transfer, Term, TeacherAvailability, AvailabilityException
+from lessons.pagination import KeysetPage
+from lessons.month_calendar import month_skeleton, render_month_rows
+from lessons.view_cache import cache_per_user
+from lessons.middleware import current_role
+from lessons.exports import EXPORTS, csv_lines
+from lessons.ical import feed_token, feed_user_id, feed_state, render_feed, reset_feed_secret
+from django.views.decorators.http import condition, require_GET, require_POST
+from django.db import transaction
+from lessons.roles import ASSIGNABLE_ROLES, parse_role_changes, update_roles
+from lessons.matching import propose_matches, book_matches
+from lessons.rollover import propose_rollover, roll_over
+from lessons.bookings import book
+from lessons.jobs import enqueue, refund_overpayment
+from lessons.timetable import DEFAULT_WEEK, WEEK_BYTES, DAY_BYTES, Timetable, lesson_dates, slots_to_bytes, slots_from_bytes, format_windows
+import json
+from datetime import date, datetime
+from calendar import monthrange
 
 # Decorator which can be used to limit which user roles can see a page
 def allowed_roles(roles):
@@ -20,8 +36,13 @@ def allowed_roles(roles):
         @login_required
         @wraps(view_function)
         def wrapper(request, *args, **kwargs):
-            if not request.user.is_authenticated or request.user.role not in roles:
-                return HttpResponse('403 Forbidden')
+            # The user's role usually comes from the cache, see lessons.middleware
+            role = request.user.role if request.user.is_authenticated else None
+            if role in User.STAFF_ROLES:
+                # The cached copy could be from before the user was demoted or deactivated
+                role = current_role(request.user)
+            if role not in roles:
+                return HttpResponseForbidden('403 Forbidden')
             else:
                 return view_function(request, *args, **kwargs)
         return wrapper
@@ -79,6 +100,7 @@ def log_out(request):
 
 # Shows the schedule of lessons for a teacher / student as a calander view
 @allowed_roles([User.STUDENT, User.TEACHER])
+@cache_per_user('booking', 'user', daily=True)
 def schedule(request,year,month):
 
     # Check if date is valid
@@ -86,8 +108,6 @@ def schedule(request,year,month):
         datetime(year,month,1)
     except ValueError:
         return HttpResponse('Invalid Date')
-    
-    c=HTMLCalendar()
 
     # Work out the previous month for the previous month button
     if month == 12:
@@ -110,65 +130,103 @@ def schedule(request,year,month):
         # Get all bookings for a teacher
         bookings = Booking.objects.filter(teacher=request.user)
 
-    # Get all the lesson dates for all the bookings
-    # as a tuple of the date and booking
-    bookingMap = [(t,b) for b in bookings for t in b.dates()]
+    # Only the lessons in the month being displayed are needed
+    first_day = date(year, month, 1)
+    last_day = date(year, month, monthrange(year, month)[1])
 
     # Create a dictionary where the keys are dates
-    # and the values are a booking which has lessons on that date
-    # The dictionaries keys are sorted by dates ascending
+    # and the values are the bookings which have lessons on that date,
+    # occurrences are ordered by date and time so each list is already sorted
     bookingDateGroup={}
-    for x, y in bookingMap:
-        bookingDateGroup.setdefault(x, []).append(y)
-        bookingDateGroup.setdefault(x, []).sort(key=lambda x: x.time)
+    for lesson_date, booking in bookings.occurrences(first_day, last_day):
+        bookingDateGroup.setdefault(lesson_date, []).append(booking)
 
-    # Generate HTML to display the month for the calander
-    monthHTML = c.formatmonthname(year, month, withyear=True)
-    # Generate HTML to display the days of the week for the calander
-    weekHTML = c.formatweekheader()
+    # The month heading and week header don't depend on the lessons so they are cached
+    monthHTML, weekHTML, _ = month_skeleton(year, month)
 
     # Generate calander with all the bookings
-    cal=''
-
-    # Generate and add each week to the calander at a time
-    # by iterating over each week of the month
-    for week in c.monthdays2calendar(year, month):
-        weeks = ''
-        # Iterate over each day of the week
-        for d, w in week:
-            # If the d=0, then it means that week is in a different month
-            # so it should appear as empty
-            if d == 0:
-                weeks+=f"<td></td>"
-            else:
-                l = ''
-                # Check if there are any lessons on that day
-                if date(year,month,d) in bookingDateGroup.keys():
-
-                    # Add a link to each booking with lessons on that day
-                    for booking in bookingDateGroup[date(year,month,d)]:
-                        # Get the url of the booking
-                        url = reverse('view_booking', args=[booking.id])
-
-                        # Display the times of each lesson
-                        # eg 1:00pm - 3:00pm
-                        start = datetime.combine(date.today(), booking.time)
-                        end = start + timedelta(minutes=booking.duration)
-                        time_string = start.strftime("%I:%M%p").lower() + ' - ' + end.strftime("%I:%m%p").lower()
-                        
-                        # Generate the cell for the day
-                        l += f'<div><a class="ms-3" href="{url}">{time_string}<a></div>'
-                
-                # If the date is today, display it bold.
-                if date(year,month,d) == date.today():
-                    weeks+=f"<td><div class='fw-bold'>{d}</div>{l}</td>"
-                else:
-                    weeks+=f"<td><div>{d}</div>{l}</td>"
-        
-        # Add each week as a row to the calander
-        cal += f'<tr> {weeks} </tr>\n'
+    cal = render_month_rows(year, month, bookingDateGroup)
+
+    # Link to a feed of the lessons which calendar apps can subscribe to
+    feed_url = request.build_absolute_uri(reverse('calendar_feed', args=[feed_token(request.user)]))
+
+    return render(request,'schedule.html', {'month':monthHTML,'week': weekHTML, 'table': cal,'previous_month':previous_month,'next_month':next_month, 'feed_url': feed_url})
+
+# Calendar apps poll feeds often, so the state of the feed is only looked up once per request.
+# There's no Last-Modified header, as deleting a booking doesn't change when the others were last changed
+def calendar_feed_user_id(request, token):
+    if not hasattr(request, 'calendar_feed_user_id'):
+        request.calendar_feed_user_id = feed_user_id(token)
+    return request.calendar_feed_user_id
+
+def calendar_feed_state(request, token):
+    if not hasattr(request, 'calendar_feed_state'):
+        user_id = calendar_feed_user_id(request, token)
+        request.calendar_feed_state = feed_state(user_id) if user_id is not None else None
+    return request.calendar_feed_state
+
+def calendar_feed_etag(request, token):
+    state = calendar_feed_state(request, token)
+    if state is None:
+        return None
+    last_modified = state['last_modified'].timestamp() if state['last_modified'] else 0
+    return f"{state['count']}-{state['last_id'] or 0}-{last_modified}"
+
+# iCalendar feed of a teacher's / student's lessons
+# The url contains a signed token instead of needing a log in, as calendar apps can't log in
+@require_GET
+@condition(etag_func=calendar_feed_etag)
+def calendar_feed(request, token):
+    user_id = calendar_feed_user_id(request, token)
+    if user_id is None:
+        raise Http404('Unknown calendar')
+
+    def booking_url(booking):
+        return request.build_absolute_uri(reverse('view_booking', args=[booking.id]))
+
+    feed = render_feed(user_id, request.get_host(), booking_url)
+    response = HttpResponse(feed, content_type='text/calendar; charset=utf-8')
+    response['Content-Disposition'] = 'inline; filename="lessons.ics"'
+    return response
+
+# Replaces the link to the user's calendar feed, for when it has been shared with someone it shouldn't have been
+@allowed_roles([User.STUDENT, User.TEACHER])
+@require_POST
+def reset_calendar_feed(request):
+    reset_feed_secret(request.user)
+    messages.add_message(request, messages.SUCCESS, "Your calendar link has been replaced, the old link no longer works")
+    return redirect('schedule')
+
+""" Page used by teachers to say when they can teach in a usual week, and on dates which are different"""
+@allowed_roles([User.TEACHER])
+def availability(request):
+    hours = TeacherAvailability.objects.filter(teacher=request.user).first()
+    week = slots_from_bytes(hours.week) if hours else DEFAULT_WEEK
+    weekly_form = WeeklyAvailabilityForm(week=week)
+    exception_form = AvailabilityExceptionForm()
 
-    return render(request,'schedule.html', {'month':monthHTML,'week': weekHTML, 'table': cal,'previous_month':previous_month,'next_month':next_month})
+    if request.method == 'POST':
+        if 'weekly' in request.POST:
+            weekly_form = WeeklyAvailabilityForm(request.POST, week=week)
+            if weekly_form.is_valid():
+                TeacherAvailability.objects.update_or_create(teacher=request.user,
+                    defaults={'week': slots_to_bytes(weekly_form.get_week(), WEEK_BYTES)})
+                messages.add_message(request, messages.SUCCESS, "Teaching hours saved")
+                return redirect('availability')
+        elif 'exception' in request.POST:
+            exception_form = AvailabilityExceptionForm(request.POST)
+            if exception_form.is_valid():
+                AvailabilityException.objects.update_or_create(teacher=request.user, date=exception_form.cleaned_data['date'],
+                    defaults={'slots': slots_to_bytes(exception_form.cleaned_data['times'], DAY_BYTES)})
+                messages.add_message(request, messages.SUCCESS, "Change of hours saved")
+                return redirect('availability')
+        elif 'delete_exception' in request.POST:
+            AvailabilityException.objects.filter(teacher=request.user, id=request.POST.get('id')).delete()
+            return redirect('availability')
+
+    exceptions = [(exception, format_windows(slots_from_bytes(exception.slots)))
+        for exception in request.user.availability_exceptions.filter(date__gte=date.today()).order_by('date')]
+    return render(request, 'availability.html', {'weekly_form': weekly_form, 'exception_form': exception_form, 'exceptions': exceptions})
 
 """ Page used by students to request lessons"""
 @allowed_roles([User.STUDENT])
@@ -212,6 +270,7 @@ def edit_request(request,id):
 
 """ View used for users to view all their bookings and requests """
 @allowed_roles([User.STUDENT])
+@cache_per_user('booking', 'request', 'child', 'invoice', 'transfer', 'user')
 def list_lessons(request):
     if request.method == 'POST':
         if 'id' in request.POST and request.POST['id'].isnumeric() and Request.objects.filter(id=request.POST['id']).exists():
@@ -219,23 +278,43 @@ def list_lessons(request):
             if not delete_request.fulfilled and delete_request.client == request.user:
                 delete_request.delete()
     return render(request, 'list_lessons.html',
-        {'bookings': Booking.objects.filter(client = request.user),
-        'active_requests': Request.objects.filter(client = request.user, fulfilled=False),
-        'fulfilled_requests': Request.objects.filter(client = request.user, fulfilled=True)
+        {'bookings': Booking.objects.filter(client = request.user).select_related('child', 'teacher').with_invoice(),
+        'active_requests': Request.objects.filter(client = request.user, fulfilled=False).select_related('child'),
+        'fulfilled_requests': Request.objects.filter(client = request.user, fulfilled=True).select_related('child')
     })
 
 """ View used for admins to manage all lessons and requests """
 @allowed_roles([User.DIRECTOR, User.SUPER_ADMIN, User.ADMIN])
 def manage_lessons(request):
+    bookings = Booking.objects.select_related('client', 'child', 'teacher').with_invoice()
+    requests = Request.objects.select_related('client', 'child')
+
+    # Invalid filters are ignored, the form displays their errors
+    form = LessonFilterForm(request.GET)
+    if form.is_valid():
+        bookings = form.filter_bookings(bookings)
+        requests = form.filter_requests(requests)
+        page_size = form.get_page_size()
+    else:
+        page_size = LessonFilterForm.DEFAULT_PAGE_SIZE
+
+    # Each tab is paged separately
+    bookings = KeysetPage(bookings, request, 'bookings', page_size)
+    active_requests = KeysetPage(requests.filter(fulfilled=False), request, 'requests', page_size)
+    fulfilled_requests = KeysetPage(requests.filter(fulfilled=True), request, 'archive', page_size)
+
     return render(request, 'manage_lessons.html',
-        {'bookings': Booking.objects.all(),
-        'active_requests': Request.objects.filter(fulfilled=False),
-        'fulfilled_requests': Request.objects.filter(fulfilled=True),
+        {'bookings': bookings,
+        'active_requests': active_requests,
+        'fulfilled_requests': fulfilled_requests,
+        'form': form,
+        'active_tab': request.GET.get('tab', 'requests'),
         'manage': True
     })
 
 """ A view which displays a booking"""
 @allowed_roles([User.STUDENT, User.TEACHER])
+@cache_per_user('booking', 'child', 'invoice', 'transfer', 'user')
 def view_booking(request,id):
     booking = Booking.objects.filter(id=id).first()
 
@@ -300,31 +379,26 @@ def book_lesson(request, id, **kwargs):
                         messages.add_message(request, messages.WARNING,
                             f"Pricing for booking has increased by £{invoice_price-invoice.amount:.2f} from £{invoice.amount:.2f} to £{invoice_price:.2f} ")
                         invoice.amount = invoice_price
-                        invoice.save()
+                        invoice.save(update_fields=['amount'])
 
                     # Price has decreased
                     else:# invoice.amount > invoice_price
                         messages.add_message(request, messages.WARNING,
                             f"Pricing for booking has decreased by £{invoice.amount-invoice_price:.2f} from £{invoice.amount:.2f} to £{invoice_price:.2f} ")
 
-                        invoice.amount=invoice_price
-                        invoice.save()
-
-                        invoice.net_paid()
                         refund_amount = invoice.net_paid()-invoice_price
 
                         messages.add_message(request, messages.WARNING,
                             f"Client currently paid £{invoice.net_paid():.2f} of the invoice")
 
-                        if (refund_amount>0):
-                            Transfer.objects.create(
-                                invoice =invoice,
-                                date = datetime.today(),
-                                amount = refund_amount,
-                                refund = True
-                            )
+                        with transaction.atomic():
+                            invoice.amount=invoice_price
+                            invoice.save(update_fields=['amount'])
 
-                            messages.add_message(request, messages.WARNING, f"Client has been given a refund of £{refund_amount:.2f}")
+                            if (refund_amount>0):
+                                # The refund is made by a worker, off the request
+                                enqueue(refund_overpayment, dedup_key=f'refund_overpayment:{invoice.id}', invoice_id=invoice.id)
+                                messages.add_message(request, messages.WARNING, f"Client will be given a refund of £{refund_amount:.2f}")
         else:
             form = BookingForm(instance=booking, user=booking.client)
         return render(request, 'book_lesson.html', {'form': form,'edit':True})
@@ -360,26 +434,14 @@ def book_lesson(request, id, **kwargs):
         # the booking form
         form.instance.client = client
         if form.is_valid():
-            # Creates the booking
-            thisBooking = form.save()
-
-            # Creates the invoice
-            invoice = Invoice(
-                booking = thisBooking,
-                invoice_ref = thisBooking.invoice_reference(),
-                date = datetime.today(),
-                due_by_date = thisBooking.date,
-                amount = thisBooking.calculate_price(),
-                refund = False
-            )
-            invoice.save()
-
-
-            if formtype == 'req':
-                # Set the request as fulfilled
-                req.fulfilled = True
-                req.save()
-            return redirect('manage_lessons')
+            # Creates the booking and its invoice, and sets the request as fulfilled, all or nothing
+            try:
+                book(form.instance, req if formtype == 'req' else None)
+            except ValidationError as error:
+                # Another admin booked the request or the teacher since the form was checked
+                form.add_error(None, error)
+            else:
+                return redirect('manage_lessons')
 
     if formtype == "user":
         return render(request, 'book_lesson.html', {'form': form, 'client':  client})
@@ -387,6 +449,64 @@ def book_lesson(request, id, **kwargs):
         return render(request, 'book_lesson.html', {'form': form, 'src_request': req, 'client' : client})
 
 
+""" View for admins to match all the open requests with teachers and lesson times at once, and book the matches they accept"""
+@allowed_roles([User.DIRECTOR, User.SUPER_ADMIN, User.ADMIN])
+def match_requests(request):
+    if request.method == 'POST':
+        bookings, skipped = book_matches(request.POST.getlist('match'))
+        messages.add_message(request, messages.SUCCESS, f"Booked {len(bookings)} lessons")
+        if skipped:
+            messages.add_message(request, messages.WARNING,
+                f"{len(skipped)} requests were not booked, as they have been booked already or now clash with another lesson")
+        return redirect('manage_lessons')
+
+    form = MatchRequestsForm(request.GET) if 'term' in request.GET else MatchRequestsForm()
+    proposal = propose_matches(form.cleaned_data['term']) if form.is_bound and form.is_valid() else None
+    return render(request, 'match_requests.html', {'form': form, 'proposal': proposal})
+
+""" View for admins to roll the bookings of one term over into a later term, and book the ones they accept"""
+@allowed_roles([User.DIRECTOR, User.SUPER_ADMIN, User.ADMIN])
+def rollover_term(request):
+    if request.method == 'POST':
+        form = RolloverForm(request.POST)
+        if form.is_valid():
+            booking_ids = [int(id) for id in request.POST.getlist('booking') if id.isdigit()]
+            bookings, problems = roll_over(form.cleaned_data['from_term'], form.cleaned_data['to_term'], booking_ids)
+            messages.add_message(request, messages.SUCCESS, f"Booked {len(bookings)} bookings into {form.cleaned_data['to_term'].name}")
+            if problems:
+                messages.add_message(request, messages.WARNING,
+                    f"{len(problems)} bookings were not rolled over, as they have been booked already or now clash with another lesson")
+            return redirect('manage_lessons')
+    else:
+        form = RolloverForm(request.GET) if 'from_term' in request.GET else RolloverForm()
+
+    proposal = None
+    if form.is_bound and form.is_valid():
+        proposal = propose_rollover(form.cleaned_data['from_term'], form.cleaned_data['to_term'])
+    return render(request, 'rollover_term.html', {'form': form, 'proposal': proposal})
+
+""" View for admins to find the teachers who are free for lessons, and when else they are free"""
+@allowed_roles([User.DIRECTOR, User.SUPER_ADMIN, User.ADMIN])
+def free_teachers(request):
+    form = FreeTeachersForm(request.GET or None)
+    teachers = None
+    if form.is_valid():
+        lessons = dict(
+            weekday=form.cleaned_data['day_of_week'],
+            lessons=form.cleaned_data['lessons'],
+            from_date=form.cleaned_data['start_date'],
+            days_between_lessons=form.cleaned_data['days_between_lessons'],
+        )
+        dates = lesson_dates(**lessons)
+        timetable = Timetable.load(dates[0], dates[-1])
+        free = set(timetable.free_teachers(start=form.cleaned_data['time'], duration=form.cleaned_data['duration'], **lessons))
+        # Every teacher is listed with the times they are free for all the lessons, those free at the time asked for first
+        teachers = sorted(
+            ((teacher, teacher.id in free, format_windows(timetable.free_on_all(teacher.id, dates)))
+                for teacher in User.objects.filter(pk__in=timetable.teacher_ids)),
+            key=lambda row: (not row[1], row[0].last_name, row[0].first_name))
+    return render(request, 'free_teachers.html', {'form': form, 'teachers': teachers})
+
 """ Page used by students to record their payments"""
 @allowed_roles([User.STUDENT])
 def payments(request):
@@ -397,12 +517,16 @@ def payments(request):
 
             # Create the transfer from the form
             get_invoice=form.cleaned_data.get('invoice')
-            Transfer.objects.create(
-                invoice=get_invoice,
-                amount=form.cleaned_data.get('amount'),
-                date=form.cleaned_data.get('date'),
-                refund=False
-            )
+            with transaction.atomic():
+                Transfer.objects.create(
+                    invoice=get_invoice,
+                    amount=form.cleaned_data.get('amount'),
+                    date=form.cleaned_data.get('date'),
+                    refund=False
+                )
+                if get_invoice.net_paid() > get_invoice.amount:
+                    # The refund is made by a worker, off the request
+                    enqueue(refund_overpayment, dedup_key=f'refund_overpayment:{get_invoice.id}', invoice_id=get_invoice.id)
             messages.add_message(request, messages.SUCCESS, "Transfer added successfully")
 
             if (get_invoice.net_paid() < get_invoice.amount):
@@ -412,27 +536,37 @@ def payments(request):
                 # Tell user they have fully paid
                 messages.add_message(request, messages.SUCCESS, "This invoice has now been fully paid")
             else: #(get_invoice.net_paid() >= get_invoice.amount):
-                # Tell user they have overpaid
-
-                # Work out how much needs to be refunded and give them a refund
+                # Tell user they have overpaid and will be refunded
                 refund_amount = get_invoice.net_paid() - get_invoice.amount
-                Transfer.objects.create(
-                    invoice=get_invoice,
-                    amount=refund_amount,
-                    date=datetime.today(),
-                    refund=True
-                )
-                messages.add_message(request, messages.SUCCESS, f"You have overpaid by £{refund_amount:.2f} and you have been refunded this amount")
+                messages.add_message(request, messages.SUCCESS, f"You have overpaid by £{refund_amount:.2f} and you will be refunded this amount")
     else:
         form = TransferForm(user=request.user)
-    return render(request, 'payments.html', {'form': form,'transfers': request.user.transfers(), 'invoices': request.user.invoices()})
+    balance = User.objects.with_balances().get(pk=request.user.pk)
+    return render(request, 'payments.html', {'form': form,'transfers': request.user.transfers().select_related('invoice'), 'invoices': request.user.invoices(), 'balance': balance})
 
 """ View for admins to see billing information, such as the balance of each student"""
 @allowed_roles([User.DIRECTOR, User.SUPER_ADMIN, User.ADMIN])
 def billing(request):
-    return render(request, 'billing.html', {'students': User.objects.filter(role=User.STUDENT), 'invoices': Invoice.objects.all(),'transfers': Transfer.objects.all()})
+    return render(request, 'billing.html', {'students': User.objects.students().with_balances(), 'invoices': Invoice.objects.select_related('booking__client'),'transfers': Transfer.objects.select_related('invoice'), 'export_form': ExportFilterForm()})
+
+""" CSV export of invoices, transfers or student balances for finance staff, optionally limited to a date range or term"""
+@allowed_roles([User.DIRECTOR, User.SUPER_ADMIN, User.ADMIN])
+def export_billing(request, kind):
+    form = ExportFilterForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(form.errors.as_text())
+
+    start_date, end_date = form.get_date_range()
+    header, rows = EXPORTS[kind](start_date, end_date)
+
+    # Stream the rows as they are read rather than building the whole file in memory
+    response = StreamingHttpResponse(csv_lines(header, rows), content_type='text/csv')
+    dates = '_'.join(f'{day:%Y-%m-%d}' for day in (start_date, end_date) if day)
+    response['Content-Disposition'] = f'attachment; filename="{kind}{"_" + dates if dates else ""}.csv"'
+    return response
     
 @allowed_roles([User.STUDENT,User.ADMIN,User.SUPER_ADMIN,User.DIRECTOR])
+@cache_per_user('booking', 'invoice', 'transfer', 'user')
 def invoice(request, id):
     if not Invoice.objects.filter(id=id).exists():
         return HttpResponse('Invoice not found')
@@ -463,16 +597,59 @@ def children(request):
 """ Page for super admins to change user permissions """
 @allowed_roles([User.DIRECTOR, User.SUPER_ADMIN])
 def permissions(request):
-    allowed_roles = [User.SUPER_ADMIN, User.ADMIN, User.TEACHER, User.STUDENT]
-
     if request.method == 'POST':
-        user = User.objects.filter(id=request.POST['id']).first()
-        if user and request.POST['role'] in allowed_roles:
-            user.role = request.POST['role']
-            user.save()
+        # The role of a single user is being changed
+        if request.POST.get('id', '').isnumeric() and request.POST.get('role') in ASSIGNABLE_ROLES:
+            update_roles({int(request.POST['id']): request.POST['role']})
 
+    # Invalid filters are ignored, the form displays their errors
+    form = UserFilterForm(request.GET)
     users = User.objects.all()
-    return render(request, 'permissions.html', {'users': users, 'choices': User.ROLE_CHOICES, 'allowed_roles' : allowed_roles})
+    if form.is_valid():
+        users = form.filter_users(users)
+        page_size = form.get_page_size()
+    else:
+        page_size = UserFilterForm.DEFAULT_PAGE_SIZE
+
+    return render(request, 'permissions.html', {
+        'users': KeysetPage(users, request, 'users', page_size),
+        'form': form,
+        'bulk_form': BulkRoleForm(),
+        'choices': User.ROLE_CHOICES,
+        'allowed_roles': ASSIGNABLE_ROLES
+    })
+
+"""
+Change the roles of many users at once
+
+Takes lines of "id,role" and/or a CSV file from the form on the permissions page,
+or a JSON body of [id, role] pairs, eg {"roles": [[12, "TEACHER"], [13, "ADMIN"]]}
+"""
+@allowed_roles([User.DIRECTOR, User.SUPER_ADMIN])
+@require_POST
+def bulk_permissions(request):
+    if request.content_type == 'application/json':
+        try:
+            pairs = json.loads(request.body)['roles']
+            roles, errors = parse_role_changes(pairs)
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'errors': ['Expected {"roles": [[id, role], ...]}']}, status=400)
+        if errors:
+            return JsonResponse({'errors': errors}, status=400)
+        updated, skipped = update_roles(roles)
+        return JsonResponse({'updated': updated, 'skipped': skipped})
+
+    form = BulkRoleForm(request.POST, request.FILES)
+    if form.is_valid():
+        updated, skipped = update_roles(form.cleaned_data['role_changes'])
+        messages.add_message(request, messages.SUCCESS, f'Updated the role of {updated} user{"" if updated == 1 else "s"}')
+        if skipped:
+            messages.add_message(request, messages.WARNING, f'These users were not found: {", ".join(map(str, skipped))}')
+    else:
+        for error in form.errors.values():
+            for message in error:
+                messages.add_message(request, messages.ERROR, message)
+    return redirect('permissions')
 
 """Page used to create or edit a user"""
 @allowed_roles([User.DIRECTOR, User.SUPER_ADMIN])
@@ -507,6 +684,7 @@ def user(request,id):
 
 """Page used to create and view terms"""
 @allowed_roles([User.DIRECTOR, User.SUPER_ADMIN, User.ADMIN])
+@cache_per_user('term')
 def terms(request):
     form = TermForm()
     if request.method == 'POST':